@@ -1,98 +1,323 @@
 import os
 from collections import defaultdict 
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Tuple
 from pymongo.database import Database as DB
-from app.core.chunker import metta_ast_parser, preprocess, utils
-from app.db.db import insert_chunks, clear_symbols_index
+from app.core.chunker import metta_ast_parser, packing, preprocess, utils
+from app.core.chunker.sizing import SizeFn, char_size
+from app.db.db import insert_chunks
 from loguru import logger
 
-def getSize(node: metta_ast_parser.SyntaxNode) -> int:
-    """Gets the size of a node based on its source text length."""
-    start, end = node.src_range
-    return end - start
+def symbol_pieces(codes: List[Tuple[str, str]], max_size: int, size: SizeFn = char_size) -> List[packing.Piece]:
+    """
+    Turn the (code, rel_path) entries of one symbol into pieces of at most max_size (measured by size).
+    A symbol that fits stays a single piece, so its defs, types and asserts end
+    up in the same chunk. Larger symbols are cut between entries, keeping their
+    order, and a single entry larger than max_size is split along its syntax tree.
+    """
+    pieces = []
+    chunk, rel_paths, chunk_size = [], set(), 0
+    separator = size("\n")
+    for code, rel_path in codes:
+        code_size = size(code)
+        if code_size > max_size:
+            if chunk:
+                pieces.append(("\n".join(chunk), rel_paths))
+                chunk, rel_paths, chunk_size = [], set(), 0
+            # an entry can be comments followed by the form, so split every top-level node
+            for node in metta_ast_parser.parse(code):
+                pieces.extend((sub_chunk, {rel_path}) for sub_chunk in ChunkCodeRecursively(node, code, max_size, size))
+            continue
 
-async def ChunkPreprocessedCode(potential_chunks: List[List[str]], max_size: int) -> List[Dict[str, Any]]:
-    """Chunks a list of potential chunks based on max_size.
-    Each potential chunk is a list of text_node table IDs from our db.
-    Returns a list of chunked code strings.
+        # plus the newline joining it to the previous entry
+        new_size = chunk_size + separator + code_size if chunk else code_size
+        if new_size > max_size:
+            pieces.append(("\n".join(chunk), rel_paths))
+            chunk, rel_paths, new_size = [], set(), code_size
+        chunk.append(code)
+        rel_paths.add(rel_path)
+        chunk_size = new_size
+
+    if chunk:
+        pieces.append(("\n".join(chunk), rel_paths))
+    return pieces
+
+def colocate_callees(owners: List[str], sizes: List[int], call_graph: Dict[str, List[str]], max_size: int,
+                     separator: int = 1) -> List[List[int]]:
     """
-    # chunk, rel_path 
-    chunks = []
+    Group piece indices so small callees sit next to a caller.
+    owners[i] is the symbol of piece i. A callee whose symbol is a single piece
+    of at most a quarter of max_size joins the group of its first caller (in
+    symbol order) when the group still fits max_size; a callee's own attached
+    callees come along. Every piece is in exactly one group, in caller-then-callee
+    order. Groups are ordered by their first piece.
+    """
+    pieces_of: Dict[str, List[int]] = defaultdict(list)
+    for i, owner in enumerate(owners):
+        pieces_of[owner].append(i)
 
-    for codes in potential_chunks:
-        chunk, rel_paths, chunk_size = [], set(), 0
-        for code, rel_path in codes:
-            text_node = code
-            text_size = len(code)
-            
-            # when single text node is larger than max_size
-            if text_size > max_size:
-                if chunk:
-                    chunks.append(["\n".join(chunk), rel_paths])
-                    chunk, rel_paths, chunk_size = [], set(), 0
-                # recursively split this big single node
-                nodes = metta_ast_parser.parse(text_node)[0]
-                subChunks = ChunkCodeRecursively(nodes, text_node, max_size)
-                if subChunks:
-                    chunks.extend([[subChunk, {rel_path}] for subChunk in subChunks])
-
-            # when adding this text node exceeds max_size
-            elif chunk_size + text_size > max_size:
-                if chunk:
-                    chunks.append(["\n".join(chunk), rel_paths])
-                chunk, rel_paths, chunk_size = [], set(), 0
-            else:
-                chunk.append(text_node)
-                rel_paths.add(rel_path)
-                chunk_size += text_size
+    # group id = index of the piece that anchors it
+    group_of = list(range(len(owners)))
+    groups: Dict[int, List[int]] = {i: [i] for i in range(len(owners))}
+    group_size: Dict[int, int] = dict(enumerate(sizes))
+
+    for caller in pieces_of:
+        for callee in call_graph.get(caller, ()):
+            callee_pieces = pieces_of.get(callee, ())
+            if len(callee_pieces) != 1 or sizes[callee_pieces[0]] > max_size // 4:
+                continue
+            anchor, g = group_of[pieces_of[caller][-1]], callee_pieces[0]
+            # the callee must still anchor its own group, i.e. not be placed yet
+            if g == anchor or group_of[g] != g:
+                continue
+            if group_size[anchor] + separator + group_size[g] > max_size:
+                continue
+            for i in groups[g]:
+                group_of[i] = anchor
+            groups[anchor].extend(groups.pop(g))
+            group_size[anchor] += separator + group_size.pop(g)
+
+    return sorted(groups.values(), key=min)
 
-        if chunk:
-            chunks.append(["\n".join(chunk), rel_paths])
+async def ChunkPreprocessedCode(potential_chunks: List[List[Tuple[str, str]]], max_size: int,
+                                size: SizeFn = char_size, symbols: Optional[List[str]] = None,
+                                call_graph: Optional[Dict[str, List[str]]] = None,
+                                colocate_calls: bool = False) -> List[Dict[str, Any]]:
+    """Chunks a list of potential chunks based on max_size, in the unit `size` measures
+    (characters by default, or embedding tokens with a sizing.TokenSizer).
+    Each potential chunk is the list of (code, rel_path) entries of one symbol.
+    Symbols are cut into pieces (see symbol_pieces) which are then bin-packed
+    into chunks of at most max_size, so small symbols of a file share a chunk
+    instead of each producing an underfilled one. No code is dropped.
+    symbols names the symbol of each potential chunk; with a call_graph
+    (SymbolIndex.call_graph) every chunk records its symbols and the symbols
+    they call / are called by outside the chunk, and colocate_calls=True first
+    groups small callees with their callers (see colocate_callees).
+    Returns a list of chunk documents.
+    """
+    pieces: List[packing.Piece] = []
+    owners: List[Optional[str]] = []
+    for n, codes in enumerate(potential_chunks):
+        for piece in symbol_pieces(codes, max_size, size):
+            if piece[0] != "":
+                pieces.append(piece)
+                owners.append(symbols[n] if symbols else None)
+
+    sizes = [size(text) for text, _ in pieces]
+    separator = size("\n")
+    if colocate_calls and call_graph and symbols:
+        groups = colocate_callees(owners, sizes, call_graph, max_size, separator)
+    else:
+        groups = [[i] for i in range(len(pieces))]
+    group_sizes = [sum(sizes[i] for i in members) + separator * (len(members) - 1) for members in groups]
+
+    # Pack per file (a group goes with the first path of its first piece, i.e. the
+    # caller's file), so a chunk never mixes unrelated files and an edit only
+    # invalidates chunks of that file and of the callees co-located with it.
+    by_file: Dict[str, List[int]] = defaultdict(list)
+    for g, members in enumerate(groups):
+        by_file[min(pieces[members[0]][1])].append(g)
+
+    called_by: Dict[str, List[str]] = defaultdict(list)
+    for caller, callees in (call_graph or {}).items():
+        for callee in callees:
+            called_by[callee].append(caller)
+
+    chunks = []
+    for rel_path in sorted(by_file):
+        file_groups = by_file[rel_path]
+        for packed in packing.pack_indices([group_sizes[g] for g in file_groups], max_size, separator):
+            members = [i for b in packed for i in groups[file_groups[b]]]
+            rel_paths = set().union(*(pieces[i][1] for i in members))
+            text = "\n".join(pieces[i][0] for i in members)
+            links = {}
+            if call_graph is not None and symbols:
+                chunk_symbols = list(dict.fromkeys(owners[i] for i in members))
+                inside = set(chunk_symbols)
+                links = {
+                    "symbols": chunk_symbols,
+                    "calls": sorted({c for s in chunk_symbols for c in call_graph.get(s, ())} - inside),
+                    "called_by": sorted({c for s in chunk_symbols for c in called_by.get(s, ())} - inside),
+                }
+            # sorted so a chunk spanning several files gets the same chunkId on every run
+            chunks.append(utils._build_chunk_doc(text, sorted(rel_paths), **links))
 
-    chunks = [ utils._build_chunk_doc(chunk, list(rel_paths)) for chunk, rel_paths in chunks if chunk != ""]
+    logger.info(
+        f"Packed {len(pieces)} pieces into {len(chunks)} chunks "
+        f"(fill ratio {packing.fill_ratio(chunks, max_size, size):.2f})"
+    )
     return chunks
 
-async def ChunkCode(repo_files: defaultdict, max_size: int, db: DB) -> List[Dict[str, Any]]:
+async def ChunkCode(repo_files: defaultdict, max_size: int, db: DB, persist_symbols: bool = False,
+                    workers: int = 1, store: bool = True,
+                    sources: Optional[Dict[str, bytes]] = None, size: SizeFn = char_size,
+                    colocate_calls: bool = False) -> List[Dict[str, Any]]:
     """
     Chunks the code into smaller pieces based on the max_size.
-    Stores the chunks in the database.
+    Stores the chunks in the database unless store=False.
+    sources: rel_path -> file bytes already in memory (see preprocess_code).
+    colocate_calls: keep small callees in their caller's chunk (see colocate_callees).
     """
     
-    potential_chunks = await preprocess.preprocess_code(repo_files, db)
-    chunks = await ChunkPreprocessedCode(potential_chunks, max_size)
-    ids = await insert_chunks(chunks, db)
+    index = await preprocess.build_symbol_index(repo_files, db, persist_symbols, workers, sources)
+    chunks = await ChunkPreprocessedCode(index.potential_chunks(), max_size, size, symbols=list(index),
+                                         call_graph=index.call_graph(), colocate_calls=colocate_calls)
+    if store:
+        result = await insert_chunks(chunks, db)
+        logger.info(f"Inserted {result['inserted']} chunks, skipped {result['duplicates']} duplicates")
     return chunks
 
-def ChunkCodeRecursively(node: metta_ast_parser.SyntaxNode, text: str, max_size: int) -> list[str]:
-    """Recursively chunks a potential chunk (syntax node) when it exceeds max_size."""
-    if getSize(node) <= max_size:
-        st, en = node.src_range
-        return [text[st:en]]
+class _SpanChunk:
+    """A chunk under construction: a source span followed by the chunks merged
+    into it (a rope, so merging is O(1)), plus its size.
+    Live chunks form a linked list in document order."""
+    __slots__ = ("span", "merged", "size", "next")
 
-    # No children to recurse into, accept oversized node
-    if not node.sub_nodes:  
-        st, en = node.src_range
-        return [text[st:en]]
+    def __init__(self, span: Tuple[int, int], size: int) -> None:
+        self.span = span
+        self.merged: List["_SpanChunk"] = []
+        self.size = size
+        self.next: Optional["_SpanChunk"] = None
 
-    chunks = []
-    for sub_node in node.sub_nodes:
-        sub_chunks = ChunkCodeRecursively(sub_node, text, max_size)
-        length_sub_chunks,cnt = len(sub_chunks), 0
-        if chunks:
-            for idx in range(length_sub_chunks):
-                if len(chunks[-1]) + len(sub_chunks[idx]) > max_size:
+    def spans(self) -> List[Tuple[int, int]]:
+        spans, stack = [], [self]
+        while stack:
+            chunk = stack.pop()
+            spans.append(chunk.span)
+            stack.extend(reversed(chunk.merged))
+        return spans
+
+
+class _SplitFrame:
+    """A node whose sub-nodes are being chunked, with the first/last chunk produced so far."""
+    __slots__ = ("node", "child", "first", "last")
+
+    def __init__(self, node: metta_ast_parser.SyntaxNode) -> None:
+        self.node = node
+        self.child = 0
+        self.first: Optional[_SpanChunk] = None
+        self.last: Optional[_SpanChunk] = None
+
+
+class _SummedSize:
+    """
+    `size` of syntax nodes. Nodes of at most direct_limit characters (and
+    leaves) are measured directly; larger ones as the sum of their sub-nodes
+    and the gaps between them, computed bottom-up once per node.
+    """
+
+    def __init__(self, text: str, size: SizeFn, direct_limit: int) -> None:
+        self.text = text
+        self.size = size
+        self.direct_limit = direct_limit
+        self.sizes: Dict[Tuple[int, int], int] = {}
+
+    def __call__(self, node: metta_ast_parser.SyntaxNode) -> int:
+        key = (node.start, node.end)
+        if key in self.sizes:
+            return self.sizes[key]
+        if node.end - node.start <= self.direct_limit or not node.sub_nodes:
+            return self.size(self.text[node.start:node.end])
+
+        # post-order over the large nodes, so each is summed once from its sub-nodes
+        stack = [(node, False)]
+        while stack:
+            n, expanded = stack.pop()
+            n_key = (n.start, n.end)
+            if n_key in self.sizes:
+                continue
+            large = [s for s in n.sub_nodes if s.end - s.start > self.direct_limit and s.sub_nodes]
+            if not expanded and large:
+                stack.append((n, True))
+                stack.extend((s, False) for s in large)
+                continue
+            total, pos = 0, n.start
+            for sub_node in n.sub_nodes:
+                total += self.size(self.text[pos:sub_node.start])
+                sub_key = (sub_node.start, sub_node.end)
+                if sub_key in self.sizes:
+                    total += self.sizes[sub_key]
+                else:
+                    total += self.size(self.text[sub_node.start:sub_node.end])
+                pos = sub_node.end
+            total += self.size(self.text[pos:n.end])
+            self.sizes[n_key] = total
+        return self.sizes[key]
+
+
+def ChunkCodeRecursively(node: metta_ast_parser.SyntaxNode, text: str, max_size: int,
+                         size: SizeFn = char_size) -> list[str]:
+    """Recursively chunks a potential chunk (syntax node) when it exceeds max_size.
+
+    A node that fits (or has no sub-nodes) is one chunk. Otherwise its sub-nodes
+    are chunked in order, and the leading chunks of each sub-node are merged into
+    the chunk before them while the result still fits. Chunks are kept as
+    (start, end) spans and only joined into strings at the end, and the tree is
+    walked with an explicit stack, so the cost is linear in the node size and
+    nesting depth is unbounded.
+
+    With a size other than char_size, nodes longer than a few budgets of
+    characters are measured as the sum of their sub-nodes and the text between
+    them instead of being passed to `size` whole; every ancestor would otherwise
+    re-measure the same text. For tokenizers that split at whitespace and
+    brackets (the WordPiece embedding models) the sum is the exact count.
+    """
+    separator = size("\n")
+    if size is char_size:
+        measure = lambda n: n.end - n.start
+    else:
+        measure = _SummedSize(text, size, direct_limit=4 * max_size)
+
+    def leaf(n: metta_ast_parser.SyntaxNode) -> Optional[_SpanChunk]:
+        n_size = measure(n)
+        if n_size <= max_size or not n.sub_nodes:
+            return _SpanChunk((n.start, n.end), n_size)
+        return None
+
+    root = leaf(node)
+    if root is None:
+        stack = [_SplitFrame(node)]
+        while True:
+            frame = stack[-1]
+            if frame.child < len(frame.node.sub_nodes):
+                sub_node = frame.node.sub_nodes[frame.child]
+                frame.child += 1
+                chunk = leaf(sub_node)
+                if chunk is None:
+                    stack.append(_SplitFrame(sub_node))
+                    continue
+                first = last = chunk
+            else:
+                stack.pop()
+                if not stack:
+                    root = frame.first
                     break
+                first, last = frame.first, frame.last
+                frame = stack[-1]
+            if first is None:
+                continue
 
-                chunks[-1] += "\n" + sub_chunks[idx]
-                cnt += 1
+            # merge the leading chunks of the sub-node into the chunk before them
+            prev = frame.last
+            if prev is None:
+                frame.first = first
+            else:
+                while first is not None and prev.size + separator + first.size <= max_size:
+                    prev.merged.append(first)
+                    prev.size += separator + first.size
+                    first = first.next
+                prev.next = first
+            if first is not None:
+                frame.last = last
 
-            sub_chunks = sub_chunks[cnt:]
-        chunks.extend(sub_chunks)
+    chunks = []
+    while root is not None:
+        chunks.append("\n".join(text[st:en] for st, en in root.spans()))
+        root = root.next
     return chunks
 
 
-async def ast_based_chunker(index: Dict[str, str], db: DB, max_size: int = 1500) -> None:   
-    # Group files by repo (can adjust this by determining scope)
+def group_repo_files(index: Dict[str, str]) -> defaultdict:
+    """Group the hashed files of an ingest index by repo: repo -> [[rel_path, file_path], ...]."""
     data_dir = os.path.join(os.path.dirname(__file__), "../repo_ingestion/data")
     data_dir = os.path.abspath(data_dir)
 
@@ -100,11 +325,24 @@ async def ast_based_chunker(index: Dict[str, str], db: DB, max_size: int = 1500)
     for file_hash, rel_path in index.items():
         repo_name = rel_path.split('/')[0]
         repo_files[repo_name].append([rel_path, os.path.join(data_dir, f"{file_hash}.metta")])
+    return repo_files
+
+
+async def ast_based_chunker(index: Dict[str, str], db: DB, max_size: int = 1500, persist_symbols: bool = False,
+                            workers: int = 1, store: bool = True,
+                            sources: Optional[Dict[str, bytes]] = None,
+                            size: SizeFn = char_size, colocate_calls: bool = False) -> List[Dict[str, Any]]:
+    # Group files by repo (can adjust this by determining scope)
+    repo_files = group_repo_files(index)
+    # hash -> bytes as filled by store_metta_files; files missing here are read from the store
+    sources = {index[file_hash]: data for file_hash, data in (sources or {}).items() if file_hash in index}
 
     # pass the repo_files to chunk_code
-    await ChunkCode(repo_files, max_size, db)
-    # After all files in this repo are processed, reset symbol index
-    await clear_symbols_index(db)
+    # The symbol index lives in memory for the duration of this call,
+    # so there is nothing to reset afterwards.
+    chunks = await ChunkCode(repo_files, max_size, db, persist_symbols, workers, store, sources, size, colocate_calls)
 
-    logger.info("Chunks Stored in database")
+    if store:
+        logger.info("Chunks Stored in database")
     logger.info("Chunking complete!")
+    return chunks
@@ -1,5 +1,7 @@
+import codecs
+import re
 from enum import Enum, auto
-from typing import List, Optional, Tuple
+from typing import IO, Iterator, List, Optional, Sequence, Tuple, Union
 
 class SyntaxNodeType(Enum):
     Comment = auto()
@@ -22,25 +24,39 @@ class SyntaxNodeType(Enum):
         return self not in {SyntaxNodeType.ExpressionGroup, SyntaxNodeType.ErrorGroup}
 
 
+# Shared by every leaf node so tokens don't each allocate an empty list.
+_NO_CHILDREN: Tuple["SyntaxNode", ...] = ()
+
+
 class SyntaxNode:
+    """A node of the MeTTa syntax tree.
+
+    Nodes use `__slots__` and store their source span as two ints, so a parse
+    of a token-heavy file allocates one small object per node instead of an
+    object, a `__dict__` and a `range`.
+    """
+    __slots__ = ("node_type", "start", "end", "sub_nodes", "parsed_text", "message", "is_complete")
+
     def __init__(self,
                  node_type: SyntaxNodeType,
-                 src_range: range,
-                 sub_nodes: Optional[List["SyntaxNode"]] = None,
+                 start: int,
+                 end: int,
+                 sub_nodes: Optional[Sequence["SyntaxNode"]] = None,
                  parsed_text: Optional[str] = None,
                  message: Optional[str] = None,
                  is_complete: bool = True) -> None:
-        
+
         self.node_type = node_type
-        self.sub_nodes = sub_nodes or []
+        self.start = start
+        self.end = end
+        self.sub_nodes = sub_nodes or _NO_CHILDREN
         self.parsed_text = parsed_text
         self.message = message
         self.is_complete = is_complete
-        self.src_range_internal = src_range
 
     @property
     def src_range(self) -> Tuple[int, int]:
-        return (self.src_range_internal.start, self.src_range_internal.stop)
+        return (self.start, self.end)
     
     @property
     def node_type_str(self) -> str:
@@ -53,11 +69,11 @@ class SyntaxNode:
 
     @classmethod
     def new(cls, node_type: "SyntaxNodeType", src_range: range, sub_nodes: List["SyntaxNode"]) -> "SyntaxNode":
-        return cls(node_type, src_range, sub_nodes=sub_nodes)
+        return cls(node_type, src_range.start, src_range.stop, sub_nodes=sub_nodes)
 
     @classmethod
     def new_token_node(cls, node_type: "SyntaxNodeType", src_range: range, text: str) -> "SyntaxNode":
-        return cls(node_type, src_range, sub_nodes=[], parsed_text=text)
+        return cls(node_type, src_range.start, src_range.stop, parsed_text=text)
 
 
 class CharReader:
@@ -250,8 +266,213 @@ class SExprParser:
             self.skip_next()
         return SyntaxNode.new_token_node(SyntaxNodeType.VariableToken, range(start_idx, self.cur_idx()), "".join(text))
 
-def parse(code: str) -> List[SyntaxNode]:
-    parser = SExprParser(code)
+class IncompleteInputError(ValueError):
+    """Raised when the input ends in the middle of a form."""
+
+
+# Precompiled scanners for the index-based parser. `\s` matches exactly the
+# characters for which str.isspace() is true, so token boundaries are the same
+# as the ones CharReader produces.
+_WS_RE = re.compile(r"\s*")
+_WORD_RE = re.compile(r"[^\s();]*")
+# Error recovery resumes at a line that starts a new top-level form.
+_RESYNC_RE = re.compile(r"\n(?=[(!])")
+
+
+class _Frame:
+    """An expression (or pending `!` call) that is still being parsed."""
+    __slots__ = ("node_type", "start", "children")
+
+    def __init__(self, node_type: SyntaxNodeType, start: int, children: List["SyntaxNode"]) -> None:
+        self.node_type = node_type
+        self.start = start
+        self.children = children
+
+
+class IndexedSExprParser:
+    """Index-based parser that produces the same trees as `SExprParser`.
+
+    Instead of stepping through the source one character at a time it scans
+    the whole buffer with precompiled regexes and `str.find`, keeping the
+    cursor as a plain int. Nesting is handled with an explicit stack, so deeply
+    nested forms cannot hit the recursion limit.
+
+    With `recover=True` a malformed top-level form becomes an `ErrorGroup`
+    node and parsing resumes at the next top-level form instead of raising.
+    `final=False` marks the text as a prefix of a longer input, in which case
+    running out of input is still raised so the caller can read more.
+    """
+
+    def __init__(self, text: str, recover: bool = False, final: bool = True) -> None:
+        self.text = text
+        self.pos = 0
+        self.end = len(text)
+        self.recover = recover
+        self.final = final
+
+    def skip_whitespace(self) -> int:
+        self.pos = _WS_RE.match(self.text, self.pos).end()
+        return self.pos
+
+    def parse_to_syntax_tree(self) -> Optional["SyntaxNode"]:
+        if not self.recover:
+            return self._parse_form()
+
+        start_idx = self.skip_whitespace()
+        try:
+            return self._parse_form()
+        except ValueError as e:
+            if isinstance(e, IncompleteInputError) and not self.final:
+                raise
+            return self._error_group(start_idx, str(e))
+
+    def _error_group(self, start_idx: int, message: str) -> "SyntaxNode":
+        end_idx = self._resync_point(start_idx)
+        self.pos = end_idx
+        return SyntaxNode(SyntaxNodeType.ErrorGroup, start_idx, end_idx, message=message, is_complete=False)
+
+    def _resync_point(self, start_idx: int) -> int:
+        """Start of the next line that opens a top-level form, or the end of input."""
+        if self.text[start_idx] == ")":
+            return start_idx + 1
+        match = _RESYNC_RE.search(self.text, start_idx + 1)
+        return match.start() + 1 if match else self.end
+
+    def _parse_form(self) -> Optional["SyntaxNode"]:
+        """Parse the next top-level form without recursing into nested expressions.
+
+        Open expressions and pending `!` calls live on an explicit stack, so the
+        nesting depth is bounded by memory rather than the interpreter's
+        recursion limit.
+        """
+        text = self.text
+        stack: List[_Frame] = []
+
+        while True:
+            pos = self.skip_whitespace()
+
+            if not stack:
+                if pos >= self.end:
+                    return None
+                node = self._parse_next(stack)
+            else:
+                frame = stack[-1]
+                children = frame.children
+                if pos >= self.end:
+                    raise IncompleteInputError("Unclosed expression")
+
+                c = text[pos]
+                if c == ";":
+                    children.append(self.parse_comment())
+                    continue
+                elif c == ")":
+                    children.append(SyntaxNode(SyntaxNodeType.CloseParen, pos, pos + 1))
+                    self.pos = pos + 1
+                    stack.pop()
+                    node = SyntaxNode(frame.node_type, frame.start, self.pos, children)
+                elif c == ":" and len(children) == 1:
+                    self.pos = pos + 1
+                    children.append(SyntaxNode(SyntaxNodeType.WordToken, pos, pos + 1, parsed_text=":"))
+                    frame.node_type = SyntaxNodeType.TypeCheckGroup
+                    continue
+                elif c == "=" and len(children) == 1:
+                    self.pos = pos + 1
+                    nxt = self.skip_whitespace()
+                    if nxt < self.end and text[nxt] == "=":
+                        # It's a double equals, treat as function type
+                        children.append(SyntaxNode(SyntaxNodeType.WordToken, pos, pos + 2, parsed_text="=="))
+                        self.pos = nxt + 1
+                    else:
+                        # Single equals, treat as rule
+                        children.append(SyntaxNode(SyntaxNodeType.WordToken, pos, pos + 1, parsed_text="="))
+                        frame.node_type = SyntaxNodeType.RuleGroup
+                    continue
+                else:
+                    node = self._parse_next(stack)
+
+            # A finished node closes any `!` calls waiting on it, then becomes a
+            # child of the enclosing expression or is returned at top level.
+            while node is not None:
+                if not stack:
+                    return node
+                frame = stack[-1]
+                if frame.node_type is not SyntaxNodeType.CallGroup:
+                    frame.children.append(node)
+                    break
+                stack.pop()
+                frame.children.append(node)
+                node = SyntaxNode(SyntaxNodeType.CallGroup, frame.start, self.pos, frame.children)
+
+    def _parse_next(self, stack: List["_Frame"]) -> Optional["SyntaxNode"]:
+        """Parse a token at the cursor, or push a frame and return None for `(` and `!`."""
+        pos = self.pos
+        c = self.text[pos]
+        if c == "!":
+            bang_node = self.parse_word()
+            nxt = self.skip_whitespace()
+            if nxt >= self.end:
+                raise IncompleteInputError("Expected an expression after '!'")
+            if self.text[nxt] != "(":
+                raise ValueError("Expected an expression after '!'")
+            stack.append(_Frame(SyntaxNodeType.CallGroup, pos, [bang_node]))
+            self._open_expr(stack)
+            return None
+        elif c == ";":
+            return self.parse_comment()
+        elif c == "$":
+            return self.parse_variable()
+        elif c == "(":
+            self._open_expr(stack)
+            return None
+        elif c == ")":
+            raise ValueError("Unexpected ')' at top level")
+        elif c == '"':
+            return self.parse_string()
+        else:
+            return self.parse_word()
+
+    def _open_expr(self, stack: List["_Frame"]) -> None:
+        start_idx = self.pos
+        open_paren = SyntaxNode(SyntaxNodeType.OpenParen, start_idx, start_idx + 1)
+        stack.append(_Frame(SyntaxNodeType.ExpressionGroup, start_idx, [open_paren]))
+        self.pos = start_idx + 1
+
+    def parse_comment(self) -> "SyntaxNode":
+        start_idx = self.pos
+        stop = self.text.find("\n", start_idx + 1)
+        self.pos = self.end if stop == -1 else stop
+        return SyntaxNode(SyntaxNodeType.Comment, start_idx, self.pos)
+
+    def parse_string(self) -> "SyntaxNode":
+        start_idx = self.pos
+        close = self.text.find('"', start_idx + 1)
+        if close == -1:
+            self.pos = self.end
+            value = self.text[start_idx + 1:]
+        else:
+            self.pos = close + 1
+            value = self.text[start_idx + 1:close]
+        return SyntaxNode(SyntaxNodeType.StringToken, start_idx, self.pos, parsed_text=value)
+
+    def parse_word(self) -> "SyntaxNode":
+        start_idx = self.pos
+        self.pos = _WORD_RE.match(self.text, start_idx).end()
+        return SyntaxNode(SyntaxNodeType.WordToken, start_idx, self.pos, parsed_text=self.text[start_idx:self.pos])
+
+    def parse_variable(self) -> "SyntaxNode":
+        start_idx = self.pos
+        self.pos = _WORD_RE.match(self.text, start_idx + 1).end()
+        return SyntaxNode(SyntaxNodeType.VariableToken, start_idx, self.pos, parsed_text=self.text[start_idx + 1:self.pos])
+
+
+def parse(code: str, indexed: bool = True, recover: bool = False) -> List[SyntaxNode]:
+    """Parse `code` into its top-level syntax nodes.
+
+    `indexed=False` falls back to the character-by-character `SExprParser`.
+    `recover=True` turns malformed forms into `ErrorGroup` nodes instead of
+    raising (indexed parser only).
+    """
+    parser = IndexedSExprParser(code, recover=recover) if indexed else SExprParser(code)
     roots = []
     while True:
         node = parser.parse_to_syntax_tree()
@@ -260,4 +481,49 @@ def parse(code: str) -> List[SyntaxNode]:
         roots.append(node)
     return roots
 
-            
+
+def iter_parse(source: Union[str, IO], chunk_size: int = 1 << 16, recover: bool = False) -> Iterator[Tuple[SyntaxNode, str]]:
+    """Lazily yield `(node, text)` for each top-level form in `source`.
+
+    `source` may be a string, a text or binary file object, or an mmap (binary
+    input is decoded as UTF-8). File input is read `chunk_size` characters at a
+    time and only the unparsed tail is kept, so peak memory is bounded by the
+    largest form rather than the file. Node offsets index into the `text`
+    yielded alongside them, not into the whole file. `recover` is passed to
+    `IndexedSExprParser`.
+    """
+    if isinstance(source, str):
+        parser = IndexedSExprParser(source, recover=recover)
+        while (node := parser.parse_to_syntax_tree()) is not None:
+            yield node, source
+        return
+
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    window, eof = "", False
+    parser = IndexedSExprParser(window, recover=recover, final=False)
+
+    while True:
+        form_start = parser.pos
+        try:
+            node = parser.parse_to_syntax_tree()
+        except IncompleteInputError:
+            if eof:
+                raise
+            node = None
+
+        # A node touching the end of the window may still grow (a word, comment
+        # or string cut off mid-token), so it is re-parsed after the next read.
+        if node is not None and (eof or node.end < len(window)):
+            yield node, window
+            continue
+        if node is None and eof:
+            return
+
+        # Grow reads with the pending tail so a huge form is not re-parsed once per chunk.
+        pending = window[form_start:]
+        data = source.read(max(chunk_size, len(pending)))
+        eof = not data
+        if isinstance(data, (bytes, bytearray)):
+            data = decoder.decode(data, final=eof)
+        window = pending + data
+        parser = IndexedSExprParser(window, recover=recover, final=eof)
@@ -0,0 +1,52 @@
+from typing import Any, Dict, List, Sequence, Set, Tuple
+from app.core.chunker.sizing import SizeFn, char_size
+
+# (text, rel_paths) of a piece of code that must stay in one chunk
+Piece = Tuple[str, Set[str]]
+
+
+def pack_indices(sizes: Sequence[int], max_size: int, separator: int = 1) -> List[List[int]]:
+    """
+    Group item indices into as few bins of at most max_size as possible.
+    Items are placed largest first into the first bin with room (first-fit
+    decreasing, at most 11/9 of the optimal bin count). The separator joining
+    two items counts towards the size. Sizes are treated as additive, which is
+    exact for characters and close for word-piece tokens (the newline is free).
+    An item larger than max_size gets a bin of its own; no item is ever dropped.
+    Inside a bin indices are ascending, and bins are ordered by their smallest
+    index, so the output is deterministic.
+    """
+    if not sizes:
+        return []
+    order = sorted(range(len(sizes)), key=lambda i: -sizes[i])
+    smallest = sizes[order[-1]] + separator
+
+    bins: List[List[int]] = []
+    free: List[int] = []
+    # bins that can still take the smallest item, in creation order
+    open_bins: List[int] = []
+
+    for i in order:
+        need = sizes[i] + separator
+        for pos, b in enumerate(open_bins):
+            if free[b] >= need:
+                bins[b].append(i)
+                free[b] -= need
+                if free[b] < smallest:
+                    del open_bins[pos]
+                break
+        else:
+            bins.append([i])
+            free.append(max_size - sizes[i])
+            if free[-1] >= smallest:
+                open_bins.append(len(bins) - 1)
+
+    return sorted((sorted(b) for b in bins), key=lambda b: b[0])
+
+
+def fill_ratio(chunks: Sequence[Dict[str, Any]], max_size: int, size: SizeFn = char_size) -> float:
+    """Share of the max_size budget the chunks actually use (1.0 = every chunk full)."""
+    if not chunks:
+        return 0.0
+    used = sum(min(size(chunk["chunk"]), max_size) for chunk in chunks)
+    return used / (len(chunks) * max_size)
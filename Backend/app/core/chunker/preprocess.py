@@ -1,52 +1,126 @@
+import asyncio
+import multiprocessing
 import re
 from collections import defaultdict
-from typing import Any, Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from typing import IO, Any, Dict, List, Optional, Tuple, Union
 from pymongo.database import Database
 from app.core.chunker import metta_ast_parser 
-from app.db.db import get_all_symbols, upsert_symbol
+from app.core.chunker.symbol_index import SymbolIndex
+from app.db.db import replace_symbols_index
 from loguru import logger
 
-# take the src code return the potential chunks retrieved from the symbol index table
-async def preprocess_code(repo_files: defaultdict, db: Database) -> List[List[str]]:
+# take the src code return the potential chunks retrieved from the symbol index
+async def preprocess_code(repo_files: defaultdict, db: Database, persist_symbols: bool = False,
+                          workers: int = 1, sources: Optional[Dict[str, bytes]] = None) -> List[List[str]]:
+    """Parse every file (see build_symbol_index) and return the index's potential chunks."""
+    index = await build_symbol_index(repo_files, db, persist_symbols, workers, sources)
+    return index.potential_chunks()
+
+async def build_symbol_index(repo_files: defaultdict, db: Database, persist_symbols: bool = False,
+                             workers: int = 1, sources: Optional[Dict[str, bytes]] = None) -> SymbolIndex:
+    """
+    Parse every file into an in-memory SymbolIndex, off the event loop: with
+    workers > 1 in a process pool, otherwise one after another in a thread.
+    Per-file indexes are merged in input order, so the result is the same
+    either way.
+    With persist_symbols=True the index is also written to the `symbols`
+    collection in a single bulk_write (for inspection; chunking never reads it back).
+    sources maps rel_path -> file bytes already read during ingest; those files
+    are parsed from memory instead of being opened again.
+    """
+    sources = sources or {}
+    files = []
     for repo_name, files_path in repo_files.items():
         logger.info(f"Processing repo: {repo_name}")
-        for rel_path, file_path in files_path:
-
-            try:
-                with open(file_path, "r", encoding="utf-8") as f:
-                    code = f.read()
-                await parse_file(code,rel_path, db)
-                logger.info(f"Processed file: {rel_path}")
-            except FileNotFoundError:   
-                logger.error(f"Error: Input file not found at '{rel_path}'")
-                continue
-            except Exception as e:
-                logger.error(f"Error processing file '{rel_path}': {e}")
-                continue
-    
-    # fetch all symbols
-    rows = await get_all_symbols(db)
-
-    potential_chunks: List[List[str]] = []
-
-    for row in rows:
-        single_chunk: List[str] = []
-        values = list(row.values())  # expected: [symbol, type, [ids...]]
-        for code in values[2:]:
-            single_chunk.extend(code) 
-        potential_chunks.append(single_chunk)
-
-    # return the potential chunks
-    return potential_chunks
+        files.extend((rel_path, file_path) for rel_path, file_path in files_path)
+
+    if workers > 1:
+        logger.info(f"Parsing {len(files)} files with {workers} worker processes")
+        loop = asyncio.get_running_loop()
+        # spawn: forking a process that already runs the event loop and DB client threads is unsafe
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            results = await asyncio.gather(
+                *(loop.run_in_executor(pool, index_file, rel_path, file_path, sources.get(rel_path)) for rel_path, file_path in files),
+                return_exceptions=True,
+            )
+    else:
+        results = await asyncio.to_thread(index_files, files, sources)
+
+    index = SymbolIndex()
+    # rel_path -> number of malformed forms skipped by the parser
+    error_counts: Dict[str, int] = {}
+
+    for (rel_path, _), result in zip(files, results):
+        if isinstance(result, FileNotFoundError):
+            logger.error(f"Error: Input file not found at '{rel_path}'")
+            continue
+        if isinstance(result, Exception):
+            logger.error(f"Error processing file '{rel_path}': {result}")
+            continue
 
-async def parse_file(source_code:str, rel_path:str, db:Database) -> None:
-    tree = metta_ast_parser.parse(source_code)
+        file_index, errors = result
+        index.merge(file_index)
+        if errors:
+            error_counts[rel_path] = errors
+            logger.warning(f"Recovered from {errors} syntax error(s) in '{rel_path}'")
+        logger.info(f"Processed file: {rel_path}")
+
+    if error_counts:
+        logger.warning(
+            f"Skipped {sum(error_counts.values())} malformed form(s) across {len(error_counts)} file(s): {error_counts}"
+        )
+    
+    if persist_symbols:
+        written = await replace_symbols_index(index.to_documents(), db)
+        logger.info(f"Persisted {written} symbols")
+
+    return index
+
+def index_files(files: List[Tuple[str, str]], sources: Dict[str, bytes]) -> List[Union[Tuple[SymbolIndex, int], Exception]]:
+    """index_file for each (rel_path, file_path) in turn; a failing file yields its exception."""
+    results = []
+    for rel_path, file_path in files:
+        try:
+            results.append(index_file(rel_path, file_path, sources.get(rel_path)))
+        except Exception as e:
+            results.append(e)
+    return results
+
+def index_file(rel_path: str, file_path: str, source: Optional[bytes] = None) -> Tuple[SymbolIndex, int]:
+    """
+    Parse one file into its own SymbolIndex, from `source` when its bytes are
+    already in memory. Runs in worker processes, so it must stay picklable.
+    Newlines in `source` are normalized to \n, as text-mode open() does for
+    the file path, so both give the same chunk text and chunkIds.
+    """
+    index = SymbolIndex()
+    if source is not None:
+        text = source.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")
+        return index, parse_file(text, rel_path, index)
+    with open(file_path, "r", encoding="utf-8") as f:
+        errors = parse_file(f, rel_path, index)
+    return index, errors
+
+def parse_file(source: Union[str, IO], rel_path:str, index: SymbolIndex) -> int:
+    """Index the symbols of one file and return how many malformed forms were skipped."""
+    # `source` can be the file contents or an open file; forms are parsed
+    # lazily so symbols are indexed while the rest of the file is still read.
+    # A malformed form becomes an ErrorGroup and costs only that form.
+    error_count = 0
 
     # Cache comments above a function/type/assertion 
     # as part of that symbol's chunk
     comment_cache = []
 
-    for node in tree:
+    for node, source_code in metta_ast_parser.iter_parse(source, recover=True):
+        if node.node_type == metta_ast_parser.SyntaxNodeType.ErrorGroup:
+            logger.debug(f"Skipping malformed form in '{rel_path}' at {node.src_range}: {node.message}")
+            error_count += 1
+            # comments above a broken form belong to it
+            comment_cache = []
+            continue
+
         head_symbol = extract_symbol_from_node(node, source_code)
 
         if head_symbol["type"] == "unknown":
@@ -59,24 +133,26 @@ async def parse_file(source_code:str, rel_path:str, db:Database) -> None:
         if head_symbol["symbol"] == None:
             continue
         
+        if head_symbol["type"] == "def":
+            index.add_calls(head_symbol["symbol"], extract_calls(node))
+
         # insert symbol
         st, end = node.src_range
         # add comment above function/type/assertion
         if comment_cache:
-            await upsert_symbol(head_symbol["symbol"], head_symbol["type"] + "s",\
-                            ["\n".join(comment_cache) + "\n" + source_code[st:end], rel_path], \
-                            db)
+            index.add(head_symbol["symbol"], head_symbol["type"] + "s",
+                      "\n".join(comment_cache) + "\n" + source_code[st:end], rel_path)
         # no comment associated with function
         else:
-            await upsert_symbol(head_symbol["symbol"], head_symbol["type"] + "s",\
-                                [source_code[st:end], rel_path], \
-                                db)
+            index.add(head_symbol["symbol"], head_symbol["type"] + "s", source_code[st:end], rel_path)
         # clear cache
         comment_cache = []
     
     # remaining comments
     if comment_cache:
-        await upsert_symbol(f"{rel_path}_comment", "comments", ["\n".join(comment_cache), rel_path], db)
+        index.add(f"{rel_path}_comment", "comments", "\n".join(comment_cache), rel_path)
+
+    return error_count
 
 def extract_symbol_from_node(node: metta_ast_parser.SyntaxNode, source_text: str) -> Dict[str, Any]:
     st, end = node.src_range
@@ -108,4 +184,25 @@ def extract_symbol_from_node(node: metta_ast_parser.SyntaxNode, source_text: str
     elif node.node_type_str == "Comment":
         return {"type": "comment", "symbol": None}
 
-    return {"type": "unknown", "symbol": None}
\ No newline at end of file
+    return {"type": "unknown", "symbol": None}
+
+
+def extract_calls(node: metta_ast_parser.SyntaxNode) -> List[str]:
+    """
+    Heads of the expressions in a rule's body, e.g. `g` and `h` for
+    `(= (f $x) (if (g $x) (h 1) 0))`. The rule's own pattern is skipped.
+    Builtins are returned too; SymbolIndex.call_graph keeps known symbols only.
+    """
+    Type = metta_ast_parser.SyntaxNodeType
+    # sub_nodes of `(= pattern body)`: `(`, `=`, pattern, body, `)`
+    stack = list(reversed(node.sub_nodes[3:]))
+    calls = []
+    while stack:
+        current = stack.pop()
+        if not current.sub_nodes:
+            continue
+        head = current.sub_nodes[1] if len(current.sub_nodes) > 1 else None
+        if head is not None and head.node_type == Type.WordToken:
+            calls.append(head.parsed_text)
+        stack.extend(reversed(current.sub_nodes))
+    return calls
@@ -0,0 +1,82 @@
+import os
+from functools import lru_cache
+from typing import Any, Callable
+
+# measures a piece of text in the unit chunk budgets are given in
+SizeFn = Callable[[str], int]
+
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+# all-MiniLM-L6-v2 truncates its input at 256 word pieces
+DEFAULT_MAX_SEQ_LENGTH = 256
+
+
+def char_size(text: str) -> int:
+    """Size in characters (the historical chunk budget unit)."""
+    return len(text)
+
+
+class TokenSizer:
+    """
+    Size in embedding-model tokens, without the [CLS]/[SEP] the model adds.
+    Counts are memoised per text: chunk assembly measures the same symbols,
+    sub-nodes and joined pieces repeatedly, so most calls are cache hits.
+    Texts longer than max_cached_length characters are counted but not
+    memoised, so the cache never holds whole files.
+    Fast (Rust) tokenizers are called directly, skipping the Python wrapper,
+    on a private copy with truncation and padding off: SentenceTransformer
+    turns truncation on in the tokenizer it encodes with (capping every count
+    at max_seq_length), and its encoding threads must not share it with us.
+    """
+
+    def __init__(self, tokenizer: Any, max_tokens: int = None, cache_size: int = 1 << 16,
+                 max_cached_length: int = 8192):
+        self.tokenizer = tokenizer
+        self.max_cached_length = max_cached_length
+        backend = getattr(tokenizer, "backend_tokenizer", None) if getattr(tokenizer, "is_fast", False) else None
+        if backend is not None:
+            from tokenizers import Tokenizer
+
+            backend = Tokenizer.from_str(backend.to_str())
+            backend.no_truncation()
+            backend.no_padding()
+            self._encode = lambda text: len(backend.encode(text, add_special_tokens=False).ids)
+        else:
+            self._encode = lambda text: len(tokenizer.encode(text, add_special_tokens=False, truncation=False))
+        self._count = lru_cache(maxsize=cache_size)(self._encode)
+        # tokens the model actually reads per input, once its special tokens are added
+        special = tokenizer.num_special_tokens_to_add() if hasattr(tokenizer, "num_special_tokens_to_add") else 0
+        self.max_tokens = max_tokens - special if max_tokens else None
+
+    @classmethod
+    def from_model(cls, model: Any) -> "TokenSizer":
+        """
+        Build from a loaded SentenceTransformer, budgeted to its max_seq_length
+        (DEFAULT_MAX_SEQ_LENGTH when the model does not set one). Builds a
+        tokenizer copy, so make one per model (e.g. at startup), not per call.
+        """
+        return cls(model.tokenizer, getattr(model, "max_seq_length", None) or DEFAULT_MAX_SEQ_LENGTH)
+
+    def __call__(self, text: str) -> int:
+        # whitespace is only a separator for the tokenizer, so it costs nothing
+        if not text or text.isspace():
+            return 0
+        if len(text) > self.max_cached_length:
+            return self._encode(text)
+        return self._count(text)
+
+    def cache_info(self):
+        return self._count.cache_info()
+
+
+@lru_cache(maxsize=None)
+def load_token_sizer(model_name: str = None) -> TokenSizer:
+    """
+    TokenSizer for the embedding model's tokenizer, loaded once per process.
+    Only the tokenizer is loaded, not the model weights; the sequence length
+    the model truncates at comes from EMBEDDING_MAX_SEQ_LENGTH.
+    """
+    from transformers import AutoTokenizer
+
+    model_name = model_name or os.getenv("EMBEDDING_MODEL", DEFAULT_EMBEDDING_MODEL)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    return TokenSizer(tokenizer, int(os.getenv("EMBEDDING_MAX_SEQ_LENGTH", DEFAULT_MAX_SEQ_LENGTH)))
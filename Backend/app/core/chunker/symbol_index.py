@@ -0,0 +1,92 @@
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
+# (code, rel_path) pair stored under a symbol's column
+SymbolEntry = Tuple[str, str]
+
+
+class SymbolIndex:
+    """
+    In-process symbol index built while preprocessing a repo.
+    Replaces per-form upserts into the `symbols` collection: each symbol name
+    maps to columns (defs, calls, asserts, types, comments) holding unique
+    (code, rel_path) entries, in the order they were first added — the same
+    layout `$addToSet` upserts produced.
+    It also records, per defined symbol, the symbols its rule bodies call.
+    """
+
+    def __init__(self) -> None:
+        self._symbols: Dict[str, Dict[str, List[SymbolEntry]]] = {}
+        self._seen: Set[Tuple[str, str, str, str]] = set()
+        # caller -> callees, each listed once in first-seen order
+        self._calls: Dict[str, Dict[str, None]] = {}
+
+    def add(self, name: str, col: str, code: str, rel_path: str) -> None:
+        """Add a (code, rel_path) entry to the symbol's column, ignoring duplicates."""
+        key = (name, col, code, rel_path)
+        if key in self._seen:
+            return
+        self._seen.add(key)
+        self._symbols.setdefault(name, {}).setdefault(col, []).append((code, rel_path))
+
+    def add_calls(self, name: str, callees: Iterable[str]) -> None:
+        """Record that a rule of `name` calls `callees`."""
+        self._calls.setdefault(name, {}).update(dict.fromkeys(callees))
+
+    def merge(self, other: "SymbolIndex") -> None:
+        """Add every entry of `other`, in its order, after this index's entries."""
+        for name, columns in other._symbols.items():
+            for col, entries in columns.items():
+                for code, rel_path in entries:
+                    self.add(name, col, code, rel_path)
+        for name, callees in other._calls.items():
+            self.add_calls(name, callees)
+
+    def call_graph(self) -> Dict[str, List[str]]:
+        """Caller -> callees, limited to symbols in the index (builtins like `if` or `+` are dropped)."""
+        graph = {}
+        for name, callees in self._calls.items():
+            known = [callee for callee in callees if callee != name and callee in self._symbols]
+            if known:
+                graph[name] = known
+        return graph
+
+    def get(self, name: str) -> Dict[str, List[SymbolEntry]]:
+        return self._symbols.get(name, {})
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._symbols
+
+    def __len__(self) -> int:
+        return len(self._symbols)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._symbols)
+
+    def potential_chunks(self) -> List[List[SymbolEntry]]:
+        """One list of entries per symbol, columns concatenated in insertion order."""
+        return [
+            [entry for entries in columns.values() for entry in entries]
+            for columns in self._symbols.values()
+        ]
+
+    # `_seen` is derived from `_symbols`; leave it out when shipping an index
+    # back from a worker process.
+    def __getstate__(self) -> dict:
+        return {"_symbols": self._symbols, "_calls": self._calls}
+
+    def __setstate__(self, state: dict) -> None:
+        self._symbols = state["_symbols"]
+        self._calls = state["_calls"]
+        self._seen = {
+            (name, col, code, rel_path)
+            for name, columns in self._symbols.items()
+            for col, entries in columns.items()
+            for code, rel_path in entries
+        }
+
+    def to_documents(self) -> List[dict]:
+        """Documents in the shape of the `symbols` collection."""
+        return [
+            {"name": name, **{col: [list(entry) for entry in entries] for col, entries in columns.items()}}
+            for name, columns in self._symbols.items()
+        ]
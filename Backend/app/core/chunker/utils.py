@@ -1,9 +1,12 @@
 import os 
 import hashlib
-from typing import Dict
+from typing import Any, Dict, List, Optional
 
-def _build_chunk_doc(chunk_text: str, rel_path: set) -> Dict[str, object]:
-    """Build a Chunk Create-style document for insertion."""
+def _build_chunk_doc(chunk_text: str, rel_path: set, symbols: Optional[List[str]] = None,
+                     calls: Optional[List[str]] = None, called_by: Optional[List[str]] = None) -> Dict[str, object]:
+    """Build a Chunk Create-style document for insertion.
+    symbols/calls/called_by are the chunk's symbols and its call-graph
+    neighbours outside the chunk; they do not affect the chunkId."""
     # Derive identifiers
     parts = rel_path[0].split("/") if rel_path else ["unknown-repo"]
     repo_name = parts[0] if parts else "unknown-repo"
@@ -29,6 +32,21 @@ def _build_chunk_doc(chunk_text: str, rel_path: set) -> Dict[str, object]:
         "section": sections if sections else None,
         "file": file_names,
         "version": "1",      # or a commit hash if available
+        "symbols": symbols,
+        "calls": calls,
+        "called_by": called_by,
         "isEmbedded": False,
         "description": None     # fill later
-    }
\ No newline at end of file
+    }
+
+
+def chunk_rel_paths(chunk_doc: Dict[str, Any]) -> List[str]:
+    """Recover the repo-relative file paths a chunk document was built from (inverse of _build_chunk_doc)."""
+    repo = chunk_doc.get("repo")
+    sections = chunk_doc.get("section") or []
+    file_names = chunk_doc.get("file") or []
+    rel_paths = []
+    for section, file_name in zip(sections, file_names):
+        inside_repo = f"{section}/{file_name}" if section else file_name
+        rel_paths.append(f"{repo}/{inside_repo}")
+    return rel_paths
@@ -2,16 +2,26 @@ import hashlib
 from typing import List, Dict, Any
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+from app.core.chunker.sizing import SizeFn, char_size
 from .config import CHUNK_SIZE, CHUNK_OVERLAP
 
 
 
-def chunk_documentation_from_pages(pages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+def chunk_documentation_from_pages(
+    pages: List[Dict[str, Any]],
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    size: SizeFn = char_size,
+) -> List[Dict[str, Any]]:
     """
     Chunk documentation directly from a list of page data.
 
     Args:
         pages: List of page data dictionaries
+        chunk_size: Chunk budget, in the unit `size` measures
+        chunk_overlap: Overlap between consecutive chunks, same unit
+        size: Length function (characters by default; a sizing.TokenSizer
+              targets the embedding model's token budget)
 
     Returns:
         List of chunk documents ready for database insertion
@@ -19,8 +29,9 @@ def chunk_documentation_from_pages(pages: List[Dict[str, Any]]) -> List[Dict[str
     chunks = []
 
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=CHUNK_SIZE,
-        chunk_overlap=CHUNK_OVERLAP,
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=size,
         separators=["\n```", "\n\n", "\n", " ", ""],
     )
 
@@ -8,3 +8,6 @@ SITES_TO_SCRAPE = [
 # Chunking parameters
 CHUNK_SIZE = 800
 CHUNK_OVERLAP = 100
+# used instead when chunks are measured in embedding-model tokens
+CHUNK_SIZE_TOKENS = 254
+CHUNK_OVERLAP_TOKENS = 32
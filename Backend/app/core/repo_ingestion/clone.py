@@ -1,28 +1,151 @@
+import asyncio
+import hashlib
 import os
+import re
+import shutil
 import subprocess
+import tempfile
 from urllib.parse import urlparse
 from loguru import logger
-from typing import List
+from typing import Callable, Dict, List, Optional
+
+# only these files are checked out of a cloned repo
+SPARSE_PATTERNS = ["*.metta"]
+
+# "Receiving objects:  45% (450/1000)" / "remote: Counting objects: 100% (12/12), done."
+_PROGRESS_RE = re.compile(r"^(?:remote: )?([A-Za-z ]+):\s+(\d+)%")
+
+# one lock per bare cache so concurrent ingests of a repo do not fetch into it at once
+_cache_locks: Dict[str, asyncio.Lock] = {}
+
+ProgressCallback = Callable[[str, int], None]
 
 def get_repo_name(repo_url: str) -> str:
     """Extract repo name from URL, e.g. metta-moses.git → metta-moses"""
     return os.path.splitext(os.path.basename(urlparse(repo_url).path))[0]
 
-def clone_repo(repo_url: str, temp_dir: str) -> str:
-    repo_name = get_repo_name(repo_url)
-    repo_path = os.path.join(temp_dir, repo_name)
+def _progress_logger() -> ProgressCallback:
+    """Log each git phase at info when it starts and finishes, the percentages in between at debug."""
+    current = {"phase": None, "done": False}
+
+    def log(phase: str, percent: int) -> None:
+        if phase != current["phase"]:
+            current.update(phase=phase, done=percent == 100)
+            logger.info(f"git: {phase} {percent}%")
+        elif percent == 100 and not current["done"]:
+            current["done"] = True
+            logger.info(f"git: {phase} done")
+        else:
+            logger.debug(f"git: {phase} {percent}%")
+    return log
+
+async def run_git(*args: str, on_progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Run git without blocking the event loop and return its stdout.
+    Progress lines on stderr (split on \\r as well as \\n) are reported
+    through on_progress(phase, percent); a failing command raises
+    subprocess.CalledProcessError with git's last stderr lines.
+    """
+    on_progress = on_progress or _progress_logger()
+    proc = await asyncio.create_subprocess_exec(
+        "git", *args,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env={**os.environ, "GIT_TERMINAL_PROMPT": "0"},
+    )
 
-    if os.path.exists(repo_path):
-        logger.info(f"Repo already exists at {repo_path}, removing...")
-        subprocess.run(["rm", "-rf", repo_path], shell=True)
-    logger.info(f"Cloning {repo_url} into {repo_path}")
-    subprocess.run(["git", "clone", repo_url, repo_path], check=True)
+    async def read_stdout() -> bytes:
+        return await proc.stdout.read()
+
+    stdout_task = asyncio.create_task(read_stdout())
+    messages: List[str] = []
+    pending = ""
+    while True:
+        data = await proc.stderr.read(4096)
+        if not data:
+            break
+        lines = re.split(r"[\r\n]", pending + data.decode("utf-8", errors="replace"))
+        pending = lines.pop()
+        for line in lines:
+            m = _PROGRESS_RE.match(line)
+            if m:
+                on_progress(m.group(1).strip(), int(m.group(2)))
+            elif line.strip():
+                messages.append(line.strip())
+    if pending.strip():
+        messages.append(pending.strip())
+
+    stdout = await stdout_task
+    returncode = await proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, ["git", *args], stdout, "\n".join(messages[-5:]))
+    return stdout.decode("utf-8", errors="replace")
+
+def cache_path(repo_url: str, cache_dir: str) -> str:
+    """Bare cache for repo_url; the URL hash keeps forks with the same name apart."""
+    digest = hashlib.sha1(repo_url.encode("utf-8")).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{get_repo_name(repo_url)}-{digest}.git")
+
+async def update_cache(repo_url: str, cache_dir: str, on_progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Fetch the tip of repo_url's default branch into a bare cache and return
+    the fetched commit. The fetch is shallow (--depth 1) and blobless, so a
+    run only downloads the commit and its trees; file contents are fetched
+    lazily at checkout. A cache from an earlier run is reused.
+    """
+    git_dir = cache_path(repo_url, cache_dir)
+    async with _cache_locks.setdefault(git_dir, asyncio.Lock()):
+        if not os.path.exists(os.path.join(git_dir, "HEAD")):
+            logger.info(f"Creating repo cache at {git_dir}")
+            os.makedirs(cache_dir, exist_ok=True)
+            await run_git("init", "--quiet", "--bare", git_dir)
+            await run_git("--git-dir", git_dir, "remote", "add", "origin", repo_url)
+        else:
+            logger.info(f"Reusing repo cache at {git_dir}")
+            await run_git("--git-dir", git_dir, "remote", "set-url", "origin", repo_url)
+            # forget checkouts whose directories were removed
+            await run_git("--git-dir", git_dir, "worktree", "prune")
+
+        logger.info(f"Fetching {repo_url}")
+        await run_git(
+            "--git-dir", git_dir, "fetch", "--progress", "--depth", "1", "--filter=blob:none",
+            "origin", "HEAD", on_progress=on_progress,
+        )
+        commit = (await run_git("--git-dir", git_dir, "rev-parse", "FETCH_HEAD")).strip()
+        # keep the commit reachable so `gc` in the cache does not drop it
+        await run_git("--git-dir", git_dir, "update-ref", "refs/heads/ingest", commit)
+    return commit
+
+async def clone_repo(
+    repo_url: str,
+    temp_dir: str,
+    cache_dir: str,
+    on_progress: Optional[ProgressCallback] = None,
+) -> str:
+    """
+    Check out the .metta files of repo_url's default branch and return the checkout path.
+    The checkout is a sparse worktree of the bare cache in cache_dir, placed in a
+    fresh directory under temp_dir and named after the repo. Remove it with remove_checkout.
+    """
+    repo_name = get_repo_name(repo_url)
+    commit = await update_cache(repo_url, cache_dir, on_progress)
 
+    os.makedirs(temp_dir, exist_ok=True)
+    repo_path = os.path.join(tempfile.mkdtemp(prefix=f"{repo_name}-", dir=temp_dir), repo_name)
+    git_dir = cache_path(repo_url, cache_dir)
+    logger.info(f"Checking out {repo_url}@{commit[:12]} into {repo_path}")
+    try:
+        await run_git("--git-dir", git_dir, "worktree", "add", "--quiet", "--no-checkout", "--detach", repo_path, commit)
+        await run_git("-C", repo_path, "sparse-checkout", "set", "--no-cone", *SPARSE_PATTERNS)
+        # the blobs of the sparse files are fetched here
+        await run_git("-C", repo_path, "checkout", "--progress", on_progress=on_progress)
+    except BaseException:
+        await remove_checkout(repo_path)
+        raise
     return repo_path
 
-def get_all_files(repo_dir: str) -> List[str]:
-    return [
-        os.path.join(root, file)
-        for root, _, files in os.walk(repo_dir)
-        for file in files
-    ]
+async def remove_checkout(repo_path: str) -> None:
+    """Delete a checkout made by clone_repo; the cache prunes its worktree entry on the next run."""
+    logger.info(f"Cleaning up {repo_path}")
+    await asyncio.to_thread(shutil.rmtree, os.path.dirname(repo_path), True)
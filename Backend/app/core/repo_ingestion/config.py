@@ -2,4 +2,5 @@ import os
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TEMP_DIR = os.path.join(BASE_DIR, "temp")
-DATA_DIR = os.path.join(BASE_DIR, "data")
\ No newline at end of file
+DATA_DIR = os.path.join(BASE_DIR, "data")
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
\ No newline at end of file
@@ -0,0 +1,61 @@
+import errno
+import hashlib
+import os
+import tempfile
+from typing import Tuple
+from loguru import logger
+
+
+class ContentStore:
+    """
+    Flat content-addressed directory of files named `<sha256>.metta`.
+    A file is read once: the bytes that are hashed are also what gets stored
+    and what `put` returns, so callers can chunk them without re-reading the store.
+    Contents already present are not written again; new ones are hard-linked
+    from the source when it is on the same filesystem and written otherwise.
+    """
+
+    def __init__(self, root: str, suffix: str = ".metta"):
+        self.root = root
+        self.suffix = suffix
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, file_hash: str) -> str:
+        return os.path.join(self.root, f"{file_hash}{self.suffix}")
+
+    def __contains__(self, file_hash: str) -> bool:
+        return os.path.exists(self.path(file_hash))
+
+    def put(self, src_path: str) -> Tuple[str, bytes, str]:
+        """
+        Add src_path to the store and return (hash, contents, outcome), where
+        outcome is "present", "linked" or "written".
+        """
+        with open(src_path, "rb") as f:
+            data = f.read()
+        file_hash = hashlib.sha256(data).hexdigest()
+        dest = self.path(file_hash)
+
+        if os.path.exists(dest):
+            return file_hash, data, "present"
+        try:
+            os.link(src_path, dest)
+            return file_hash, data, "linked"
+        except FileExistsError:
+            # stored by a concurrent ingest in the meantime
+            return file_hash, data, "present"
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK, errno.ENOTSUP, errno.EACCES):
+                raise
+            logger.debug(f"Cannot hard-link {src_path} into {self.root} ({e.strerror}), writing a copy")
+
+        # write under a temporary name so a crash never leaves a truncated file under a valid hash
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, dest)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return file_hash, data, "written"
@@ -1,55 +1,132 @@
+import asyncio
 import os
 import hashlib
 import json
-import shutil
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
 from loguru import logger
-from typing import Optional, List, Dict
+from typing import AsyncIterator, Iterator, Optional, List, Dict, Tuple
+from app.core.repo_ingestion.file_store import ContentStore
+
+# paths handed from the directory walk to the hashing threads at a time
+SCAN_BATCH = 256
 
 def hash_file_content(filepath: str) -> str:
     h = hashlib.sha256()
     with open(filepath, "rb") as f:
-        for chunk in iter(lambda: f.read(8192), b""):
+        for chunk in iter(lambda: f.read(1 << 20), b""):
             h.update(chunk)
     return h.hexdigest()
 
 
-def process_metta_files(
-    file_paths: List[str],
-    output_dir: str,
-    repo_root: Optional[str] = None,
-    json_path: str = "../metta_index.json"
-) -> Dict[str, str]:
+def scan_files(root: str, suffixes: Tuple[str, ...] = (".metta",)) -> Iterator[str]:
     """
-    file_paths: list of all files in the repo
-    output_dir: where to store hashed .metta files (flat)
-    repo_root: path to the root of the cloned repo (used for relative paths in index)
-    json_path: name of JSON file mapping hash → relative path
+    Lazily yield the files under root whose name ends with one of suffixes.
+    Uses os.scandir, so the file type comes from the directory entry without
+    a stat per file; .git and symlinked directories are not descended into.
     """
-    os.makedirs(output_dir, exist_ok=True)
-    index: Dict[str, str] = {}
-
-    repo_name: str = os.path.basename(os.path.normpath(repo_root)) if repo_root else "repo"
-
-    for file in file_paths:
-        if file.endswith(".metta"):
-            file_hash: str = hash_file_content(file)
-            new_name: str = f"{file_hash}.metta"
-
-            rel_path_inside_repo: str = (
-                os.path.relpath(file, repo_root).replace("\\", "/") if repo_root else os.path.basename(file)
-            )
-            index[file_hash] = f"{repo_name}/{rel_path_inside_repo}"
+    stack = [root]
+    while stack:
+        try:
+            entries = os.scandir(stack.pop())
+        except OSError as e:
+            logger.warning(f"Skipping unreadable directory: {e}")
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name != ".git":
+                        stack.append(entry.path)
+                elif entry.name.endswith(suffixes) and entry.is_file():
+                    yield entry.path
 
-            dest_path: str = os.path.join(output_dir, new_name)
-            shutil.copy(file, dest_path)
 
-            logger.info(f"Processed {rel_path_inside_repo} → {new_name}")
+def _rel_path(file: str, repo_root: str, repo_name: str) -> str:
+    return f"{repo_name}/{os.path.relpath(file, repo_root).replace(os.sep, '/')}"
 
-    os.system(f"rd /s /q {repo_root}")
 
+def _save_index(index: Dict[str, str], output_dir: str, json_path: str) -> None:
     json_full_path: str = os.path.join(output_dir, json_path)
     with open(json_full_path, "w") as f:
         json.dump(index, f, indent=2)
-
     logger.info(f"Index saved at {json_full_path}")
+
+
+async def iter_metta_files(
+    repo_root: str,
+    store: ContentStore,
+    threads: Optional[int] = None,
+) -> AsyncIterator[Tuple[str, str, bytes]]:
+    """
+    Walk repo_root and add every .metta file to store, yielding
+    (hash, rel_path, contents) as soon as each file is stored.
+    The walk runs in its own thread and hands paths over in batches;
+    reading, hashing (hashlib releases the GIL) and storing run on `threads`
+    threads. Files are yielded in completion order, not walk order.
+    """
+    loop = asyncio.get_running_loop()
+    threads = threads or min(32, (os.cpu_count() or 1) + 4)
+    repo_name = os.path.basename(os.path.normpath(repo_root))
+    paths = scan_files(repo_root)
+    outcomes: Counter = Counter()
+
+    def put(path: str) -> Tuple[str, Tuple[str, bytes, str]]:
+        return path, store.put(path)
+
+    with ThreadPoolExecutor(1) as walker, ThreadPoolExecutor(threads) as hashers:
+        batch: Optional[asyncio.Future] = None
+        in_flight = set()
+        walked = False
+        try:
+            while True:
+                # keep the walk ahead of the hashers, but bound the work queued up
+                if batch is None and not walked and len(in_flight) < 2 * threads:
+                    batch = loop.run_in_executor(walker, lambda: list(islice(paths, SCAN_BATCH)))
+                waiting = in_flight | ({batch} if batch else set())
+                if not waiting:
+                    break
+
+                done, _ = await asyncio.wait(waiting, return_when=asyncio.FIRST_COMPLETED)
+                if batch in done:
+                    found = batch.result()
+                    batch, walked = None, not found
+                    in_flight.update(loop.run_in_executor(hashers, put, path) for path in found)
+                for fut in done & in_flight:
+                    in_flight.discard(fut)
+                    path, (file_hash, data, outcome) = fut.result()
+                    outcomes[outcome] += 1
+                    yield file_hash, _rel_path(path, repo_root, repo_name), data
+        finally:
+            for fut in in_flight:
+                fut.cancel()
+
+    logger.info(
+        f"Stored {sum(outcomes.values())} .metta files: {outcomes['present']} already present, "
+        f"{outcomes['linked']} linked, {outcomes['written']} written"
+    )
+
+
+async def store_metta_files(
+    repo_root: str,
+    output_dir: str,
+    json_path: str = "../metta_index.json",
+    sources: Optional[Dict[str, bytes]] = None,
+) -> Dict[str, str]:
+    """
+    Store every .metta file of a checkout and return hash → rel_path,
+    ordered by rel_path so chunking does not depend on which file finished
+    hashing first. The index is also saved as json_path next to output_dir.
+    sources: if given, filled with hash → file bytes, so the chunker can use
+             them instead of re-reading the store
+    """
+    found: List[Tuple[str, str]] = []
+    async for file_hash, rel_path, data in iter_metta_files(repo_root, ContentStore(output_dir)):
+        found.append((rel_path, file_hash))
+        if sources is not None:
+            sources[file_hash] = data
+
+    index: Dict[str, str] = {file_hash: rel_path for rel_path, file_hash in sorted(found)}
+    _save_index(index, output_dir, json_path)
     return index
+
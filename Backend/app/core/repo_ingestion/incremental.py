@@ -0,0 +1,242 @@
+import os
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from loguru import logger
+from pymongo.database import Database
+from qdrant_client.models import PointIdsList
+from app.core.chunker import chunker
+from app.core.chunker.sizing import SizeFn, char_size
+from app.core.chunker.utils import chunk_rel_paths
+from app.core.repo_ingestion.config import DATA_DIR
+from app.db.db import delete_chunks, get_file_manifest, insert_chunks, write_file_manifest
+from app.rag.embedding.pipeline import chunk_point_id, update_point_links
+
+# atoms of MeTTa source: anything between whitespace, brackets and quotes
+_ATOM_RE = re.compile(r'[^\s()"]+')
+
+
+@dataclass
+class ManifestDiff:
+    """How the files of a repo changed since the last recorded ingest (lists of rel_paths)."""
+    added: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: List[str] = field(default_factory=list)
+
+
+def diff_manifest(current: Dict[str, str], manifest: Dict[str, dict]) -> ManifestDiff:
+    """Compare {rel_path: hash} of the fresh clone with the stored manifest."""
+    diff = ManifestDiff()
+    for rel_path, file_hash in current.items():
+        if rel_path not in manifest:
+            diff.added.append(rel_path)
+        elif manifest[rel_path]["hash"] != file_hash:
+            diff.changed.append(rel_path)
+        else:
+            diff.unchanged.append(rel_path)
+    diff.removed = [rel_path for rel_path in manifest if rel_path not in current]
+    return diff
+
+
+def read_source(file_hash: str, sources: Optional[Dict[str, bytes]] = None) -> bytes:
+    """A stored file's bytes, from `sources` when store_metta_files kept them in memory."""
+    if sources and file_hash in sources:
+        return sources[file_hash]
+    with open(os.path.join(DATA_DIR, f"{file_hash}.metta"), "rb") as f:
+        return f.read()
+
+
+def chunk_settings(max_size: int, size: SizeFn, colocate_calls: bool) -> Dict[str, Any]:
+    """The options a file's chunks depend on besides its content, as stored in the manifest."""
+    if size is char_size:
+        unit = "chars"
+    else:
+        tokenizer = getattr(size, "tokenizer", None)
+        unit = f"tokens:{getattr(tokenizer, 'name_or_path', type(size).__name__)}"
+    return {"max_size": max_size, "chunk_unit": unit, "colocate_calls": bool(colocate_calls)}
+
+
+def plan_rechunk(diff: ManifestDiff, manifest: Dict[str, dict],
+                 pulled_in: Iterable[str] = ()) -> Tuple[Set[str], Set[str]]:
+    """
+    Return (files to re-chunk, chunkIds that may be stale).
+    A chunk can span several files, so an unchanged file that shares a chunk
+    with a changed or removed one is re-chunked as well (its whole chunk set
+    is rebuilt, which can pull in further files). pulled_in: unchanged files
+    to re-chunk as if they had changed.
+    """
+    pulled_in = set(pulled_in)
+    rechunk = set(diff.added) | set(diff.changed) | pulled_in
+    stale: Set[str] = set()
+    for rel_path in diff.changed + diff.removed + sorted(pulled_in):
+        stale.update(manifest[rel_path]["chunkIds"])
+
+    pending = set(diff.unchanged) - pulled_in
+    while True:
+        pulled_in = {rel_path for rel_path in pending if stale.intersection(manifest[rel_path]["chunkIds"])}
+        if not pulled_in:
+            return rechunk, stale
+        pending -= pulled_in
+        rechunk |= pulled_in
+        for rel_path in pulled_in:
+            stale.update(manifest[rel_path]["chunkIds"])
+
+
+def mentioned_atoms(sources: Iterable[bytes]) -> Set[str]:
+    """Every atom written in the given files: a superset of the symbols they define and call."""
+    atoms: Set[str] = set()
+    for data in sources:
+        atoms.update(_ATOM_RE.findall(data.decode("utf-8", errors="replace")))
+    return atoms
+
+
+def related_files(chunks: List[Dict[str, Any]], manifest: Dict[str, dict], rechunked: Set[str],
+                  candidates: Iterable[str], mentioned: Set[str] = frozenset()) -> Set[str]:
+    """
+    Candidate files whose chunks a full ingest would build differently given
+    the re-chunked files: files defining a symbol the re-chunked files define
+    or mention (their entries are grouped, or co-located, with them), and
+    files calling a symbol the re-chunked files define (their called_by
+    changes). mentioned: the atoms of the re-chunked files (mentioned_atoms);
+    a subset is chunked without the rest of the repo, so its chunks only
+    list calls into the subset. The manifest entries of the re-chunked files
+    count too, so references that were removed are followed as well.
+    """
+    defined, referenced = set(), set(mentioned)
+    for chunk in chunks:
+        defined.update(chunk.get("symbols") or ())
+        referenced.update(chunk.get("calls") or ())
+    for rel_path in rechunked:
+        entry = manifest.get(rel_path, {})
+        defined.update(entry.get("symbols", ()))
+        referenced.update(entry.get("calls", ()))
+    referenced |= defined
+    return {
+        rel_path for rel_path in candidates
+        if referenced.intersection(manifest[rel_path].get("symbols", ()))
+        or defined.intersection(manifest[rel_path].get("calls", ()))
+    }
+
+
+def manifest_entries(chunks: List[Dict[str, Any]], files: Dict[str, str],
+                     settings: Dict[str, Any]) -> Dict[str, dict]:
+    """Manifest entries for {rel_path: hash}: each file's chunkIds, symbols and calls."""
+    entries = {
+        rel_path: {"hash": file_hash, "chunkIds": [], "symbols": set(), "calls": set(), "settings": settings}
+        for rel_path, file_hash in files.items()
+    }
+    for chunk in chunks:
+        for rel_path in chunk_rel_paths(chunk):
+            entry = entries.get(rel_path)
+            if entry is None:
+                continue
+            entry["chunkIds"].append(chunk["chunkId"])
+            entry["symbols"].update(chunk.get("symbols") or ())
+            entry["calls"].update(chunk.get("calls") or ())
+    for entry in entries.values():
+        entry["symbols"], entry["calls"] = sorted(entry["symbols"]), sorted(entry["calls"])
+    return entries
+
+
+async def store_chunks(chunks: List[Dict[str, Any]], db: Database, qdrant=None,
+                       collection_name: str = None) -> Dict[str, Any]:
+    """
+    insert_chunks, then copy the new symbol links of chunks that were already
+    stored and embedded into their Qdrant points. Returns insert_chunks' result.
+    """
+    if not chunks:
+        return {"inserted": 0, "relinked_ids": [], "relinked_embedded_ids": []}
+    result = await insert_chunks(chunks, db)
+    logger.info(f"Inserted {result['inserted']} chunks, skipped {result['duplicates']} duplicates")
+    relinked = set(result["relinked_embedded_ids"])
+    if relinked and qdrant is not None and collection_name:
+        await update_point_links(collection_name, qdrant, [chunk for chunk in chunks if chunk["chunkId"] in relinked])
+    return result
+
+
+async def incremental_ingest(
+    index: Dict[str, str],
+    repo_name: str,
+    max_size: int,
+    db: Database,
+    qdrant=None,
+    collection_name: str = None,
+    workers: int = 1,
+    sources: Dict[str, bytes] = None,
+    size: SizeFn = char_size,
+    colocate_calls: bool = False,
+) -> Dict[str, Any]:
+    """
+    Re-chunk only the files whose content hash changed since the last ingest.
+    index: hash -> rel_path for the fresh clone (as written by store_metta_files).
+    sources: hash -> file bytes from store_metta_files, passed on to the chunker.
+    Chunks that are no longer produced are deleted from Mongo and, when a
+    Qdrant client is given, their points are removed from the collection.
+    Unchanged files that share a chunk, a symbol or a call with the re-chunked
+    ones are re-chunked with them (see related_files) until no more are
+    pulled in, so the result matches a full ingest. Their chunks usually keep
+    their chunkId, so store_chunks updates the links of those in MongoDB and
+    in their Qdrant payloads instead of inserting them. When the chunk settings
+    (max_size, unit, colocate_calls) differ from the manifest's, or the
+    manifest predates them, every file is re-chunked.
+    Returns a summary of the diff.
+    """
+    current = {rel_path: file_hash for file_hash, rel_path in index.items()}
+    manifest = await get_file_manifest(repo_name, db)
+    settings = chunk_settings(max_size, size, colocate_calls)
+    diff = diff_manifest(current, manifest)
+    full = any(entry.get("settings") != settings for entry in manifest.values())
+    if full:
+        logger.info(f"Chunk settings of {repo_name} changed to {settings}; re-chunking every file")
+        diff = ManifestDiff(added=diff.added, changed=diff.changed + diff.unchanged, removed=diff.removed)
+
+    pulled_in: Set[str] = set()
+    while True:
+        rechunk, stale = plan_rechunk(diff, manifest, pulled_in)
+        chunks = []
+        if rechunk:
+            # in the clone's order, which decides the order of a symbol's entries as in a full ingest
+            subset = {file_hash: rel_path for file_hash, rel_path in index.items() if rel_path in rechunk}
+            chunks = await chunker.ast_based_chunker(subset, db, max_size, workers=workers, store=False,
+                                                     sources=sources, size=size, colocate_calls=colocate_calls)
+        mentioned = mentioned_atoms(read_source(file_hash, sources) for file_hash in subset) if rechunk else set()
+        related = related_files(chunks, manifest, rechunk | set(diff.removed), set(diff.unchanged) - rechunk, mentioned)
+        if not related:
+            break
+        pulled_in |= related
+
+    # Chunks whose text and files did not change keep their chunkId, so their
+    # annotation and embedding survive the re-ingest.
+    new_ids = {chunk["chunkId"] for chunk in chunks}
+    to_delete = sorted(stale - new_ids)
+    deleted = await delete_chunks(to_delete, db)
+    if to_delete and qdrant is not None and collection_name:
+        await qdrant.delete(
+            collection_name=collection_name,
+            points_selector=PointIdsList(points=[chunk_point_id(chunk_id) for chunk_id in to_delete]),
+        )
+    stored = await store_chunks(chunks, db, qdrant, collection_name)
+
+    await write_file_manifest(
+        repo_name,
+        manifest_entries(chunks, {rel_path: current[rel_path] for rel_path in rechunk}, settings),
+        removed=diff.removed,
+        mongo_db=db,
+    )
+
+    summary = {
+        "added": len(diff.added),
+        "changed": len(diff.changed),
+        "removed": len(diff.removed),
+        "unchanged": len(diff.unchanged),
+        "rechunked_files": len(rechunk),
+        "related_files": len(pulled_in),
+        "settings_changed": full,
+        "chunks_produced": len(chunks),
+        "chunks_inserted": stored["inserted"],
+        "chunks_relinked": len(stored["relinked_ids"]),
+        "chunks_deleted": deleted,
+    }
+    logger.info(f"Incremental ingest of {repo_name}: {summary}")
+    return summary
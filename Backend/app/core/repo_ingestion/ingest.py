@@ -1,18 +1,65 @@
-import shutil
-from loguru import logger
+import os
+from typing import Any, Dict
 from pymongo.database import Database
-from app.core.repo_ingestion.clone import clone_repo, get_all_files
-from app.core.repo_ingestion.filters import process_metta_files
-from app.core.repo_ingestion.config import TEMP_DIR, DATA_DIR
+from app.core.repo_ingestion.clone import clone_repo, get_repo_name, remove_checkout
+from app.core.repo_ingestion.filters import store_metta_files
+from app.core.repo_ingestion.config import CACHE_DIR, TEMP_DIR, DATA_DIR
+from app.core.repo_ingestion.incremental import chunk_settings, incremental_ingest, manifest_entries, store_chunks
 from app.core.chunker import chunker
+from app.core.chunker.sizing import SizeFn, char_size
+from app.db.db import write_file_manifest
 
-async def ingest_pipeline(repo_url: str, max_size: int, db: Database) -> None:
-    repo_path: str = clone_repo(repo_url, TEMP_DIR)
+async def ingest_pipeline(
+    repo_url: str,
+    max_size: int,
+    db: Database,
+    incremental: bool = False,
+    qdrant=None,
+    collection_name: str = None,
+    size: SizeFn = char_size,
+    colocate_calls: bool = False,
+) -> Dict[str, Any]:
+    """
+    Clone, store and chunk a repo. max_size is in the unit `size` measures:
+    characters by default, embedding tokens with a sizing.TokenSizer.
+    colocate_calls keeps small callees in their caller's chunk.
+    """
+    repo_path: str = await clone_repo(repo_url, TEMP_DIR, CACHE_DIR)
+    repo_name = get_repo_name(repo_url)
     
     try:
-        files: list[str] = get_all_files(repo_path)
-        indexes = process_metta_files(files, DATA_DIR, repo_root=repo_path)
-        await chunker.ast_based_chunker(indexes, db, max_size)
+        # every .metta file is read once: hashed, stored and kept here for the chunker
+        sources: Dict[str, bytes] = {}
+        indexes = await store_metta_files(repo_path, DATA_DIR, sources=sources)
+        # worker processes for parsing .metta files (1 = parse in-process)
+        workers = int(os.getenv("INGEST_WORKERS", "1"))
+
+        if incremental:
+            return await incremental_ingest(
+                indexes, repo_name, max_size, db, qdrant, collection_name, workers, sources, size, colocate_calls
+            )
+
+        chunks = await chunker.ast_based_chunker(
+            indexes, db, max_size, workers=workers, store=False, sources=sources, size=size,
+            colocate_calls=colocate_calls,
+        )
+        stored = await store_chunks(chunks, db, qdrant, collection_name)
+        # record what every file produced so the next run can be incremental
+        await write_file_manifest(
+            repo_name,
+            manifest_entries(
+                chunks,
+                {rel_path: file_hash for file_hash, rel_path in indexes.items()},
+                chunk_settings(max_size, size, colocate_calls),
+            ),
+            replace=True,
+            mongo_db=db,
+        )
+        return {
+            "files": len(indexes),
+            "chunks_produced": len(chunks),
+            "chunks_inserted": stored["inserted"],
+            "chunks_relinked": len(stored["relinked_ids"]),
+        }
     finally:
-        logger.info(f"Cleaning up {repo_path}")
-        shutil.rmtree(repo_path, ignore_errors=True)
\ No newline at end of file
+        await remove_checkout(repo_path)
@@ -1,6 +1,7 @@
 from typing import Literal, List, Optional, Union
 from pydantic import BaseModel
 from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, UpdateOne
 from pymongo.errors import BulkWriteError
 from pymongo.database import Database
 from pymongo.collection import Collection
@@ -12,6 +13,10 @@ from app.model.chat_session import ChatSessionSchema
 import time
 
 
+# chunk fields derived from the whole repo's call graph rather than the chunk text
+LINK_FIELDS = ("symbols", "calls", "called_by")
+
+
 def _get_collection(mongo_db: Database, name: str) -> Collection:
     if mongo_db is None:
         raise RuntimeError("Database connection not initialized — pass a valid mongo_db")
@@ -38,41 +43,99 @@ async def insert_chunk(chunk_data: dict, mongo_db: Database = None) -> str | Non
 
 # Function to insert many chunks into the MongoDB collection with validation.
 async def insert_chunks(
-    chunks_data: List[dict], mongo_db: Database = None
-) -> List[str]:
-    """
-    Insert multiple chunks with duplicate checking.
-    Returns a list of inserted chunkIds.
+    chunks_data: List[dict], mongo_db: Database = None, batch_size: int = 1000
+) -> dict:
+    """
+    Insert multiple chunks with duplicate checking, batch_size chunks per round trip.
+    Each batch costs one $in lookup for existing chunkIds and one unordered
+    insert_many; a duplicate that slips in between (unique chunkId index) is
+    counted as a duplicate, not an error.
+    The chunkId covers only the text and files, so an existing chunk whose
+    LINK_FIELDS (symbols, calls, called_by) differ gets them $set instead.
+    Returns {"inserted_ids": [...], "inserted": int, "duplicates": int, "invalid": int,
+    "relinked_ids": [...], "relinked_embedded_ids": [...]}; the embedded ones also
+    need their vector store payload updated.
     """
     collection = _get_collection(mongo_db, "chunks")
     valid_chunks = []
+    seen_ids = set()
+    duplicates = invalid = 0
 
-    # Validate and check duplicates
+    # Validate in one pass, dropping repeats within the input itself
     for chunk_data in chunks_data:
         try:
             chunk = ChunkSchema(**chunk_data)
-            if not await collection.find_one({"chunkId": chunk.chunkId}):
-                valid_chunks.append(chunk.model_dump())
-            else:
-                logger.warning(f"Skipping duplicate chunkId: {chunk.chunkId}")
         except Exception as e:
-            logger.error("Validation error:", e)
-
-        if not valid_chunks:
-            return []
-
-    # Insert many
-    try:
-        result = await collection.insert_many(valid_chunks, ordered=False)
-        inserted_ids = result.inserted_ids
-    except BulkWriteError as e:
-        logger.warning("Some duplicates were skipped.", e.details)
-        inserted_ids = e.details.get("writeErrors", [])
-        # Extract inserted ids if available
-        inserted_ids = [item["op"]["chunkId"] for item in inserted_ids if "op" in item and "chunkId" in item["op"]]
+            logger.error(f"Validation error: {e}")
+            invalid += 1
+            continue
+        if chunk.chunkId in seen_ids:
+            duplicates += 1
+            continue
+        seen_ids.add(chunk.chunkId)
+        valid_chunks.append(chunk.model_dump())
+
+    inserted_ids: List[str] = []
+    relinked_ids: List[str] = []
+    relinked_embedded_ids: List[str] = []
+    for start in range(0, len(valid_chunks), batch_size):
+        batch = valid_chunks[start:start + batch_size]
+        existing = {
+            doc["chunkId"]: doc
+            async for doc in collection.find(
+                {"chunkId": {"$in": [chunk["chunkId"] for chunk in batch]}},
+                {"chunkId": 1, "isEmbedded": 1, **{field: 1 for field in LINK_FIELDS}, "_id": 0},
+            )
+        }
+        new_chunks = [chunk for chunk in batch if chunk["chunkId"] not in existing]
+        duplicates += len(batch) - len(new_chunks)
+
+        relinks = [
+            chunk for chunk in batch
+            if chunk["chunkId"] in existing
+            and any(existing[chunk["chunkId"]].get(field) != chunk.get(field) for field in LINK_FIELDS)
+        ]
+        if relinks:
+            await collection.bulk_write([
+                UpdateOne(
+                    {"chunkId": chunk["chunkId"]},
+                    {"$set": {field: chunk.get(field) for field in LINK_FIELDS}},
+                    upsert=False,
+                )
+                for chunk in relinks
+            ], ordered=False)
+            relinked_ids.extend(chunk["chunkId"] for chunk in relinks)
+            relinked_embedded_ids.extend(
+                chunk["chunkId"] for chunk in relinks if existing[chunk["chunkId"]].get("isEmbedded")
+            )
+        if not new_chunks:
+            continue
 
-        # Return list of inserted chunkIds
-        return [chunk["chunkId"] for chunk in valid_chunks]
+        try:
+            await collection.insert_many(new_chunks, ordered=False)
+            inserted_ids.extend(chunk["chunkId"] for chunk in new_chunks)
+        except BulkWriteError as e:
+            failed = set()
+            for error in e.details.get("writeErrors", []):
+                failed.add(error["index"])
+                if error.get("code") == 11000:
+                    duplicates += 1
+                else:
+                    logger.error(f"Failed to insert chunk {new_chunks[error['index']]['chunkId']}: {error.get('errmsg')}")
+            inserted_ids.extend(chunk["chunkId"] for i, chunk in enumerate(new_chunks) if i not in failed)
+
+    if duplicates:
+        logger.warning(f"Skipped {duplicates} duplicate chunk(s)")
+    if relinked_ids:
+        logger.info(f"Updated the symbol links of {len(relinked_ids)} existing chunk(s)")
+    return {
+        "inserted_ids": inserted_ids,
+        "inserted": len(inserted_ids),
+        "duplicates": duplicates,
+        "invalid": invalid,
+        "relinked_ids": relinked_ids,
+        "relinked_embedded_ids": relinked_embedded_ids,
+    }
 
 
 # Function to retrieve  chunks by ChunkId from the MongoDB collection.
@@ -97,6 +160,52 @@ async def get_chunks(
     cursor = collection.find(filter_query, {"_id": 0}).limit(limit)
     return [doc async for doc in cursor]
 
+# chunks still to embed; invalid ones are flagged embeddingSkipped and left out
+UNEMBEDDED_QUERY = {"isEmbedded": False, "embeddingSkipped": {"$exists": False}}
+
+def unembedded_chunks_cursor(
+    after: Optional[ObjectId] = None,
+    exclude_chunk_ids: List[str] = (),
+    batch_size: int = 100,
+    mongo_db: Database = None,
+):
+    """
+    Cursor over the chunks to embed in _id order, starting after the _id `after`.
+    Served by the (isEmbedded, _id) index; read it in slices with to_list(n).
+    """
+    collection = _get_collection(mongo_db, "chunks")
+    query = dict(UNEMBEDDED_QUERY)
+    if after is not None:
+        query["_id"] = {"$gt": after}
+    if exclude_chunk_ids:
+        query["chunkId"] = {"$nin": list(exclude_chunk_ids)}
+    return collection.find(query).sort("_id", 1).batch_size(batch_size)
+
+async def mark_embedding_skipped(ids: List[ObjectId], reason: str, mongo_db: Database = None) -> int:
+    """Flag chunks (by _id) that cannot be embedded, so they are not read again."""
+    if not ids:
+        return 0
+    collection = _get_collection(mongo_db, "chunks")
+    result = await collection.update_many({"_id": {"$in": list(ids)}}, {"$set": {"embeddingSkipped": reason}})
+    return result.modified_count
+
+def iter_chunks_after(after: Optional[ObjectId] = None, fields: List[str] = None, mongo_db: Database = None):
+    """Cursor over all chunks in _id order, starting after the _id `after`; only `fields` are returned."""
+    collection = _get_collection(mongo_db, "chunks")
+    query = {"_id": {"$gt": after}} if after is not None else {}
+    projection = {field: 1 for field in fields} if fields else None
+    return collection.find(query, projection).sort("_id", 1)
+
+async def get_chunk_ids(mongo_db: Database = None) -> List[str]:
+    """chunkIds of all chunks."""
+    collection = _get_collection(mongo_db, "chunks")
+    return [doc["chunkId"] async for doc in collection.find({}, {"_id": 0, "chunkId": 1}) if "chunkId" in doc]
+
+async def count_chunks(filter_query: dict = None, mongo_db: Database = None) -> int:
+    """Count the chunks matching the filter."""
+    collection = _get_collection(mongo_db, "chunks")
+    return await collection.count_documents(filter_query or {})
+
 async def update_embedding_status(
     chunk_ids: Union[str, List[str]], 
     status: bool, 
@@ -160,6 +269,18 @@ async def delete_chunk(chunk_id: str, mongo_db: Database = None) -> int:
     result = await collection.delete_one({"chunkId": chunk_id})
     return result.deleted_count
 
+# Function to delete many chunks by chunkId.
+async def delete_chunks(chunk_ids: List[str], mongo_db: Database = None) -> int:
+    """
+    Delete all chunks whose chunkId is in chunk_ids.
+    Returns the number of documents deleted.
+    """
+    if not chunk_ids:
+        return 0
+    collection = _get_collection(mongo_db, "chunks")
+    result = await collection.delete_many({"chunkId": {"$in": list(chunk_ids)}})
+    return result.deleted_count
+
 
 # ----------------------------------'
 # INGESTION STATUS CRUD
@@ -227,6 +348,24 @@ async def clear_ingestion_status(
         await ingestion_collection.delete_many({})
 
 
+# ----------------------------------
+# EMBEDDING CHECKPOINTS CRUD
+# ----------------------------------
+async def get_embedding_checkpoint(name: str, mongo_db: Database = None) -> Optional[ObjectId]:
+    """_id of the last chunk the embedding run `name` stored, or None."""
+    collection = _get_collection(mongo_db, "embedding_checkpoints")
+    doc = await collection.find_one({"_id": name})
+    return doc["last_id"] if doc else None
+
+
+async def save_embedding_checkpoint(name: str, last_id: ObjectId, mongo_db: Database = None) -> None:
+    """Record the last chunk _id stored by the embedding run `name`."""
+    collection = _get_collection(mongo_db, "embedding_checkpoints")
+    await collection.update_one(
+        {"_id": name}, {"$set": {"last_id": last_id, "updated_at": time.time()}}, upsert=True
+    )
+
+
 # ----------------------------------'
 # SYMBOLS CRUD
 # ----------------------------------
@@ -253,6 +392,14 @@ async def get_all_symbols(mongo_db: Database = None) -> List[dict]:
         results.append(doc)
     return results
 
+async def replace_symbols_index(symbols: List[dict], mongo_db: Database = None) -> int:
+    """Replace the symbols collection with `symbols` in a single bulk_write.
+    Returns the number of symbol documents written."""
+    symbols_collection = _get_collection(mongo_db, "symbols")
+    requests = [DeleteMany({})] + [InsertOne(doc) for doc in symbols]
+    result = await symbols_collection.bulk_write(requests, ordered=True)
+    return result.inserted_count
+
 async def clear_symbols_index(mongo_db: Database = None) -> None:
         """
         clear these collections after a function scope is processed
@@ -263,6 +410,58 @@ async def clear_symbols_index(mongo_db: Database = None) -> None:
         await symbols_collection.delete_many({})
 
 
+# ----------------------------------
+# FILE MANIFEST CRUD
+# ----------------------------------
+async def get_file_manifest(repo: str, mongo_db: Database = None) -> dict:
+    """
+    Return {rel_path: {"hash", "chunkIds", "symbols", "calls", "settings"}} for every
+    ingested file of a repo. settings is None for entries written before it was recorded.
+    """
+    manifest_collection = _get_collection(mongo_db, "file_manifests")
+    manifest = {}
+    async for doc in manifest_collection.find({"repo": repo}, {"_id": 0}):
+        manifest[doc["path"]] = {
+            "hash": doc["hash"],
+            "chunkIds": doc.get("chunkIds", []),
+            "symbols": doc.get("symbols", []),
+            "calls": doc.get("calls", []),
+            "settings": doc.get("settings"),
+        }
+    return manifest
+
+async def write_file_manifest(
+    repo: str,
+    entries: dict,
+    removed: List[str] = (),
+    replace: bool = False,
+    mongo_db: Database = None,
+) -> None:
+    """
+    Record {rel_path: {"hash": ..., "chunkIds": [...], ...}} for a repo in one bulk_write;
+    the optional "symbols", "calls" and "settings" of an entry are stored too.
+    removed: paths to drop from the manifest.
+    replace: drop every existing entry of the repo first.
+    """
+    manifest_collection = _get_collection(mongo_db, "file_manifests")
+    requests = [DeleteMany({"repo": repo})] if replace else []
+    requests += [DeleteOne({"repo": repo, "path": path}) for path in removed]
+    requests += [
+        UpdateOne(
+            {"repo": repo, "path": path},
+            {"$set": {
+                "hash": entry["hash"],
+                "chunkIds": list(entry["chunkIds"]),
+                **{key: entry[key] for key in ("symbols", "calls", "settings") if key in entry},
+            }},
+            upsert=True,
+        )
+        for path, entry in entries.items()
+    ]
+    if requests:
+        await manifest_collection.bulk_write(requests, ordered=True)
+
+
 # ----------------------------------
 # CHAT MESSAGES CRUD
 # ----------------------------------
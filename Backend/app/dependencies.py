@@ -1,9 +1,16 @@
+from typing import Optional
 from fastapi import Request, Depends, HTTPException
 from pymongo import AsyncMongoClient
 from pymongo.database import Database
 from sentence_transformers import SentenceTransformer
 from qdrant_client import AsyncQdrantClient
+from app.core.chunker.sizing import TokenSizer
 from app.core.clients.llm_clients import LLMClient
+from app.rag.embedding.worker import EmbeddingWorker
+from app.rag.retriever.query_cache import QueryEmbeddingCache
+from app.rag.embedding.batcher import EmbeddingBatcher
+from app.rag.retriever.vector_store import VectorStore
+from app.rag.retriever.lexical import LexicalIndex
 from app.repositories.chunk_repository import ChunkRepository
 from app.services.chunk_annotation_service import ChunkAnnotationService
 from app.services.key_management_service import KMS
@@ -25,11 +32,41 @@ def get_embedding_model_dep(request: Request) -> SentenceTransformer:
     return request.app.state.embedding_model
 
 
+def get_token_sizer_dep(request: Request) -> TokenSizer:
+    """Return the TokenSizer built for the embedding model at startup."""
+    return request.app.state.token_sizer
+
+
 def get_qdrant_client_dep(request: Request) -> AsyncQdrantClient:
     """Return Qdrant client stored in app.state"""
     return request.app.state.qdrant_client
 
 
+def get_embedding_worker_dep(request: Request) -> Optional[EmbeddingWorker]:
+    """Return the background embedding worker, or None when it is disabled."""
+    return getattr(request.app.state, "embedding_worker", None)
+
+
+def get_query_cache_dep(request: Request) -> Optional[QueryEmbeddingCache]:
+    """Return the query embedding cache shared by all retrievers, if configured."""
+    return getattr(request.app.state, "query_cache", None)
+
+
+def get_query_batcher_dep(request: Request) -> Optional[EmbeddingBatcher]:
+    """Return the micro-batcher for query embeddings, if configured."""
+    return getattr(request.app.state, "query_batcher", None)
+
+
+def get_vector_store_dep(request: Request) -> Optional[VectorStore]:
+    """Return the configured vector store, or None for the Qdrant collection."""
+    return getattr(request.app.state, "vector_store", None)
+
+
+def get_lexical_index_dep(request: Request) -> Optional[LexicalIndex]:
+    """Return the BM25 index used for hybrid retrieval, or None when it is disabled."""
+    return getattr(request.app.state, "lexical_index", None)
+
+
 def get_llm_provider_dep(request: Request) -> LLMClient:
     """Return default LLM provider stored in app.state"""
     return request.app.state.default_llm_provider
@@ -1,4 +1,5 @@
 ﻿from fastapi import FastAPI, Request, Response
+import asyncio
 import time
 import os
 from loguru import logger
@@ -10,6 +11,14 @@ from pymongo.errors import PyMongoError
 from dotenv import load_dotenv
 from sentence_transformers import SentenceTransformer
 from app.rag.embedding.metadata_index import setup_metadata_indexes, create_collection_if_not_exists
+from app.rag.embedding.worker import EmbeddingWorker
+from app.core.chunker.sizing import TokenSizer
+from app.rag.embedding.cache import CachedEmbeddingModel, EmbeddingCache, model_cache_name, uncached
+from app.core.repo_ingestion.config import CACHE_DIR
+from app.rag.retriever.query_cache import QueryEmbeddingCache
+from app.rag.embedding.batcher import EmbeddingBatcher
+from app.rag.retriever.vector_store import NumpyVectorStore
+from app.rag.retriever.lexical import LexicalIndex
 from qdrant_client import AsyncQdrantClient
 from qdrant_client.http.models import VectorParams, Distance
 from app.db.users import seed_admin
@@ -61,25 +70,83 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     qdrant_port = int(os.getenv("QDRANT_PORT", 6333))
     collection_name = os.getenv("COLLECTION_NAME")
 
-    if not qdrant_host or not collection_name:
-        raise RuntimeError("QDRANT_HOST and COLLECTION_NAME must be set in .env")
-
-    if isinstance(qdrant_host, str) and qdrant_host.startswith(("http://", "https://")):
-        app.state.qdrant_client = AsyncQdrantClient(url=qdrant_host)
+    # VECTOR_STORE=numpy keeps the vectors in-process (no Qdrant server); the store
+    # then also takes the upserts and deletes that would go to the Qdrant client
+    app.state.vector_store = None
+    if os.getenv("VECTOR_STORE", "qdrant").lower() == "numpy":
+        if not collection_name:
+            raise RuntimeError("COLLECTION_NAME must be set in .env")
+        vector_store_path = os.getenv("VECTOR_STORE_PATH") or os.path.join(CACHE_DIR, "vectors", collection_name)
+        app.state.vector_store = NumpyVectorStore(
+            vector_store_path, quantize=os.getenv("VECTOR_STORE_QUANTIZE", "false").lower() in ("1", "true", "yes")
+        )
+        app.state.qdrant_client = app.state.vector_store
+        logger.info(f"Using the in-process vector store at {vector_store_path} ({len(app.state.vector_store)} vectors)")
     else:
-        app.state.qdrant_client = AsyncQdrantClient(host=qdrant_host, port=qdrant_port)
-    # Setup metadata indexes (optional, non-blocking)
-    try:
-        await setup_metadata_indexes(app.state.qdrant_client, collection_name)
-        logger.info("Metadata indexes setup completed")
-    except Exception as e:
-        logger.warning(f"Metadata index setup skipped or failed: {e}")
+        if not qdrant_host or not collection_name:
+            raise RuntimeError("QDRANT_HOST and COLLECTION_NAME must be set in .env")
+
+        if isinstance(qdrant_host, str) and qdrant_host.startswith(("http://", "https://")):
+            app.state.qdrant_client = AsyncQdrantClient(url=qdrant_host)
+        else:
+            app.state.qdrant_client = AsyncQdrantClient(host=qdrant_host, port=qdrant_port)
+        # Setup metadata indexes (optional, non-blocking)
+        try:
+            await setup_metadata_indexes(app.state.qdrant_client, collection_name)
+            logger.info("Metadata indexes setup completed")
+        except Exception as e:
+            logger.warning(f"Metadata index setup skipped or failed: {e}")
 
 
     # === Embedding Model Setup ===
     app.state.embedding_model = SentenceTransformer("all-MiniLM-L6-v2")
+    # token-budgeted chunking counts with its own copy of the model's tokenizer
+    app.state.token_sizer = TokenSizer.from_model(app.state.embedding_model)
+    app.state.embedding_cache = None
+    if os.getenv("EMBEDDING_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"):
+        cache_path = os.getenv("EMBEDDING_CACHE_PATH") or os.path.join(CACHE_DIR, "embeddings.sqlite3")
+        app.state.embedding_cache = EmbeddingCache(
+            cache_path, model_cache_name(app.state.embedding_model, "all-MiniLM-L6-v2")
+        )
+        app.state.embedding_model = CachedEmbeddingModel(app.state.embedding_model, app.state.embedding_cache)
+        logger.info(f"Embedding cache at {cache_path} ({len(app.state.embedding_cache)} entries)")
     logger.info("Embedding model loaded and ready")
 
+    # shared by the per-request retrievers; repeated questions skip the encoder
+    app.state.query_cache = QueryEmbeddingCache(
+        max_size=int(os.getenv("QUERY_CACHE_SIZE", 1024)),
+        ttl=float(os.getenv("QUERY_CACHE_TTL", 3600)),
+    )
+    # concurrent queries are encoded together instead of one thread each
+    app.state.query_batcher = EmbeddingBatcher(
+        uncached(app.state.embedding_model),
+        max_batch=int(os.getenv("QUERY_BATCH_MAX_SIZE", 32)),
+        max_wait_ms=float(os.getenv("QUERY_BATCH_MAX_WAIT_MS", 5)),
+    )
+
+    # === Hybrid Retrieval ===
+    # BM25 over chunk text and symbols, fused with the dense results; kept in step in the background
+    app.state.lexical_index = None
+    app.state.lexical_sync = None
+    if os.getenv("HYBRID_SEARCH", "true").lower() in ("1", "true", "yes"):
+        app.state.lexical_index = LexicalIndex()
+        app.state.lexical_sync = asyncio.create_task(
+            app.state.lexical_index.run(app.state.mongo_db, float(os.getenv("LEXICAL_SYNC_INTERVAL", 30)))
+        )
+
+    # === Background Embedding Worker ===
+    app.state.embedding_worker = None
+    if os.getenv("EMBEDDING_WORKER_ENABLED", "true").lower() in ("1", "true", "yes"):
+        app.state.embedding_worker = EmbeddingWorker(
+            collection_name,
+            app.state.mongo_db,
+            app.state.embedding_model,
+            app.state.qdrant_client,
+            batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 50)),
+            poll_interval=float(os.getenv("EMBEDDING_POLL_INTERVAL", 5)),
+        )
+        app.state.embedding_worker.start()
+
     # === LLM Provider Setup ===
     app.state.default_llm_provider = LLMClientFactory.create_default_client()
     logger.info(
@@ -101,6 +168,22 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
     yield  # -----> Application runs here
 
     # === Shutdown cleanup ===
+    # finish the batches in flight while the clients are still open
+    if app.state.embedding_worker is not None:
+        try:
+            await app.state.embedding_worker.stop()
+        except Exception:
+            logger.exception("Error stopping embedding worker during shutdown")
+
+    await app.state.query_batcher.stop()
+
+    if app.state.lexical_sync is not None:
+        app.state.lexical_sync.cancel()
+        await asyncio.gather(app.state.lexical_sync, return_exceptions=True)
+
+    if app.state.embedding_cache is not None:
+        app.state.embedding_cache.close()
+
     try:
         await app.state.mongo_client.close()
         logger.info("MongoDB client closed")
@@ -108,6 +191,7 @@ async def lifespan(app: FastAPI) -> AsyncIterator[None]:
         logger.exception("Error closing MongoDB client during shutdown")
 
     try:
+        # saves the index when it is the in-process vector store
         await app.state.qdrant_client.close()
         logger.info("Qdrant client closed")
     except Exception:
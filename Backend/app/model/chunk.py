@@ -25,6 +25,10 @@ class ChunkSchema(BaseModel):
     section: Optional[List[str]] = None
     file: Optional[List[str]] = None
     version: Optional[str] = None
+    # symbols defined in the chunk and their call-graph neighbours in other chunks
+    symbols: Optional[List[str]] = None
+    calls: Optional[List[str]] = None
+    called_by: Optional[List[str]] = None
 
     # Documentation-specific fields
     url: Optional[str] = None
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Deque, Dict, List, Optional, Tuple
+from loguru import logger
+
+# latency samples kept for the percentiles
+LATENCY_SAMPLES = 1000
+
+
+def _size_bucket(size: int) -> str:
+    """Power-of-two histogram bucket: 1, 2, 3-4, 5-8, ..."""
+    if size <= 2:
+        return str(size)
+    upper = 1 << (size - 1).bit_length()
+    return f"{upper // 2 + 1}-{upper}"
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding calls into batched encodes.
+    embed() queues the text and waits; one collector takes the first queued
+    text, gathers more for up to max_wait_ms or until max_batch texts, and
+    encodes them in one model.encode call on its own thread. While a batch
+    is encoding new texts queue up, so under load batches grow by themselves
+    and at most one encode runs at a time instead of one thread per request.
+    """
+
+    def __init__(self, model, max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self._queue: "asyncio.Queue[Tuple[str, asyncio.Future, float]]" = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="query-embedding")
+        self._collector: Optional[asyncio.Task] = None
+
+        self._latencies: Deque[float] = deque(maxlen=LATENCY_SAMPLES)
+        self._batch_sizes: Counter = Counter()
+        self.batches = 0
+        self.texts = 0
+
+    async def embed(self, text: str) -> List[float]:
+        if self._collector is None or self._collector.done():
+            self._collector = asyncio.create_task(self._collect(), name="query-embedding-batcher")
+        future = asyncio.get_running_loop().create_future()
+        started = time.perf_counter()
+        await self._queue.put((text, future, started))
+        embedding = await future
+        self._latencies.append(time.perf_counter() - started)
+        return embedding
+
+    async def stop(self) -> None:
+        if self._collector is not None:
+            self._collector.cancel()
+            await asyncio.gather(self._collector, return_exceptions=True)
+            self._collector = None
+        while not self._queue.empty():
+            _, future, _ = self._queue.get_nowait()
+            if not future.done():
+                future.set_exception(RuntimeError("Embedding batcher stopped"))
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        latencies = sorted(self._latencies)
+        return {
+            "batches": self.batches,
+            "texts": self.texts,
+            "mean_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+            "batch_sizes": dict(sorted(self._batch_sizes.items(), key=lambda item: int(item[0].split("-")[0]))),
+            "latency_ms": {
+                "p50": round(_percentile(latencies, 0.50) * 1000, 2),
+                "p99": round(_percentile(latencies, 0.99) * 1000, 2),
+                "samples": len(latencies),
+            },
+        }
+
+    async def _collect(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[Tuple[str, asyncio.Future, float]] = []
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                deadline = loop.time() + self.max_wait
+                while len(batch) < self.max_batch:
+                    # whatever queued up while the last batch encoded goes in without waiting
+                    if not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                        continue
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                await self._encode(batch)
+        finally:
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(RuntimeError("Embedding batcher stopped"))
+
+    async def _encode(self, batch: List[Tuple[str, asyncio.Future, float]]) -> None:
+        # identical questions in one batch are encoded once
+        texts = list(dict.fromkeys(text for text, _, _ in batch))
+        try:
+            vectors = await asyncio.get_running_loop().run_in_executor(self._executor, self.model.encode, texts)
+        except Exception as e:
+            logger.error(f"Query embedding batch of {len(texts)} failed: {e}")
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        by_text = {text: vector.tolist() for text, vector in zip(texts, vectors)}
+        for text, future, _ in batch:
+            if not future.done():
+                future.set_result(by_text[text])
+        self.batches += 1
+        self.texts += len(batch)
+        self._batch_sizes[_size_bucket(len(batch))] += 1
@@ -0,0 +1,144 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, Sequence
+import numpy as np
+from loguru import logger
+
+# SQLite allows at most 999 bound parameters on older builds
+_LOOKUP_SLICE = 500
+
+
+def normalize_text(text: str) -> str:
+    """
+    Text as the cache sees it: line endings unified and trailing and outer
+    whitespace dropped. The word-piece tokenizer splits on whitespace, so the
+    model embeds both forms identically.
+    """
+    lines = text.replace("\r\n", "\n").replace("\r", "\n").split("\n")
+    return "\n".join(line.rstrip() for line in lines).strip()
+
+
+def text_key(text: str) -> bytes:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    """
+    Persistent map from (model, normalized text hash) to its embedding, in SQLite.
+    Vectors are stored as float32 bytes. Chunk ids are content hashes too, but
+    the same text gets a new id under another path, so the text is keyed
+    directly. Safe to use from several threads; each call holds a lock.
+    """
+
+    def __init__(self, path: str, model_name: str):
+        self.path = path
+        self.model_name = model_name
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                " model TEXT NOT NULL, key BLOB NOT NULL, vector BLOB NOT NULL,"
+                " PRIMARY KEY (model, key)) WITHOUT ROWID"
+            )
+        self.hits = 0
+        self.misses = 0
+
+    def get_many(self, keys: Sequence[bytes]) -> Dict[bytes, np.ndarray]:
+        found: Dict[bytes, np.ndarray] = {}
+        unique = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(unique), _LOOKUP_SLICE):
+                part = unique[start:start + _LOOKUP_SLICE]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({','.join('?' * len(part))})",
+                    [self.model_name, *part],
+                )
+                for key, vector in rows:
+                    found[key] = np.frombuffer(vector, dtype=np.float32)
+        return found
+
+    def put_many(self, items: Dict[bytes, np.ndarray]) -> None:
+        if not items:
+            return
+        rows = [(self.model_name, key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR IGNORE INTO embeddings (model, key, vector) VALUES (?, ?, ?)", rows)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings WHERE model = ?", (self.model_name,)).fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        return {"entries": len(self), "hits": self.hits, "misses": self.misses}
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddingModel:
+    """
+    Embedding model that consults an EmbeddingCache before encoding.
+    Only texts missing from the cache (each once, even if repeated in the
+    batch) reach the model; the rest costs a lookup. Everything else,
+    e.g. tokenizer and max_seq_length, is the wrapped model's.
+    Meant for chunk texts: user queries would grow the cache without bound,
+    so query embedding goes through uncached() (repeats hit the in-memory
+    QueryEmbeddingCache instead).
+    """
+
+    def __init__(self, model: Any, cache: EmbeddingCache):
+        self.model = model
+        self.cache = cache
+
+    def encode(self, sentences, **kwargs):
+        # options such as normalize_embeddings change the vectors; do not mix them into the cache
+        if kwargs or isinstance(sentences, str):
+            return self.model.encode(sentences, **kwargs)
+
+        keys = [text_key(text) for text in sentences]
+        try:
+            found = self.cache.get_many(keys)
+        except sqlite3.Error as e:
+            logger.warning(f"Embedding cache lookup failed, encoding without it: {e}")
+            return self.model.encode(sentences)
+        missing: Dict[bytes, str] = {}
+        for key, text in zip(keys, sentences):
+            if key not in found:
+                missing.setdefault(key, text)
+        self.cache.hits += len(keys) - sum(1 for key in keys if key in missing)
+        self.cache.misses += len(missing)
+
+        if missing:
+            vectors = self.model.encode(list(missing.values()))
+            encoded = {key: np.asarray(vector, dtype=np.float32) for key, vector in zip(missing, vectors)}
+            try:
+                self.cache.put_many(encoded)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not write to the embedding cache: {e}")
+            found.update(encoded)
+        if not keys:
+            return np.empty((0, 0), dtype=np.float32)
+        return np.stack([found[key] for key in keys])
+
+    def __getattr__(self, name: str):
+        return getattr(self.model, name)
+
+
+def uncached(model: Any) -> Any:
+    """The model itself, without a CachedEmbeddingModel around it."""
+    return model.model if isinstance(model, CachedEmbeddingModel) else model
+
+
+def model_cache_name(model: Any, fallback: str) -> str:
+    """Name the cache entries of a model by its weights and embedding size."""
+    name = getattr(getattr(model, "tokenizer", None), "name_or_path", None) or fallback
+    dim = getattr(model, "get_sentence_embedding_dimension", lambda: None)()
+    return f"{name}@{dim}" if dim else name
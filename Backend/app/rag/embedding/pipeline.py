@@ -1,52 +1,93 @@
 import asyncio
 import uuid
+from typing import List
 from qdrant_client.models import PointStruct
-from app.db.db import get_chunks, update_embedding_status
+from app.db.db import LINK_FIELDS, mark_embedding_skipped, unembedded_chunks_cursor, update_embedding_status
 from loguru import logger
 
-async def embedding_pipeline(collection_name, mongo_db, model, qdrant, batch_size: int = 50):
-    """Runs the full embedding pipeline."""
-    chunks = await get_chunks({"isEmbedded": False}, limit=batch_size, mongo_db=mongo_db)
-    if not chunks:
-        logger.info("No new chunks to embed.")
-        return 0
+PAYLOAD_KEYS = ["project", "repo", "file", "section", "version", "source", "symbols", "calls", "called_by"]
 
-    texts, ids, valid_chunks = [], [], []
-    for chunk in chunks:
-        if "chunk" not in chunk or "chunkId" not in chunk:
-            continue
-        texts.append(chunk["chunk"])
-        ids.append(str(uuid.uuid5(uuid.NAMESPACE_OID, chunk["chunkId"])))
-        valid_chunks.append(chunk)
-    if not valid_chunks:
-        logger.info("No valid chunks to embed in this batch.")
-        return 0
+def chunk_point_id(chunk_id: str) -> str:
+    """Qdrant point id for a chunk."""
+    return str(uuid.uuid5(uuid.NAMESPACE_OID, chunk_id))
+
+def valid_chunks(chunks: List[dict]) -> List[dict]:
+    """Chunks that carry both the text and the chunkId needed to embed them."""
+    return [chunk for chunk in chunks if "chunk" in chunk and "chunkId" in chunk]
+
+async def skip_invalid_chunks(chunks: List[dict], mongo_db) -> List[dict]:
+    """
+    Return the valid chunks and flag the others embeddingSkipped, so that
+    they are not read (and counted as pending) again.
+    """
+    valid = valid_chunks(chunks)
+    if len(valid) < len(chunks):
+        invalid = [chunk["_id"] for chunk in chunks if "chunk" not in chunk or "chunkId" not in chunk]
+        await mark_embedding_skipped(invalid, "missing chunk or chunkId", mongo_db)
+        logger.warning(f"Skipped {len(invalid)} chunks without text or chunkId: {invalid[:5]}")
+    return valid
 
-    embeddings = await asyncio.to_thread(model.encode, texts)
+async def encode_chunks(model, chunks: List[dict]):
+    """Embed the chunk texts in a worker thread, so the event loop keeps serving requests."""
+    return await asyncio.to_thread(model.encode, [chunk["chunk"] for chunk in chunks])
 
+async def store_embeddings(collection_name, mongo_db, qdrant, chunks: List[dict], embeddings) -> int:
+    """Upsert the vectors into Qdrant, then mark the chunks embedded in MongoDB."""
     points = [
         PointStruct(
-            id=ids[i],
-            vector=embeddings[i].tolist(),
+            id=chunk_point_id(chunk["chunkId"]),
+            vector=embedding.tolist(),
             payload={
-                **{k: valid_chunks[i].get(k) for k in ["project", "repo", "file", "section", "version", "source"]},
-                "original_chunkId": valid_chunks[i].get("chunkId"),
-                "chunk": valid_chunks[i].get("chunk", "")
+                **{k: chunk.get(k) for k in PAYLOAD_KEYS},
+                "original_chunkId": chunk.get("chunkId"),
+                "chunk": chunk.get("chunk", "")
             }
         )
-        for i in range(len(valid_chunks))
+        for chunk, embedding in zip(chunks, embeddings)
     ]
 
     await qdrant.upsert(collection_name=collection_name, points=points)
 
     # Batch update MongoDB - much more efficient than individual updates
-    chunk_ids = [chunk["chunkId"] for chunk in valid_chunks]
+    chunk_ids = [chunk["chunkId"] for chunk in chunks]
     updated_count = await update_embedding_status(chunk_ids, True, mongo_db)
 
-
     logger.info(f"Inserted {len(points)} embeddings and updated {updated_count} chunks in MongoDB.")
-    return len(valid_chunks)
+    return updated_count
+
+async def update_point_links(collection_name, qdrant, chunks: List[dict]) -> None:
+    """
+    Copy the symbols/calls/called_by of already embedded chunks into their
+    Qdrant payloads (insert_chunks re-links existing chunks only in MongoDB).
+    """
+    await asyncio.gather(*(
+        qdrant.set_payload(
+            collection_name=collection_name,
+            payload={field: chunk.get(field) for field in LINK_FIELDS},
+            points=[chunk_point_id(chunk["chunkId"])],
+        )
+        for chunk in chunks
+    ))
+    if chunks:
+        logger.info(f"Updated the symbol links of {len(chunks)} Qdrant points")
+
+async def embedding_pipeline(collection_name, mongo_db, model, qdrant, batch_size: int = 50):
+    """Runs the full embedding pipeline."""
+    chunks = await unembedded_chunks_cursor(batch_size=batch_size, mongo_db=mongo_db).to_list(batch_size)
+    if not chunks:
+        logger.info("No new chunks to embed.")
+        return 0
+
+    chunks = await skip_invalid_chunks(chunks, mongo_db)
+    if not chunks:
+        logger.info("No valid chunks to embed in this batch.")
+        return 0
+
+    embeddings = await encode_chunks(model, chunks)
+    await store_embeddings(collection_name, mongo_db, qdrant, chunks, embeddings)
+    return len(chunks)
+
 async def embedding_user_input(model, user_input: str):
     """Embeds and inserts a single user input."""
     embedding = await asyncio.to_thread(model.encode, [user_input])
-    return embedding[0].tolist()
\ No newline at end of file
+    return embedding[0].tolist()
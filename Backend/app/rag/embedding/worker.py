@@ -0,0 +1,329 @@
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+from loguru import logger
+from app.db.db import (
+    UNEMBEDDED_QUERY,
+    count_chunks,
+    get_embedding_checkpoint,
+    save_embedding_checkpoint,
+    unembedded_chunks_cursor,
+)
+from app.rag.embedding.cache import CachedEmbeddingModel
+from app.rag.embedding.pipeline import encode_chunks, skip_invalid_chunks, store_embeddings
+
+# window the reported throughput is averaged over, in seconds
+THROUGHPUT_WINDOW = 60.0
+# longest pause after repeated failures, in seconds
+MAX_BACKOFF = 300.0
+# encode time per batch the adaptive batch size aims for, in seconds
+TARGET_ENCODE_SECONDS = 1.0
+
+# marks the end of the stream between stages
+_DONE = None
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size steered towards a target encode time per batch.
+    Short batches waste the overlap on per-batch overhead (a Mongo round
+    trip, an upsert request); long ones make the store stage idle while the
+    model runs. After each encode the size is moved towards
+    target_seconds / seconds_per_chunk, smoothed and by at most a factor of
+    two per step, so one slow batch does not swing it.
+    """
+
+    def __init__(self, initial: int, target_seconds: float = TARGET_ENCODE_SECONDS,
+                 minimum: int = 8, maximum: int = 512, smoothing: float = 0.5):
+        self.minimum = max(1, min(minimum, initial))
+        self.maximum = max(maximum, initial)
+        self.target_seconds = target_seconds
+        self.smoothing = smoothing
+        self.size = initial
+
+    def observe(self, chunks: int, seconds: float) -> int:
+        if chunks and seconds > 0 and self.target_seconds:
+            ideal = self.target_seconds * chunks / seconds
+            ideal = min(max(ideal, self.size / 2), self.size * 2)
+            blended = self.smoothing * ideal + (1 - self.smoothing) * self.size
+            self.size = int(min(max(round(blended), self.minimum), self.maximum))
+        return self.size
+
+
+class EmbeddingWorker:
+    """
+    Long-running embedder for chunks with isEmbedded False.
+    Three stages run concurrently, joined by bounded queues so that at most
+    queue_size batches wait between two stages:
+    read (MongoDB) -> encode (model, in a thread) -> store (Qdrant upsert, then
+    isEmbedded is set). While a batch is encoded the next one is being read and
+    the previous one stored. When nothing is pending the reader sleeps for
+    poll_interval, or until notify() is called, e.g. after an ingest.
+    A failing batch is logged and left unembedded; it is picked up again after
+    a backoff that grows with consecutive failures, so the worker never dies.
+    The batch size adapts to the observed encode time (see AdaptiveBatchSize)
+    unless target_encode_seconds is None.
+    run_until_empty() runs the same stages once over the current backlog.
+    """
+
+    def __init__(
+        self,
+        collection_name: str,
+        mongo_db,
+        model,
+        qdrant,
+        batch_size: int = 50,
+        poll_interval: float = 5.0,
+        queue_size: int = 2,
+        target_encode_seconds: Optional[float] = TARGET_ENCODE_SECONDS,
+        max_batch_size: int = 512,
+    ):
+        self.collection_name = collection_name
+        self.mongo_db = mongo_db
+        self.model = model
+        self.qdrant = qdrant
+        self.batch_size = AdaptiveBatchSize(batch_size, target_encode_seconds, maximum=max_batch_size)
+        self.poll_interval = poll_interval
+        self.queue_size = queue_size
+
+        self._encode_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._store_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        # chunkIds read but not yet stored, kept out of the next reads
+        self._in_flight: Set[str] = set()
+        # chunkIds of failed batches, skipped for the rest of a run_until_empty
+        self._skipped: Set[str] = set()
+        self._until_empty = False
+        self._wake = asyncio.Event()
+        self._stopping = False
+        self._tasks: List[asyncio.Task] = []
+
+        self.started_at: Optional[float] = None
+        self.embedded = 0
+        self.batches = 0
+        self.failed_batches = 0
+        self.consecutive_failures = 0
+        self.last_batch_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._recent: Deque[Tuple[float, int]] = deque()
+
+    @property
+    def running(self) -> bool:
+        return any(not task.done() for task in self._tasks)
+
+    def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = False
+        self._until_empty = False
+        self.started_at = time.time()
+        self._tasks = [
+            asyncio.create_task(self._read(), name="embedding-reader"),
+            asyncio.create_task(self._encode(), name="embedding-encoder"),
+            asyncio.create_task(self._store(), name="embedding-store"),
+        ]
+        logger.info(f"Embedding worker started (batch size {self.batch_size.size}, poll every {self.poll_interval}s)")
+
+    async def run_until_empty(self) -> int:
+        """
+        Embed the chunks pending now through the same overlapped stages and
+        return how many were embedded. Failed batches are not retried; they
+        are counted in failed_batches and stay unembedded.
+        """
+        if self.running:
+            raise RuntimeError("Embedding worker is already running")
+        self.start()
+        self._until_empty = True
+        embedded_before = self.embedded
+        try:
+            await asyncio.gather(*self._tasks)
+        finally:
+            self._tasks = []
+            self._skipped.clear()
+        return self.embedded - embedded_before
+
+    def notify(self) -> None:
+        """Look for pending chunks now instead of at the next poll."""
+        self._wake.set()
+
+    async def stop(self, timeout: float = 30.0) -> None:
+        """
+        Stop reading and let the batches already read finish, waiting at most
+        timeout seconds before cancelling. Unfinished chunks stay unembedded.
+        """
+        if not self._tasks:
+            return
+        self._stopping = True
+        self._wake.set()
+        done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if pending:
+            logger.warning(f"Embedding worker cancelled with {len(self._in_flight)} chunks in flight")
+        self._tasks = []
+        logger.info(f"Embedding worker stopped after embedding {self.embedded} chunks")
+
+    async def status(self) -> Dict[str, Any]:
+        """Progress and throughput, including how many chunks are still pending."""
+        now = time.time()
+        self._trim_recent(now)
+        window = min(THROUGHPUT_WINDOW, now - self.started_at) if self.started_at else 0
+        uptime = now - self.started_at if self.started_at else 0
+        try:
+            pending = await count_chunks(UNEMBEDDED_QUERY, self.mongo_db)
+        except Exception as e:
+            logger.warning(f"Could not count pending chunks: {e}")
+            pending = None
+        return {
+            "running": self.running,
+            "pending": pending,
+            "in_flight": len(self._in_flight),
+            "embedded": self.embedded,
+            "batches": self.batches,
+            "batch_size": self.batch_size.size,
+            "failed_batches": self.failed_batches,
+            "chunks_per_second": round(sum(n for _, n in self._recent) / window, 2) if window > 0 else 0.0,
+            "average_chunks_per_second": round(self.embedded / uptime, 2) if uptime > 0 else 0.0,
+            "queued_batches": {"encode": self._encode_queue.qsize(), "store": self._store_queue.qsize()},
+            "started_at": self.started_at,
+            "last_batch_at": self.last_batch_at,
+            "last_error": self.last_error,
+            "cache": self.model.cache.stats() if isinstance(self.model, CachedEmbeddingModel) else None,
+        }
+
+    # ---- stages
+
+    async def _read(self) -> None:
+        """
+        Walk the unembedded chunks with one cursor in _id order, starting at
+        the saved checkpoint. When the cursor runs out, one pass from the
+        start picks up chunks behind the checkpoint (failed batches, chunks
+        reset to unembedded); only when that pass is empty too does the
+        reader wait for new chunks.
+        """
+        cursor = None
+        position = await self._load_checkpoint()
+        try:
+            while not self._stopping:
+                if self.consecutive_failures and not self._until_empty:
+                    await self._sleep(min(self.poll_interval * 2 ** self.consecutive_failures, MAX_BACKOFF))
+                    if self._stopping:
+                        break
+                try:
+                    if cursor is None:
+                        cursor = unembedded_chunks_cursor(
+                            after=position,
+                            exclude_chunk_ids=self._in_flight | self._skipped,
+                            batch_size=self.batch_size.size,
+                            mongo_db=self.mongo_db,
+                        )
+                        cursor_start = position
+                    read = await cursor.to_list(self.batch_size.size)
+                    chunks = await skip_invalid_chunks(read, self.mongo_db)
+                except Exception as e:
+                    logger.exception(f"Embedding worker could not read chunks: {e}")
+                    self.last_error = str(e)
+                    cursor = await self._close(cursor)
+                    if self._until_empty:
+                        raise
+                    await self._sleep(self.poll_interval)
+                    continue
+
+                if not read:
+                    cursor = await self._close(cursor)
+                    if cursor_start is not None:
+                        position = None
+                        continue
+                    if self._until_empty:
+                        break
+                    await self._sleep(self.poll_interval)
+                    continue
+                position = read[-1]["_id"]
+                if not chunks:
+                    continue
+                self._in_flight.update(chunk["chunkId"] for chunk in chunks)
+                await self._encode_queue.put(chunks)
+        finally:
+            await self._close(cursor)
+            await self._encode_queue.put(_DONE)
+
+    async def _encode(self) -> None:
+        try:
+            while (chunks := await self._encode_queue.get()) is not _DONE:
+                started = time.perf_counter()
+                try:
+                    embeddings = await encode_chunks(self.model, chunks)
+                except Exception as e:
+                    self._failed(chunks, e)
+                    continue
+                self.batch_size.observe(len(chunks), time.perf_counter() - started)
+                await self._store_queue.put((chunks, embeddings))
+        finally:
+            await self._store_queue.put(_DONE)
+
+    async def _store(self) -> None:
+        while (item := await self._store_queue.get()) is not _DONE:
+            chunks, embeddings = item
+            try:
+                await store_embeddings(self.collection_name, self.mongo_db, self.qdrant, chunks, embeddings)
+            except Exception as e:
+                self._failed(chunks, e)
+                continue
+            self._release(chunks)
+            # batches are stored in read order, so everything before this _id has been read
+            await self._save_checkpoint(chunks)
+            now = time.time()
+            self.embedded += len(chunks)
+            self.batches += 1
+            self.consecutive_failures = 0
+            self.last_batch_at = now
+            self._recent.append((now, len(chunks)))
+            self._trim_recent(now)
+
+    # ---- helpers
+
+    async def _load_checkpoint(self):
+        try:
+            return await get_embedding_checkpoint(self.collection_name, self.mongo_db)
+        except Exception as e:
+            logger.warning(f"Could not load the embedding checkpoint, starting from the first chunk: {e}")
+            return None
+
+    async def _save_checkpoint(self, chunks: List[dict]) -> None:
+        try:
+            await save_embedding_checkpoint(self.collection_name, chunks[-1]["_id"], self.mongo_db)
+        except Exception as e:
+            logger.warning(f"Could not save the embedding checkpoint: {e}")
+
+    @staticmethod
+    async def _close(cursor):
+        if cursor is not None:
+            try:
+                await cursor.close()
+            except Exception as e:
+                logger.debug(f"Closing the embedding cursor failed: {e}")
+        return None
+
+    async def _sleep(self, seconds: float) -> None:
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=seconds)
+        except asyncio.TimeoutError:
+            pass
+        self._wake.clear()
+
+    def _release(self, chunks: List[dict]) -> None:
+        self._in_flight.difference_update(chunk["chunkId"] for chunk in chunks)
+
+    def _failed(self, chunks: List[dict], error: Exception) -> None:
+        logger.opt(exception=error).error(f"Embedding worker failed a batch of {len(chunks)} chunks: {error}")
+        self._release(chunks)
+        if self._until_empty:
+            self._skipped.update(chunk["chunkId"] for chunk in chunks)
+        self.failed_batches += 1
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+
+    def _trim_recent(self, now: float) -> None:
+        while self._recent and self._recent[0][0] < now - THROUGHPUT_WINDOW:
+            self._recent.popleft()
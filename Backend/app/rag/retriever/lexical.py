@@ -0,0 +1,195 @@
+import asyncio
+import math
+import re
+from collections import Counter, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from loguru import logger
+from app.db.db import get_chunk_ids, iter_chunks_after
+from app.rag.embedding.pipeline import PAYLOAD_KEYS, chunk_point_id
+
+# identifiers as MeTTa writes them: get-type, assertEqual, &self, is_prime?
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_][A-Za-z0-9_\-]*")
+# camelCase / snake_case / kebab-case parts of an identifier
+_PART_RE = re.compile(r"[A-Z]?[a-z]+|[A-Z]+(?![a-z])|\d+")
+
+# fields the index reads from a chunk document
+CHUNK_FIELDS = ["_id", "chunkId", "chunk", *PAYLOAD_KEYS]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Lower-cased identifiers plus their parts, so `assertEqual` matches both
+    the exact symbol and a query for "assert equal".
+    """
+    tokens = []
+    for word in _TOKEN_RE.findall(text):
+        lower = word.lower()
+        tokens.append(lower)
+        parts = _PART_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(part.lower() for part in parts)
+    return tokens
+
+
+class BM25Index:
+    """
+    In-memory BM25 (Okapi) over chunk text. Symbol names are indexed as an
+    extra copy of their tokens, so a chunk defining a symbol outranks one
+    that only mentions it. Documents can be added and removed one at a time;
+    the collection statistics are kept up to date incrementally.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, symbol_boost: int = 2):
+        self.k1 = k1
+        self.b = b
+        self.symbol_boost = symbol_boost
+        self._postings: Dict[str, Dict[Any, int]] = defaultdict(dict)
+        self._lengths: Dict[Any, int] = {}
+        self._terms: Dict[Any, Tuple[str, ...]] = {}
+        self._docs: Dict[Any, Dict[str, Any]] = {}
+        self._total_length = 0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: Any) -> bool:
+        return doc_id in self._lengths
+
+    def add(self, doc_id: Any, text: str, symbols: Iterable[str] = (), payload: Optional[Dict[str, Any]] = None) -> None:
+        if doc_id in self._lengths:
+            self.remove(doc_id)
+        tokens = tokenize(text)
+        for symbol in symbols or ():
+            tokens.extend(tokenize(symbol) * self.symbol_boost)
+        counts = Counter(tokens)
+        for term, tf in counts.items():
+            self._postings[term][doc_id] = tf
+        self._terms[doc_id] = tuple(counts)
+        self._lengths[doc_id] = len(tokens)
+        self._total_length += len(tokens)
+        self._docs[doc_id] = payload or {}
+
+    def remove(self, doc_id: Any) -> None:
+        if doc_id not in self._lengths:
+            return
+        for term in self._terms.pop(doc_id):
+            postings = self._postings[term]
+            postings.pop(doc_id, None)
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        del self._docs[doc_id]
+
+    def payload(self, doc_id: Any) -> Dict[str, Any]:
+        return self._docs[doc_id]
+
+    def search(self, query: str, top_k: int, source: Optional[str] = None) -> List[Tuple[Any, float]]:
+        """(doc_id, score) of the best top_k documents, optionally of one `source`."""
+        return self.search_sources(query, top_k, [source])[source]
+
+    def search_sources(
+        self, query: str, top_k: int, sources: Sequence[Optional[str]]
+    ) -> Dict[Optional[str], List[Tuple[Any, float]]]:
+        """
+        search() for several sources (None = all) with the documents scored once.
+        Terms found in more than half of the documents (e.g. `fn` of every
+        `fn-N`) add little and cost a pass over most postings, so they only
+        re-rank documents that matched a rarer term, unless none did.
+        """
+        n = len(self._lengths)
+        if not n or top_k <= 0:
+            return {source: [] for source in sources}
+        avg_length = self._total_length / n or 1.0
+        terms = sorted(
+            (term for term in set(tokenize(query)) if term in self._postings),
+            key=lambda term: len(self._postings[term]),
+        )
+        scores: Dict[Any, float] = defaultdict(float)
+        for term in terms:
+            postings = self._postings[term]
+            idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+            if scores and len(postings) > n / 2:
+                docs = ((doc_id, postings[doc_id]) for doc_id in list(scores) if doc_id in postings)
+            else:
+                docs = postings.items()
+            for doc_id, tf in docs:
+                norm = self.k1 * (1 - self.b + self.b * self._lengths[doc_id] / avg_length)
+                scores[doc_id] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: (-item[1], str(item[0])))
+        results = {}
+        for source in sources:
+            if source is None:
+                results[source] = ranked[:top_k]
+            else:
+                results[source] = [item for item in ranked if self._docs[item[0]].get("source") == source][:top_k]
+        return results
+
+
+class LexicalIndex:
+    """
+    BM25Index over the chunks collection, keyed by Qdrant point id so its
+    hits line up with the dense results. sync() adds chunks inserted since
+    the last sync (by _id) and, every reconcile_every syncs, drops chunks
+    that were deleted. A chunk edited in place keeps its _id and is only
+    re-read when the index is rebuilt, e.g. on restart.
+    """
+
+    def __init__(self, index: Optional[BM25Index] = None, reconcile_every: int = 10):
+        self.index = index or BM25Index()
+        self.reconcile_every = reconcile_every
+        self._last_id = None
+        self._chunk_ids: Dict[str, Any] = {}
+        self._syncs = 0
+        self._lock = asyncio.Lock()
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    def add_chunk(self, chunk: Dict[str, Any]) -> None:
+        if "chunk" not in chunk or "chunkId" not in chunk:
+            return
+        point_id = chunk_point_id(chunk["chunkId"])
+        payload = {k: chunk.get(k) for k in PAYLOAD_KEYS}
+        payload["original_chunkId"] = chunk["chunkId"]
+        payload["chunk"] = chunk["chunk"]
+        self.index.add(point_id, chunk["chunk"], chunk.get("symbols") or (), payload)
+        self._chunk_ids[chunk["chunkId"]] = point_id
+
+    async def sync(self, mongo_db) -> int:
+        """Index the chunks added since the last sync; return how many were added."""
+        async with self._lock:
+            added = 0
+            async for chunk in iter_chunks_after(self._last_id, CHUNK_FIELDS, mongo_db):
+                self.add_chunk(chunk)
+                self._last_id = chunk["_id"]
+                added += 1
+            self._syncs += 1
+            if self._syncs % self.reconcile_every == 0:
+                present = set(await get_chunk_ids(mongo_db))
+                for chunk_id in [c for c in self._chunk_ids if c not in present]:
+                    self.index.remove(self._chunk_ids.pop(chunk_id))
+            if added:
+                logger.info(f"Lexical index: {added} chunks added, {len(self.index)} indexed")
+            return added
+
+    def search(self, query: str, categories: Sequence[str], top_k: int) -> Dict[str, List[Tuple[Any, float]]]:
+        return self.index.search_sources(query, top_k, categories)
+
+    async def run(self, mongo_db, interval: float = 30.0) -> None:
+        """Keep the index in step with the chunks collection until cancelled."""
+        while True:
+            try:
+                await self.sync(mongo_db)
+            except Exception as e:
+                logger.warning(f"Lexical index sync failed: {e}")
+            await asyncio.sleep(interval)
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[Any]], k: int = 60) -> List[Tuple[Any, float]]:
+    """Fuse ranked id lists: each id scores sum(1 / (k + rank)), rank starting at 1."""
+    scores: Dict[Any, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] += 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda item: -item[1])
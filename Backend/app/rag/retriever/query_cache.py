@@ -0,0 +1,57 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def normalize_query(query: str) -> str:
+    """Collapse whitespace; the tokenizer splits on it, so the embedding is the same."""
+    return " ".join(query.split())
+
+
+class QueryEmbeddingCache:
+    """
+    Bounded LRU of normalized query -> embedding, with an optional TTL.
+    Retrievers are built per request, so one instance lives on app.state and
+    is shared by all of them. Not thread-safe; use it from the event loop only.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = 3600.0):
+        self.max_size = max_size
+        self.ttl = ttl or None
+        self._entries: "OrderedDict[str, Tuple[float, List[float]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, query: str) -> Optional[List[float]]:
+        key = normalize_query(query)
+        entry = self._entries.get(key)
+        if entry is not None and (self.ttl is None or time.monotonic() - entry[0] < self.ttl):
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+        if entry is not None:
+            del self._entries[key]
+        self.misses += 1
+        return None
+
+    def put(self, query: str, embedding: List[float]) -> None:
+        if self.max_size <= 0:
+            return
+        key = normalize_query(query)
+        self._entries[key] = (time.monotonic(), embedding)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
@@ -1,39 +1,60 @@
+from app.rag.embedding.batcher import EmbeddingBatcher
+from app.rag.embedding.cache import uncached
 from app.rag.embedding.pipeline import embedding_user_input
 from loguru import logger
 from qdrant_client.models import ScoredPoint
+from app.rag.retriever.lexical import LexicalIndex, reciprocal_rank_fusion
+from app.rag.retriever.query_cache import QueryEmbeddingCache
 from app.rag.retriever.schema import Document
-import asyncio
-from typing import Dict, List, Tuple
+from app.rag.retriever.vector_store import QdrantVectorStore, VectorStore
+from typing import Dict, List, Optional, Tuple
 
 
 class EmbeddingRetriever:
-    def __init__(self, model, qdrant, collection_name: str):
-        self.model = model
+    def __init__(
+        self,
+        model,
+        qdrant,
+        collection_name: str,
+        query_cache: Optional[QueryEmbeddingCache] = None,
+        batched: bool = True,
+        batcher: Optional[EmbeddingBatcher] = None,
+        store: Optional[VectorStore] = None,
+        lexical: Optional[LexicalIndex] = None,
+        candidates: int = 20,
+        rrf_k: int = 60,
+    ):
+        # queries skip the persistent embedding cache; query_cache covers repeats
+        self.model = uncached(model)
         self.qdrant = qdrant
         self.collection_name = collection_name
+        self.query_cache = query_cache
+        # the Qdrant collection unless another store (e.g. NumpyVectorStore) is given
+        self.store = store or QdrantVectorStore(qdrant, collection_name, batched=batched)
+        # encodes concurrent queries together; without it each query is encoded alone
+        self.batcher = batcher
+        # with a lexical index, dense and BM25 results (candidates deep) are fused by RRF
+        self.lexical = lexical
+        self.candidates = candidates
+        self.rrf_k = rrf_k
 
-    async def _search_category(
-        self, category: str, query_embedding: List[float], top_k: int, min_score: float
-) -> Tuple[str, List[Document]]:
-        
-        """Search one category and return (category, documents)."""
-        
-        search_filter = {
-            "must": [
-                {"key": "source", "match": {"value": category}}
-            ]
-        }
-        try:
-            results: List[ScoredPoint] = await self.qdrant.search(
-                collection_name=self.collection_name,
-                query_vector=query_embedding,
-                limit=top_k,
-                query_filter=search_filter
-            )
-        except Exception as e:
-            logger.error(f"Qdrant search failed for category={category}: {e}")
-            return category, []
+    async def embed_query(self, query: str) -> List[float]:
+        """Query embedding, from the shared query cache when the question was seen before."""
+        if self.query_cache is not None:
+            cached = self.query_cache.get(query)
+            if cached is not None:
+                return cached
+        if self.batcher is not None:
+            embedding = await self.batcher.embed(query)
+        else:
+            embedding = await embedding_user_input(self.model, query)
+        if self.query_cache is not None:
+            self.query_cache.put(query, embedding)
+        return embedding
+
+    CATEGORIES = ["code", "documentation", "others"]
 
+    def _to_documents(self, category: str, results: List[ScoredPoint], min_score: float) -> List[Document]:
         documents: List[Document] = []
         for result in results:
             payload = dict(result.payload or {})
@@ -50,19 +71,52 @@ class EmbeddingRetriever:
                 continue
 
             documents.append(Document(text=chunk_text, metadata=payload))
-            logger.info(f"Retrieved {category} document from Qdrant with chunk: {chunk_text[:30]}...")
-        return category, documents
+            logger.info(f"Retrieved {category} document with chunk: {chunk_text[:30]}...")
+        return documents
 
     async def retrieve(self, query: str, top_k: int = 5, min_score: float = 0.0) -> Dict[str, List[Document]]:
-        query_embedding = await embedding_user_input(self.model, query)
-        categories = ["code", "documentation", "others"]
+        query_embedding = await self.embed_query(query)
+        if self.lexical is None:
+            results = await self.store.search_categories(query_embedding, self.CATEGORIES, top_k)
+            return {
+                category: self._to_documents(category, results.get(category, []), min_score)
+                for category in self.CATEGORIES
+            }
 
-        tasks = [
-            asyncio.create_task(self._search_category(category, query_embedding, top_k, min_score))
-            for category in categories
-        ]
+        depth = max(top_k, self.candidates)
+        results = await self.store.search_categories(query_embedding, self.CATEGORIES, depth)
+        lexical = self.lexical.search(query, self.CATEGORIES, depth)
+        return {
+            category: self._fuse(category, results.get(category, []), lexical[category], top_k, min_score)
+            for category in self.CATEGORIES
+        }
 
-        results = await asyncio.gather(*tasks)
+    def _fuse(
+        self, category: str, dense: List[ScoredPoint], lexical: List[Tuple[str, float]], top_k: int, min_score: float
+    ) -> List[Document]:
+        """
+        Reciprocal rank fusion of the dense and BM25 rankings. min_score
+        applies to the dense similarity: a point the dense side dropped for
+        it is dropped from the BM25 ranking too. _score becomes the fused
+        score and the original ones are kept as _dense_score and _lexical_score.
+        """
+        dense_docs = {doc.metadata["_id"]: doc for doc in self._to_documents(category, dense, min_score)}
+        rejected = {point.id for point in dense} - set(dense_docs)
+        lexical = [(doc_id, score) for doc_id, score in lexical if doc_id not in rejected]
+        lexical_scores = dict(lexical)
+        fused = reciprocal_rank_fusion([list(dense_docs), [doc_id for doc_id, _ in lexical]], self.rrf_k)
 
-        results_by_category = {category: docs for category, docs in results}
-        return results_by_category
\ No newline at end of file
+        documents: List[Document] = []
+        for doc_id, score in fused[:top_k]:
+            doc = dense_docs.get(doc_id)
+            if doc is None:
+                payload = dict(self.lexical.index.payload(doc_id))
+                text = payload.pop("chunk", "")
+                payload["_id"] = doc_id
+                payload["_score"] = None
+                doc = Document(text=text, metadata=payload)
+            doc.metadata["_dense_score"] = doc.metadata["_score"]
+            doc.metadata["_lexical_score"] = lexical_scores.get(doc_id)
+            doc.metadata["_score"] = score
+            documents.append(doc)
+        return documents
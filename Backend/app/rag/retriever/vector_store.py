@@ -0,0 +1,347 @@
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+import numpy as np
+from loguru import logger
+from qdrant_client.models import QueryRequest, ScoredPoint
+
+# names the version directory of a saved NumpyVectorStore that is current
+CURRENT_FILE = "CURRENT"
+
+
+class VectorStore(ABC):
+    """Where EmbeddingRetriever looks up the nearest chunks of a query vector."""
+
+    @abstractmethod
+    async def search_categories(
+        self, query_vector: List[float], categories: Sequence[str], top_k: int
+    ) -> Dict[str, List[ScoredPoint]]:
+        """Top-k points per `source` category, best first."""
+
+
+def _category_filter(category: str) -> Dict:
+    return {"must": [{"key": "source", "match": {"value": category}}]}
+
+
+class QdrantVectorStore(VectorStore):
+    """
+    The Qdrant collection. With batched=True all categories go out in one
+    query_batch_points request; if that fails, or with batched=False, one
+    filtered search per category is issued concurrently.
+    """
+
+    def __init__(self, qdrant, collection_name: str, batched: bool = True):
+        self.qdrant = qdrant
+        self.collection_name = collection_name
+        self.batched = batched
+
+    async def search_categories(self, query_vector, categories, top_k):
+        if self.batched:
+            try:
+                return await self._search_batched(query_vector, categories, top_k)
+            except Exception as e:
+                # e.g. a server without the query API; fall back to one search per category
+                logger.warning(f"Batched Qdrant query failed, searching per category: {e}")
+
+        results = await asyncio.gather(*(self._search_category(c, query_vector, top_k) for c in categories))
+        return dict(zip(categories, results))
+
+    async def _search_category(self, category: str, query_vector: List[float], top_k: int) -> List[ScoredPoint]:
+        try:
+            return await self.qdrant.search(
+                collection_name=self.collection_name,
+                query_vector=query_vector,
+                limit=top_k,
+                query_filter=_category_filter(category)
+            )
+        except Exception as e:
+            logger.error(f"Qdrant search failed for category={category}: {e}")
+            return []
+
+    async def _search_batched(self, query_vector, categories, top_k) -> Dict[str, List[ScoredPoint]]:
+        requests = [
+            QueryRequest(query=query_vector, filter=_category_filter(category), limit=top_k, with_payload=True)
+            for category in categories
+        ]
+        responses = await self.qdrant.query_batch_points(collection_name=self.collection_name, requests=requests)
+        return {category: response.points for category, response in zip(categories, responses)}
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    In-process vector index for tests, small deployments and hot data.
+    Vectors are L2-normalized, so a dot product is the cosine similarity
+    Qdrant reports, and kept as float32 or, with quantize=True, as int8 with
+    one scale per row (a quarter of the memory, scores within ~1%).
+    One matrix-vector product scores every point; each category then takes
+    its top-k with argpartition over its rows.
+
+    With a path the index is saved as `vectors.npy` (+ `scales.npy`) and
+    `points.json` and reopened memory-mapped, so a restart reads only the
+    pages searches touch. Writes go to memory and are saved at most every
+    save_interval seconds and on close(), in a thread so the event loop is
+    not blocked. Each save is a new version directory that `CURRENT` is then
+    atomically switched to, so a crash mid-save leaves the previous version;
+    on load the row counts of the files must agree.
+
+    upsert/delete/set_payload/close take the arguments of the AsyncQdrantClient calls
+    the embedding pipeline and incremental ingest make, so the store can
+    stand in for the client entirely.
+    """
+
+    def __init__(self, path: Optional[str] = None, dim: int = 384, quantize: bool = False,
+                 save_interval: float = 5.0):
+        self.path = path
+        self.dim = dim
+        self.quantize = quantize
+        self.save_interval = save_interval
+        dtype = np.int8 if quantize else np.float32
+        self._vectors = np.empty((0, dim), dtype=dtype)
+        self._scales = np.empty(0, dtype=np.float32)
+        self._ids: List[Any] = []
+        self._payloads: List[Dict[str, Any]] = []
+        self._sources = np.empty(0, dtype=object)
+        self._rows: Dict[Any, int] = {}
+        self._size = 0
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        self._save_lock = asyncio.Lock()
+        if path and os.path.exists(os.path.join(path, CURRENT_FILE)):
+            self._load()
+
+    def __len__(self) -> int:
+        return self._size
+
+    # ---- Qdrant client calls
+
+    async def upsert(self, collection_name: str = None, points: Sequence[Any] = (), **kwargs) -> None:
+        for point in points:
+            self.add(point.id, point.vector, point.payload or {})
+        await self._maybe_save()
+
+    async def delete(self, collection_name: str = None, points_selector: Any = None, **kwargs) -> None:
+        ids = getattr(points_selector, "points", points_selector) or []
+        for point_id in ids:
+            self.remove(point_id)
+        await self._maybe_save()
+
+    async def set_payload(self, collection_name: str = None, payload: Dict[str, Any] = None,
+                          points: Sequence[Any] = (), **kwargs) -> None:
+        for point_id in getattr(points, "points", points) or []:
+            row = self._rows.get(point_id)
+            if row is not None:
+                self._payloads[row] = {**self._payloads[row], **(payload or {})}
+                self._dirty = True
+        await self._maybe_save()
+
+    async def search(self, collection_name: str = None, query_vector=None, limit: int = 10,
+                     query_filter: Optional[Dict] = None, **kwargs) -> List[ScoredPoint]:
+        category = None
+        if query_filter:
+            category = query_filter["must"][0]["match"]["value"]
+        return self.search_categories_sync(query_vector, [category], limit)[category]
+
+    async def close(self, **kwargs) -> None:
+        await self.save_async()
+
+    # ---- VectorStore
+
+    async def search_categories(self, query_vector, categories, top_k):
+        return self.search_categories_sync(query_vector, categories, top_k)
+
+    def search_categories_sync(
+        self, query_vector, categories: Sequence[Optional[str]], top_k: int
+    ) -> Dict[Optional[str], List[ScoredPoint]]:
+        """categories may contain None for no filter."""
+        if not self._size or top_k <= 0:
+            return {category: [] for category in categories}
+        scores = self._scores(query_vector)
+        results = {}
+        for category in categories:
+            rows = np.arange(self._size) if category is None else np.flatnonzero(self._sources[:self._size] == category)
+            results[category] = self._top_k(scores, rows, top_k)
+        return results
+
+    # ---- index maintenance
+
+    def add(self, point_id: Any, vector: Sequence[float], payload: Dict[str, Any]) -> None:
+        row = self._rows.get(point_id)
+        if row is None:
+            row = self._size
+            self._grow(row + 1)
+            self._rows[point_id] = row
+            self._ids.append(point_id)
+            self._payloads.append(payload)
+            self._size += 1
+        else:
+            self._payloads[row] = payload
+        self._writable()
+        self._vectors[row], self._scales[row] = self._encode(vector)
+        self._sources[row] = payload.get("source")
+        self._dirty = True
+
+    def remove(self, point_id: Any) -> None:
+        row = self._rows.pop(point_id, None)
+        if row is None:
+            return
+        self._writable()
+        last = self._size - 1
+        if row != last:
+            # move the last point into the hole to keep rows contiguous
+            moved = self._ids[last]
+            self._vectors[row] = self._vectors[last]
+            self._scales[row] = self._scales[last]
+            self._sources[row] = self._sources[last]
+            self._ids[row], self._payloads[row] = moved, self._payloads[last]
+            self._rows[moved] = row
+        self._ids.pop()
+        self._payloads.pop()
+        self._sources[last] = None
+        self._size -= 1
+        self._dirty = True
+
+    def save(self) -> None:
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            self._write(snapshot)
+
+    async def save_async(self) -> None:
+        """save() with the files written in a thread; only the in-memory copy runs on the loop."""
+        async with self._save_lock:
+            snapshot = self._snapshot()
+            if snapshot is not None:
+                await asyncio.to_thread(self._write, snapshot)
+
+    # ---- helpers
+
+    def _encode(self, vector: Sequence[float]):
+        v = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(v)
+        if norm > 0:
+            v = v / norm
+        if not self.quantize:
+            return v, 1.0
+        scale = float(np.abs(v).max()) / 127 or 1.0
+        return np.round(v / scale).astype(np.int8), scale
+
+    def _scores(self, query_vector) -> np.ndarray:
+        q = np.asarray(query_vector, dtype=np.float32)
+        norm = np.linalg.norm(q)
+        if norm > 0:
+            q = q / norm
+        vectors = self._vectors[:self._size]
+        if self.quantize:
+            return (vectors @ q) * self._scales[:self._size]
+        return vectors @ q
+
+    def _top_k(self, scores: np.ndarray, rows: np.ndarray, top_k: int) -> List[ScoredPoint]:
+        if not len(rows):
+            return []
+        sub = scores[rows]
+        if len(rows) > top_k:
+            best = np.argpartition(-sub, top_k - 1)[:top_k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-sub[best], kind="stable")]
+        return [
+            ScoredPoint(id=self._ids[rows[i]], version=0, score=float(sub[i]), payload=dict(self._payloads[rows[i]]))
+            for i in best
+        ]
+
+    def _grow(self, needed: int) -> None:
+        capacity = len(self._vectors)
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity, 64)
+        vectors = np.zeros((capacity, self.dim), dtype=self._vectors.dtype)
+        vectors[:self._size] = self._vectors[:self._size]
+        scales = np.ones(capacity, dtype=np.float32)
+        scales[:self._size] = self._scales[:self._size]
+        sources = np.empty(capacity, dtype=object)
+        sources[:self._size] = self._sources[:self._size]
+        self._vectors, self._scales, self._sources = vectors, scales, sources
+
+    def _writable(self) -> None:
+        # arrays opened memory-mapped are read-only until the first write
+        if isinstance(self._vectors, np.memmap) or not self._vectors.flags.writeable:
+            self._vectors = np.array(self._vectors)
+            self._scales = np.array(self._scales)
+
+    async def _maybe_save(self) -> None:
+        if self.path and time.monotonic() - self._saved_at >= self.save_interval:
+            await self.save_async()
+
+    def _snapshot(self) -> Optional[Dict[str, Any]]:
+        # copied so that writes made while the files are written do not leak into them
+        if not self.path or not self._dirty:
+            return None
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        return {
+            "vectors": self._vectors[:self._size].copy(),
+            "scales": self._scales[:self._size].copy() if self.quantize else None,
+            "ids": list(self._ids),
+            "payloads": list(self._payloads),
+        }
+
+    def _write(self, snapshot: Dict[str, Any]) -> None:
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            version = tempfile.mkdtemp(prefix="v", dir=self.path)
+            self._write_file(os.path.join(version, "vectors.npy"), lambda f: np.save(f, snapshot["vectors"]))
+            if snapshot["scales"] is not None:
+                self._write_file(os.path.join(version, "scales.npy"), lambda f: np.save(f, snapshot["scales"]))
+            points = [{"id": i, "payload": p} for i, p in zip(snapshot["ids"], snapshot["payloads"])]
+            meta = {"quantize": self.quantize, "count": len(points), "points": points}
+            self._write_file(os.path.join(version, "points.json"), lambda f: f.write(json.dumps(meta).encode()))
+            # the version only becomes visible once all of its files are on disk
+            pointer = os.path.join(version, CURRENT_FILE)
+            self._write_file(pointer, lambda f: f.write(os.path.basename(version).encode()))
+            os.replace(pointer, os.path.join(self.path, CURRENT_FILE))
+        except BaseException:
+            self._dirty = True
+            raise
+        for name in os.listdir(self.path):
+            old = os.path.join(self.path, name)
+            if name != os.path.basename(version) and os.path.isdir(old):
+                shutil.rmtree(old, ignore_errors=True)
+
+    @staticmethod
+    def _write_file(path: str, write) -> None:
+        with open(path, "xb") as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _load(self) -> None:
+        with open(os.path.join(self.path, CURRENT_FILE)) as f:
+            version = os.path.join(self.path, f.read().strip())
+        with open(os.path.join(version, "points.json"), "rb") as f:
+            meta = json.load(f)
+        if meta.get("quantize", False) != self.quantize:
+            raise ValueError(f"Vector index at {version} was saved with quantize={meta.get('quantize')}")
+        points = meta["points"]
+        self._size = len(points)
+        self._vectors = np.load(os.path.join(version, "vectors.npy"), mmap_mode="r")
+        if self.quantize:
+            self._scales = np.load(os.path.join(version, "scales.npy"), mmap_mode="r")
+        else:
+            self._scales = np.ones(self._size, dtype=np.float32)
+        if not meta.get("count") == self._size == len(self._vectors) == len(self._scales):
+            raise ValueError(
+                f"Vector index at {version} is inconsistent: {meta.get('count')} points recorded, "
+                f"{self._size} payloads, {len(self._vectors)} vectors, {len(self._scales)} scales"
+            )
+        if self._vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector index at {version} has dimension {self._vectors.shape[1]}, expected {self.dim}")
+        self._ids = [p["id"] for p in points]
+        self._payloads = [p["payload"] for p in points]
+        self._sources = np.empty(self._size, dtype=object)
+        self._sources[:] = [p["payload"].get("source") for p in points]
+        self._rows = {point_id: row for row, point_id in enumerate(self._ids)}
+        logger.info(f"Loaded {self._size} vectors from {version}")
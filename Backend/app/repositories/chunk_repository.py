@@ -21,6 +21,8 @@ class ChunkRepository:
         await self.collection.create_index("status")
         await self.collection.create_index([("status", 1), ("annotation", 1)])
         await self.collection.create_index([("source", 1), ("status", 1)])
+        # the embedding reader walks unembedded chunks in _id order
+        await self.collection.create_index([("isEmbedded", 1), ("_id", 1)])
         logger.info("MongoDB indexes ensured for chunks collection.")
 
     async def get_chunk_by_id(self, chunk_id: str) -> Optional[ChunkSchema]:
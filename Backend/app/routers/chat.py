@@ -9,7 +9,11 @@ from app.dependencies import (
     get_llm_provider_dep,
     get_mongo_db,
     get_kms,
-    get_current_user
+    get_current_user,
+    get_query_cache_dep,
+    get_query_batcher_dep,
+    get_vector_store_dep,
+    get_lexical_index_dep,
 )
 from app.rag.retriever.retriever import EmbeddingRetriever
 from app.core.clients.llm_clients import LLMProvider
@@ -50,7 +54,11 @@ async def chat(
     default_llm=Depends(get_llm_provider_dep),
     mongo_db=Depends(get_mongo_db),
     current_user = Depends(get_current_user),
-    kms = Depends(get_kms)
+    kms = Depends(get_kms),
+    query_cache = Depends(get_query_cache_dep),
+    batcher = Depends(get_query_batcher_dep),
+    store = Depends(get_vector_store_dep),
+    lexical = Depends(get_lexical_index_dep),
 ):
 
     query, provider, model = (
@@ -89,7 +97,8 @@ async def chat(
     
     try:
         retriever = EmbeddingRetriever(
-            model=model_dep, qdrant=qdrant, collection_name=collection_name
+            model=model_dep, qdrant=qdrant, collection_name=collection_name,
+            query_cache=query_cache, batcher=batcher, store=store, lexical=lexical,
         )
         if mode == "search":
             results = await retriever.retrieve(query, top_k=top_k)
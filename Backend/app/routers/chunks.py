@@ -4,14 +4,21 @@ from pydantic import BaseModel
 from pymongo.database import Database
 from fastapi import APIRouter, HTTPException, status, Depends, Query
 from ..core.repo_ingestion.ingest import ingest_pipeline
+from app.core.chunker.sizing import TokenSizer, char_size
 from app.db.db import update_chunk, delete_chunk, get_chunk_by_id, get_chunks
 from app.dependencies import (
     get_mongo_db,
     get_embedding_model_dep,
+    get_token_sizer_dep,
     get_qdrant_client_dep,
+    get_embedding_worker_dep,
+    get_query_cache_dep,
+    get_query_batcher_dep,
+    get_vector_store_dep,
+    get_lexical_index_dep,
     require_role,
 )
-from app.rag.embedding.pipeline import embedding_pipeline
+from app.rag.embedding.worker import EmbeddingWorker
 from app.rag.retriever.retriever import EmbeddingRetriever
 
 from app.db.users import UserRole
@@ -47,14 +54,34 @@ class ChunkUpdate(BaseModel):
 @router.post("/ingest", response_model=Dict[str, Any], status_code=status.HTTP_201_CREATED)
 async def ingest_repository(
     repo_url: str, 
-    chunk_size: int = Query(1500, ge=500, le=1500), 
+    chunk_size: Optional[int] = Query(None, ge=32, le=1500, description="Chunk budget in chunk_unit (default 1500 chars, or the embedding model's token limit)"),
+    chunk_unit: str = Query("chars", pattern="^(chars|tokens)$", description="Measure chunk_size in characters or embedding-model tokens"),
+    incremental: bool = Query(False, description="Only re-chunk files whose content changed since the last ingest"),
+    colocate_calls: bool = Query(False, description="Keep small callees in the same chunk as their callers"),
     mongo_db: Database = Depends(get_mongo_db),
+    qdrant = Depends(get_qdrant_client_dep),
+    token_sizer: TokenSizer = Depends(get_token_sizer_dep),
+    worker = Depends(get_embedding_worker_dep),
     _: None = Depends(require_role(UserRole.ADMIN)),
 ):
     """Ingest and chunk a code repository."""
+    size = char_size
+    if chunk_unit == "tokens":
+        size = token_sizer
+        chunk_size = min(chunk_size or size.max_tokens, size.max_tokens)
+    elif chunk_size is None:
+        chunk_size = 1500
+    elif chunk_size < 500:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="chunk_size must be at least 500 characters")
     try:
-        await ingest_pipeline(repo_url, chunk_size, mongo_db)
-        return {"message": "Repository ingested and chunked successfully"}
+        summary = await ingest_pipeline(
+            repo_url, chunk_size, mongo_db,
+            incremental=incremental, qdrant=qdrant, collection_name=os.getenv("COLLECTION_NAME"), size=size,
+            colocate_calls=colocate_calls,
+        )
+        if worker is not None:
+            worker.notify()
+        return {"message": "Repository ingested and chunked successfully", "summary": summary}
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -161,9 +188,18 @@ async def run_embedding_pipeline(
     mongo_db: Database = Depends(get_mongo_db),
     model = Depends(get_embedding_model_dep),
     qdrant = Depends(get_qdrant_client_dep),
+    worker = Depends(get_embedding_worker_dep),
     _: None = Depends(require_role(UserRole.ADMIN)),
 ):
-    """Trigger the embedding pipeline until all unembedded chunks are processed."""
+    """
+    Embed all unembedded chunks. With the background worker running this only
+    wakes it up and returns at once; progress is reported by /embed/status.
+    Without it the chunks are embedded within the request, as before.
+    """
+    if worker is not None and worker.running:
+        worker.notify()
+        return {"message": "Embedding worker notified", "status": await worker.status()}
+
     collection_name = os.getenv("COLLECTION_NAME")
     if not collection_name:
         raise HTTPException(
@@ -171,26 +207,34 @@ async def run_embedding_pipeline(
             detail="COLLECTION_NAME not set in environment variables."
         )
 
-    total_embedded = 0
-    batch_size = 50
+    runner = EmbeddingWorker(collection_name, mongo_db, model, qdrant)
     try:
-        while True:
-            num_embedded = await embedding_pipeline(
-                collection_name=collection_name,
-                mongo_db=mongo_db,
-                model=model,
-                qdrant=qdrant,
-                batch_size=batch_size
-            )
-            if num_embedded == 0:
-                break
-            total_embedded += num_embedded
-        return {"message": f"All unembedded chunks embedded successfully. Total embedded: {total_embedded}"}
+        total_embedded = await runner.run_until_empty()
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Embedding pipeline failed: {str(e)}"
         )
+    if runner.failed_batches:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Embedding pipeline failed for {runner.failed_batches} batches "
+                   f"({total_embedded} chunks embedded): {runner.last_error}"
+        )
+    return {"message": f"All unembedded chunks embedded successfully. Total embedded: {total_embedded}"}
+
+
+@router.get("/embed/status", summary="Progress and throughput of the background embedding worker")
+async def embedding_status(
+    worker = Depends(get_embedding_worker_dep),
+    _: None = Depends(require_role(UserRole.ADMIN)),
+):
+    if worker is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Embedding worker is disabled (EMBEDDING_WORKER_ENABLED=false)."
+        )
+    return await worker.status()
 
 
 @router.get("/search", summary="Semantic search over chunks")
@@ -199,6 +243,10 @@ async def semantic_search(
     top_k: int = Query(5, ge=1, le=50),
     model = Depends(get_embedding_model_dep),
     qdrant = Depends(get_qdrant_client_dep),
+    query_cache = Depends(get_query_cache_dep),
+    batcher = Depends(get_query_batcher_dep),
+    store = Depends(get_vector_store_dep),
+    lexical = Depends(get_lexical_index_dep),
     _: None = Depends(require_role(UserRole.ADMIN)),
 ):
     collection_name = os.getenv("COLLECTION_NAME")
@@ -209,7 +257,10 @@ async def semantic_search(
         )
 
     try:
-        retriever = EmbeddingRetriever(model=model, qdrant=qdrant, collection_name=collection_name)
+        retriever = EmbeddingRetriever(
+            model=model, qdrant=qdrant, collection_name=collection_name,
+            query_cache=query_cache, batcher=batcher, store=store, lexical=lexical,
+        )
         results = await retriever.retrieve(q, top_k=top_k, min_score=float(os.getenv("MIN_SCORE", "0.0")))
         
         # Flatten or return grouped by category
@@ -218,4 +269,16 @@ async def semantic_search(
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Search failed: {str(e)}"
-        )
\ No newline at end of file
+        )
+
+
+@router.get("/search/stats", summary="Query embedding cache and batching statistics")
+async def search_stats(
+    query_cache = Depends(get_query_cache_dep),
+    batcher = Depends(get_query_batcher_dep),
+    _: None = Depends(require_role(UserRole.ADMIN)),
+):
+    return {
+        "query_cache": query_cache.stats() if query_cache is not None else None,
+        "batcher": batcher.stats() if batcher is not None else None,
+    }
@@ -11,6 +11,7 @@ Features:
 Usage:
     python ingest_docs.py                    # Run normally (skips completed sites)
     python ingest_docs.py --force            # Force re-run all sites
+    python ingest_docs.py --tokens           # Size chunks in embedding-model tokens
 
 Related scripts:
     python check_ingestion_status.py         # Check which sites have been processed
@@ -29,7 +30,8 @@ sys.path.insert(0, str(project_root))
 
 from app.core.doc_ingestion.scraper import scrape_site
 from app.core.doc_ingestion.chunker import chunk_documentation_from_pages
-from app.core.doc_ingestion.config import SITES_TO_SCRAPE
+from app.core.doc_ingestion.config import SITES_TO_SCRAPE, CHUNK_SIZE_TOKENS, CHUNK_OVERLAP_TOKENS
+from app.core.chunker.sizing import load_token_sizer
 from app.db.db import insert_chunks, check_ingestion_complete, mark_ingestion_complete
 
 from pymongo import AsyncMongoClient
@@ -57,10 +59,20 @@ async def get_mongo_db_standalone() -> Database:
     return client[mongo_db_name]
 
 
-async def main(force: bool = False):
+async def main(force: bool = False, tokens: bool = False):
     """Main function to scrape, chunk, and ingest documentation."""
     print("Starting documentation ingestion process...")
 
+    chunk_options = {}
+    if tokens:
+        size = load_token_sizer()
+        chunk_options = {
+            "chunk_size": min(CHUNK_SIZE_TOKENS, size.max_tokens),
+            "chunk_overlap": CHUNK_OVERLAP_TOKENS,
+            "size": size,
+        }
+        print(f"Sizing chunks to {chunk_options['chunk_size']} tokens")
+
     try:
         db = await get_mongo_db_standalone()
     except Exception as e:
@@ -96,15 +108,18 @@ async def main(force: bool = False):
 
             if pages:
                 print(f"Chunking content from {site_name}...")
-                chunks = chunk_documentation_from_pages(pages)
+                chunks = chunk_documentation_from_pages(pages, **chunk_options)
                 print(f"Generated {len(chunks)} chunks")
 
                 if chunks:
                     print(f"Inserting chunks into database...")
-                    inserted_ids = await insert_chunks(chunks, db)
-                    if inserted_ids is not None and len(inserted_ids) > 0:
-                        print(f"Inserted {len(inserted_ids)} new chunks into database")
-                        total_chunks += len(inserted_ids)
+                    result = await insert_chunks(chunks, db)
+                    if result["inserted"] > 0:
+                        print(
+                            f"Inserted {result['inserted']} new chunks into database "
+                            f"({result['duplicates']} duplicates skipped)"
+                        )
+                        total_chunks += result["inserted"]
                     else:
                         print(
                             f"ℹAll {len(chunks)} chunks already exist in database (duplicates skipped)"
@@ -147,6 +162,11 @@ if __name__ == "__main__":
         action="store_true",
         help="Force re-run ingestion even if sites have been processed successfully before",
     )
+    parser.add_argument(
+        "--tokens",
+        action="store_true",
+        help="Size chunks in embedding-model tokens instead of characters",
+    )
     args = parser.parse_args()
 
-    asyncio.run(main(force=args.force))
+    asyncio.run(main(force=args.force, tokens=args.tokens))
@@ -0,0 +1,93 @@
+"""Compare the bin-packing chunk assembler with the old greedy per-symbol one.
+
+Reports chunk count, non-blank characters kept, approximate tokens (chars / 4)
+and fill ratio for the same symbol index. The greedy version is the pre-packing
+ChunkPreprocessedCode, kept here for reference; it drops the node that
+overflows a chunk, which shows up as lost characters.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_chunk_packing [--mb 2] [--files 200] [--max-size 1500]
+"""
+import argparse
+import asyncio
+import time
+
+from app.core.chunker import chunker, metta_ast_parser, packing, preprocess, utils
+from app.core.chunker.symbol_index import SymbolIndex
+
+from benchmarks.corpus import make_metta_corpus
+
+
+def greedy_chunks(potential_chunks, max_size):
+    chunks = []
+    for codes in potential_chunks:
+        chunk, rel_paths, chunk_size = [], set(), 0
+        for code, rel_path in codes:
+            if len(code) > max_size:
+                if chunk:
+                    chunks.append(["\n".join(chunk), rel_paths])
+                    chunk, rel_paths, chunk_size = [], set(), 0
+                node = metta_ast_parser.parse(code)[0]
+                chunks.extend([[sub, {rel_path}] for sub in chunker.ChunkCodeRecursively(node, code, max_size)])
+            elif chunk_size + len(code) > max_size:
+                if chunk:
+                    chunks.append(["\n".join(chunk), rel_paths])
+                chunk, rel_paths, chunk_size = [], set(), 0
+            else:
+                chunk.append(code)
+                rel_paths.add(rel_path)
+                chunk_size += len(code)
+        if chunk:
+            chunks.append(["\n".join(chunk), rel_paths])
+    return [utils._build_chunk_doc(chunk, sorted(rel_paths)) for chunk, rel_paths in chunks if chunk != ""]
+
+
+def build_potential_chunks(total_chars: int, files: int):
+    corpus = make_metta_corpus(total_chars)
+    forms = corpus.split("\n;; ")
+    index = SymbolIndex()
+    per_file = max(1, len(forms) // files)
+    for n in range(0, len(forms), per_file):
+        source = "\n;; ".join(forms[n:n + per_file])
+        if n:
+            source = ";; " + source
+        preprocess.parse_file(source, f"repo/mod{n // per_file}.metta", index)
+    return index.potential_chunks()
+
+
+def code_chars(text: str) -> int:
+    # whitespace is ignored: joins and recursive splits change it, but never code
+    return len("".join(text.split()))
+
+
+def report(name, chunks, source_chars, max_size, elapsed):
+    kept = sum(code_chars(chunk["chunk"]) for chunk in chunks)
+    print(
+        f"{name:<8} {len(chunks):>7,} chunks  {kept:>11,} chars  ~{kept // 4:>9,} tokens  "
+        f"fill {packing.fill_ratio(chunks, max_size):5.2f}  "
+        f"lost {max(source_chars - kept, 0):>9,} chars  {elapsed:6.2f}s"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=2)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--max-size", type=int, default=1500)
+    args = parser.parse_args()
+
+    potential_chunks = build_potential_chunks(int(args.mb * 1_000_000), args.files)
+    source_chars = sum(code_chars(code) for codes in potential_chunks for code, _ in codes)
+    print(f"{len(potential_chunks):,} symbols, {source_chars:,} non-blank chars of code, max_size {args.max_size}")
+
+    start = time.perf_counter()
+    greedy = greedy_chunks(potential_chunks, args.max_size)
+    report("greedy", greedy, source_chars, args.max_size, time.perf_counter() - start)
+
+    start = time.perf_counter()
+    packed = asyncio.run(chunker.ChunkPreprocessedCode(potential_chunks, args.max_size))
+    report("packed", packed, source_chars, args.max_size, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    main()
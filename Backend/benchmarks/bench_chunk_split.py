@@ -0,0 +1,96 @@
+"""Time ChunkCodeRecursively on pathological single forms.
+
+`wide` is one form with many small sub-nodes, so nearly every sub-node is
+merged into the chunk before it; `nested` is a deeply nested form; `layered`
+nests a level of facts per depth, so every level yields chunks that the old
+version copied again at each enclosing level (quadratic). The old
+string-concatenating recursive version is timed alongside, on a thread with a
+large stack so it can recurse deep enough. GC is disabled while timing, since
+the parse tree dominates collection cost otherwise.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_chunk_split [--sizes 300000 1000000 3000000] [--max-size 150]
+"""
+import argparse
+import gc
+import sys
+import threading
+import time
+
+from app.core.chunker import chunker, metta_ast_parser
+
+
+def concat_chunks(node, text, max_size):
+    # ChunkCodeRecursively before the span rewrite
+    st, en = node.src_range
+    if en - st <= max_size or not node.sub_nodes:
+        return [text[st:en]]
+    chunks = []
+    for sub_node in node.sub_nodes:
+        sub_chunks = concat_chunks(sub_node, text, max_size)
+        cnt = 0
+        if chunks:
+            for idx in range(len(sub_chunks)):
+                if len(chunks[-1]) + len(sub_chunks[idx]) > max_size:
+                    break
+                chunks[-1] += "\n" + sub_chunks[idx]
+                cnt += 1
+            sub_chunks = sub_chunks[cnt:]
+        chunks.extend(sub_chunks)
+    return chunks
+
+
+def wide_form(chars: int) -> str:
+    return "(facts " + " ".join(f"(f{i} {i})" for i in range(chars // 10)) + ")"
+
+
+def nested_form(chars: int) -> str:
+    depth = chars // 12
+    return "!" + "(step $x " * depth + "done" + ")" * depth
+
+
+def layered_form(chars: int) -> str:
+    level = " ".join(f"(f{j} {j})" for j in range(20))
+    depth = chars // (len(level) + 10)
+    return "".join(f"(level{i} {level} " for i in range(depth)) + "done" + ")" * depth
+
+
+def timed(fn, *args):
+    gc.collect()
+    gc.disable()
+    start = time.perf_counter()
+    try:
+        result = fn(*args)
+    except RecursionError:
+        return None, float("nan")
+    finally:
+        gc.enable()
+    return result, time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[300_000, 1_000_000, 3_000_000])
+    parser.add_argument("--max-size", type=int, default=150)
+    args = parser.parse_args()
+
+    for name, make in (("wide", wide_form), ("nested", nested_form), ("layered", layered_form)):
+        for chars in args.sizes:
+            code = make(chars)
+            node = metta_ast_parser.parse(code)[0]
+            chunks, spans = timed(chunker.ChunkCodeRecursively, node, code, args.max_size)
+            _, concat = timed(concat_chunks, node, code, args.max_size)
+            print(
+                f"{name:<7} {len(code):>10,} chars  {len(chunks):>7,} chunks  "
+                f"spans {spans:7.3f}s  concat {concat:7.3f}s  "
+                f"({spans / len(code) * 1e9:6.1f} ns/char)"
+            )
+
+
+if __name__ == "__main__":
+    # the old version recurses once per nesting level
+    sys.setrecursionlimit(1_000_000)
+    threading.stack_size(1 << 30)
+    worker = threading.Thread(target=main)
+    worker.start()
+    worker.join()
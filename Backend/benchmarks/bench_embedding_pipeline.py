@@ -0,0 +1,109 @@
+"""Compare the serial embedding loop with the overlapped EmbeddingWorker stages.
+
+MongoDB and Qdrant are replaced by in-memory fakes that wait a fixed latency
+per round trip plus a per-chunk transfer cost; the model sleeps per chunk in
+its thread, like a CPU-bound encode that releases the GIL. The serial loop
+(`embedding_pipeline` until it returns 0, what /embed did before) pays read +
+encode + store per batch; the worker overlaps them and grows its batch size
+towards the target encode time.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_embedding_pipeline [--chunks 2000] [--encode-ms 2] [--io-ms 40]
+"""
+import argparse
+import asyncio
+import time
+from unittest.mock import patch
+
+import numpy as np
+
+from app.rag.embedding import pipeline, worker
+
+
+class FakeCursor:
+    def __init__(self, backend, docs):
+        self.backend = backend
+        self.docs = docs
+
+    async def to_list(self, length):
+        batch, self.docs = self.docs[:length], self.docs[length:]
+        await asyncio.sleep(self.backend.io_s + self.backend.io_per_chunk_s * len(batch))
+        return batch
+
+    async def close(self):
+        pass
+
+
+class FakeBackend:
+    def __init__(self, n, encode_s, io_s, io_per_chunk_s):
+        self.docs = {
+            f"c{i}": {"_id": i, "chunkId": f"c{i}", "chunk": f"(= (f {i}) {i})", "isEmbedded": False}
+            for i in range(n)
+        }
+        self.encode_s = encode_s
+        self.io_s = io_s
+        self.io_per_chunk_s = io_per_chunk_s
+
+    def unembedded_chunks_cursor(self, after=None, exclude_chunk_ids=(), batch_size=100, mongo_db=None):
+        docs = [
+            dict(d) for d in self.docs.values()
+            if not d["isEmbedded"] and (after is None or d["_id"] > after) and d["chunkId"] not in exclude_chunk_ids
+        ]
+        return FakeCursor(self, docs)
+
+    async def get_embedding_checkpoint(self, name, mongo_db=None):
+        return None
+
+    async def save_embedding_checkpoint(self, name, last_id, mongo_db=None):
+        pass
+
+    async def update_embedding_status(self, chunk_ids, status, mongo_db=None):
+        await asyncio.sleep(self.io_s)
+        for chunk_id in chunk_ids:
+            self.docs[chunk_id]["isEmbedded"] = status
+        return len(chunk_ids)
+
+    async def upsert(self, collection_name, points):
+        await asyncio.sleep(self.io_s + self.io_per_chunk_s * len(points))
+
+    def encode(self, texts):
+        time.sleep(self.encode_s * len(texts))
+        return np.zeros((len(texts), 384), dtype=np.float32)
+
+
+async def run(mode, args):
+    backend = FakeBackend(args.chunks, args.encode_ms / 1000, args.io_ms / 1000, args.io_per_chunk_ms / 1000)
+    with patch.object(worker, "unembedded_chunks_cursor", backend.unembedded_chunks_cursor), \
+            patch.object(worker, "get_embedding_checkpoint", backend.get_embedding_checkpoint), \
+            patch.object(worker, "save_embedding_checkpoint", backend.save_embedding_checkpoint), \
+            patch.object(pipeline, "unembedded_chunks_cursor", backend.unembedded_chunks_cursor), \
+            patch.object(pipeline, "update_embedding_status", backend.update_embedding_status):
+        start = time.perf_counter()
+        if mode == "serial":
+            total = 0
+            while n := await pipeline.embedding_pipeline("bench", None, backend, backend, batch_size=50):
+                total += n
+        else:
+            total = await worker.EmbeddingWorker("bench", None, backend, backend, batch_size=50).run_until_empty()
+        elapsed = time.perf_counter() - start
+    assert total == args.chunks
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=2000)
+    parser.add_argument("--encode-ms", type=float, default=2.0, help="model time per chunk")
+    parser.add_argument("--io-ms", type=float, default=40.0, help="latency per MongoDB/Qdrant round trip")
+    parser.add_argument("--io-per-chunk-ms", type=float, default=0.5, help="transfer time per chunk")
+    args = parser.parse_args()
+
+    serial = asyncio.run(run("serial", args))
+    overlapped = asyncio.run(run("worker", args))
+    print(f"{args.chunks} chunks, encode {args.encode_ms}ms/chunk, round trip {args.io_ms}ms")
+    print(f"serial loop      {serial:7.2f}s  {args.chunks / serial:8.1f} chunks/s")
+    print(f"overlapped stages{overlapped:7.2f}s  {args.chunks / overlapped:8.1f} chunks/s  ({serial / overlapped:.2f}x)")
+
+
+if __name__ == "__main__":
+    main()
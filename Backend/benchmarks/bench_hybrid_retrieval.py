@@ -0,0 +1,99 @@
+"""Latency of BM25 and of hybrid (dense + BM25, RRF) retrieval.
+
+Chunks are the forms of the synthetic corpus, each defining one symbol;
+queries name a symbol, the case MiniLM embeddings handle badly. Dense
+search runs on NumpyVectorStore with random vectors, a stand-in for a
+model that does not know the symbol: hit@k (the defining chunk in the
+top k) then shows what the lexical side adds, and the timings show what
+it costs per query on top of dense search.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_hybrid_retrieval [--chunks 20000] [--queries 500] [--top-k 5]
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import numpy as np
+from qdrant_client.models import PointStruct
+
+from app.rag.embedding.pipeline import chunk_point_id
+from app.rag.retriever.lexical import LexicalIndex
+from app.rag.retriever.retriever import EmbeddingRetriever
+from app.rag.retriever.vector_store import NumpyVectorStore
+from benchmarks.corpus import make_metta_corpus
+
+DIM = 384
+
+
+def make_chunks(n):
+    forms = make_metta_corpus(n * 190).split(";; ")[1:n + 1]
+    return [
+        {"chunkId": f"c{i}", "chunk": ";; " + form, "source": "code", "symbols": [f"fn-{i}"]}
+        for i, form in enumerate(forms)
+    ]
+
+
+def percentiles(latencies):
+    latencies = sorted(latencies)
+    return latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+async def run_queries(retriever, queries, top_k):
+    latencies, hits = [], 0
+    for symbol, chunk_id in queries:
+        start = time.perf_counter()
+        results = await retriever.retrieve(symbol, top_k=top_k)
+        latencies.append(time.perf_counter() - start)
+        hits += any(doc.metadata.get("original_chunkId") == chunk_id for doc in results["code"])
+    return percentiles(latencies), hits / len(queries)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top-k", type=int, default=5)
+    args = parser.parse_args()
+
+    chunks = make_chunks(args.chunks)
+    rng = np.random.default_rng(0)
+    store = NumpyVectorStore(dim=DIM)
+    await store.upsert("bench", [
+        PointStruct(id=chunk_point_id(c["chunkId"]), vector=rng.normal(size=DIM).tolist(),
+                    payload={**c, "original_chunkId": c["chunkId"]})
+        for c in chunks
+    ])
+
+    start = time.perf_counter()
+    lexical = LexicalIndex()
+    for chunk in chunks:
+        lexical.add_chunk(chunk)
+    build = time.perf_counter() - start
+
+    picks = random.Random(1).sample(range(len(chunks)), min(args.queries, len(chunks)))
+    queries = [(f"fn-{i}", f"c{i}") for i in picks]
+    query_vectors = {symbol: rng.normal(size=DIM).tolist() for symbol, _ in queries}
+
+    latencies = []
+    for symbol, _ in queries:
+        start = time.perf_counter()
+        lexical.search(symbol, ["code", "documentation", "others"], 20)
+        latencies.append(time.perf_counter() - start)
+    bm25_p50, bm25_p99 = percentiles(latencies)
+
+    async def embed(query):
+        return query_vectors[query]
+
+    print(f"{len(chunks)} chunks, {len(queries)} symbol queries, top {args.top_k}")
+    print(f"BM25 index build {build:.2f}s; BM25 search p50 {bm25_p50:.2f}ms p99 {bm25_p99:.2f}ms")
+    for name, index in (("dense only", None), ("hybrid RRF", lexical)):
+        retriever = EmbeddingRetriever(model=None, qdrant=None, collection_name="bench", store=store, lexical=index)
+        retriever.embed_query = embed
+        (p50, p99), hit_rate = await run_queries(retriever, queries, args.top_k)
+        print(f"{name:11s} retrieve p50 {p50:6.2f}ms p99 {p99:6.2f}ms  hit@{args.top_k} {hit_rate:.3f}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
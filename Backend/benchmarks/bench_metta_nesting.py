@@ -0,0 +1,40 @@
+"""Stress the parser with deeply nested forms and check time grows linearly.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_metta_nesting [--depths 1000 10000 100000]
+"""
+import argparse
+import time
+
+from app.core.chunker import metta_ast_parser
+
+
+def nested_form(depth: int) -> str:
+    return "!" + "(step $x " * depth + "done" + ")" * depth
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--depths", type=int, nargs="+", default=[1_000, 10_000, 100_000, 300_000])
+    args = parser.parse_args()
+
+    baseline = None
+    for depth in args.depths:
+        code = nested_form(depth)
+        start = time.perf_counter()
+        metta_ast_parser.parse(code)
+        elapsed = time.perf_counter() - start
+
+        per_level = elapsed / depth * 1e6
+        baseline = baseline or per_level
+        print(f"depth {depth:>8,}: {elapsed:7.3f}s  {per_level:6.2f} us/level  ({per_level / baseline:.2f}x of first)")
+
+    try:
+        metta_ast_parser.parse(nested_form(args.depths[0]), indexed=False)
+        print(f"char reader parser: ok at depth {args.depths[0]:,}")
+    except RecursionError:
+        print(f"char reader parser: RecursionError at depth {args.depths[0]:,}")
+
+
+if __name__ == "__main__":
+    main()
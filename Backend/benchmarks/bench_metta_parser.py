@@ -0,0 +1,46 @@
+"""Compare the character-by-character parser with the index-based one.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_metta_parser [--chars 2000000] [--repeat 3] [--no-gc]
+
+Node allocation dominates both parsers, so `--no-gc` is useful to keep the
+cyclic collector from adding noise to the scanning cost.
+"""
+import argparse
+import gc
+import time
+
+from app.core.chunker import metta_ast_parser
+from benchmarks.corpus import make_metta_corpus
+
+
+def _best_time(code: str, repeat: int, **kwargs) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        metta_ast_parser.parse(code, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--chars", type=int, default=2_000_000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-gc", action="store_true")
+    args = parser.parse_args()
+    if args.no_gc:
+        gc.disable()
+
+    code = make_metta_corpus(args.chars)
+    legacy = _best_time(code, args.repeat, indexed=False)
+    indexed = _best_time(code, args.repeat)
+
+    print(f"corpus: {len(code):,} chars")
+    print(f"char reader: {len(code) / legacy:>14,.0f} chars/s ({legacy:.3f}s)")
+    print(f"indexed:     {len(code) / indexed:>14,.0f} chars/s ({indexed:.3f}s)")
+    print(f"speedup:     {legacy / indexed:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""Measure syntax-tree memory for the slotted SyntaxNode vs the old dict-backed layout.
+
+The corpus is split into files of `--file-mb` and each file is parsed on its own
+(like `preprocess_code` does), so a 50 MB corpus can be measured without holding
+every tree at once. Reported numbers are the sum of retained tree sizes and the
+largest per-file peak.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_syntax_node_memory [--mb 50] [--file-mb 1]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+from typing import List, Optional
+
+from app.core.chunker import metta_ast_parser
+from benchmarks.corpus import make_metta_corpus
+
+
+class _DictSyntaxNode:
+    """Layout of SyntaxNode before it gained __slots__: a __dict__ plus a range per node."""
+
+    def __init__(self, node_type, start: int, end: int, sub_nodes: Optional[List] = None,
+                 parsed_text: Optional[str] = None, message: Optional[str] = None,
+                 is_complete: bool = True) -> None:
+        self.node_type = node_type
+        self.sub_nodes = sub_nodes or []
+        self.parsed_text = parsed_text
+        self.message = message
+        self.is_complete = is_complete
+        self.src_range_internal = range(start, end)
+
+
+def _count_nodes(roots) -> int:
+    count, stack = 0, list(roots)
+    while stack:
+        node = stack.pop()
+        count += 1
+        stack.extend(node.sub_nodes)
+    return count
+
+
+def measure(files: List[str], node_cls) -> dict:
+    original = metta_ast_parser.SyntaxNode
+    metta_ast_parser.SyntaxNode = node_cls
+    retained = peak = nodes = 0
+    start = time.perf_counter()
+    try:
+        for code in files:
+            gc.collect()
+            tracemalloc.start()
+            roots = metta_ast_parser.parse(code)
+            current, file_peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            retained += current
+            peak = max(peak, file_peak)
+            nodes += _count_nodes(roots)
+            del roots
+    finally:
+        metta_ast_parser.SyntaxNode = original
+    return {"retained": retained, "peak": peak, "nodes": nodes, "seconds": time.perf_counter() - start}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mb", type=float, default=50)
+    parser.add_argument("--file-mb", type=float, default=1)
+    args = parser.parse_args()
+
+    file_chars = int(args.file_mb * 1024 * 1024)
+    n_files = max(1, int(args.mb / args.file_mb))
+    files = [make_metta_corpus(file_chars, seed=i) for i in range(n_files)]
+    total_chars = sum(len(f) for f in files)
+    print(f"corpus: {total_chars / 1024 / 1024:.1f} MB in {n_files} files")
+
+    results = {
+        "dict-backed": measure(files, _DictSyntaxNode),
+        "__slots__": measure(files, metta_ast_parser.SyntaxNode),
+    }
+    for name, r in results.items():
+        print(
+            f"{name:>12}: {r['nodes']:,} nodes, trees {r['retained'] / 1024 / 1024:,.1f} MB "
+            f"({r['retained'] / r['nodes']:.0f} B/node), per-file peak {r['peak'] / 1024 / 1024:.1f} MB, "
+            f"{r['seconds']:.1f}s"
+        )
+    saved = 1 - results["__slots__"]["retained"] / results["dict-backed"]["retained"]
+    print(f"tree memory saved: {saved:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Per-query retrieval latency: NumpyVectorStore (float32, int8) vs Qdrant.
+
+Each query fetches the top-k of the three source categories, as
+EmbeddingRetriever.retrieve does. Qdrant is the client's local in-memory
+mode by default; pass --qdrant http://localhost:6333 to measure a server
+(network hop included). Recall is the share of the exact float32 top-k
+that the other backend returns.
+
+Usage (from Backend/):
+    python -m benchmarks.bench_vector_store [--points 20000] [--dim 384] [--queries 200] [--qdrant :memory:]
+"""
+import argparse
+import asyncio
+import tempfile
+import time
+
+import numpy as np
+from qdrant_client import AsyncQdrantClient
+from qdrant_client.models import Distance, PointStruct, VectorParams
+
+from app.rag.retriever.vector_store import NumpyVectorStore, QdrantVectorStore
+
+CATEGORIES = ["code", "documentation", "others"]
+COLLECTION = "bench_vector_store"
+
+
+def make_points(n, dim, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return [
+        PointStruct(id=i, vector=vectors[i].tolist(), payload={"source": CATEGORIES[i % 3], "chunk": f"chunk {i}"})
+        for i in range(n)
+    ]
+
+
+async def time_queries(store, queries, top_k):
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        found = await store.search_categories(query, CATEGORIES, top_k)
+        latencies.append(time.perf_counter() - start)
+        results.append({c: [p.id for p in found[c]] for c in CATEGORIES})
+    latencies.sort()
+    return results, latencies[len(latencies) // 2] * 1000, latencies[int(len(latencies) * 0.99)] * 1000
+
+
+def recall(results, reference, top_k):
+    hits = sum(len(set(r[c]) & set(ref[c])) for r, ref in zip(results, reference) for c in CATEGORIES)
+    return hits / (len(reference) * len(CATEGORIES) * top_k)
+
+
+async def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--points", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--qdrant", default=":memory:", help="':memory:' for local mode, or a server URL")
+    args = parser.parse_args()
+
+    points = make_points(args.points, args.dim)
+    queries = np.random.default_rng(1).normal(size=(args.queries, args.dim)).astype(np.float32).tolist()
+    print(f"{args.points} points, dim {args.dim}, {args.queries} queries, top {args.top_k} of 3 categories")
+
+    reference = None
+    with tempfile.TemporaryDirectory() as tmp:
+        for quantize in (False, True):
+            store = NumpyVectorStore(f"{tmp}/{quantize}", dim=args.dim, quantize=quantize)
+            await store.upsert(COLLECTION, points)
+            await store.close()
+            # reopen memory-mapped, as after a restart
+            store = NumpyVectorStore(f"{tmp}/{quantize}", dim=args.dim, quantize=quantize)
+            results, p50, p99 = await time_queries(store, queries, args.top_k)
+            reference = reference or results
+            name = "numpy int8" if quantize else "numpy float32"
+            print(f"{name:14s} p50 {p50:7.2f}ms  p99 {p99:7.2f}ms  recall {recall(results, reference, args.top_k):.3f}")
+
+    client = AsyncQdrantClient(location=":memory:") if args.qdrant == ":memory:" else AsyncQdrantClient(url=args.qdrant)
+    try:
+        if await client.collection_exists(COLLECTION):
+            await client.delete_collection(COLLECTION)
+        await client.create_collection(COLLECTION, vectors_config=VectorParams(size=args.dim, distance=Distance.COSINE))
+        for start in range(0, len(points), 1000):
+            await client.upsert(COLLECTION, points=points[start:start + 1000])
+        results, p50, p99 = await time_queries(QdrantVectorStore(client, COLLECTION), queries, args.top_k)
+        print(f"{'qdrant':14s} p50 {p50:7.2f}ms  p99 {p99:7.2f}ms  recall {recall(results, reference, args.top_k):.3f}  ({args.qdrant})")
+        await client.delete_collection(COLLECTION)
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,26 @@
+"""Synthetic MeTTa source used by the benchmark scripts."""
+import random
+
+
+def make_metta_corpus(target_chars: int, seed: int = 0) -> str:
+    """Generate roughly `target_chars` of MeTTa that looks like a real knowledge base."""
+    rng = random.Random(seed)
+    parts = []
+    size = 0
+    i = 0
+    while size < target_chars:
+        name = f"fn-{i}"
+        callee = f"fn-{rng.randint(0, max(i - 1, 0))}"
+        form = (
+            f";; {name} doubles its argument after calling {callee}\n"
+            f"(: {name} (-> Number Number))\n"
+            f"(= ({name} $x)\n"
+            f"   (if (> $x {rng.randint(0, 100)})\n"
+            f"       ({callee} (* $x 2))\n"
+            f"       (let $y (+ $x {rng.randint(0, 9)}) \"small value\")))\n"
+            f"!(assertEqual ({name} 1) {rng.randint(0, 50)})\n"
+        )
+        parts.append(form)
+        size += len(form)
+        i += 1
+    return "".join(parts)
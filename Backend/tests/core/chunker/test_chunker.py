@@ -0,0 +1,175 @@
+import pytest
+
+from app.core.chunker import chunker, metta_ast_parser, packing
+
+
+def _code(text: str) -> str:
+    return "".join(text.split())
+
+
+def test_pack_indices_fills_bins_and_keeps_input_order():
+    # 60+38 and 55+30+9 (plus separators) fit in two bins of 100
+    assert packing.pack_indices([60, 30, 38, 55, 9], max_size=100) == [[0, 2], [1, 3, 4]]
+
+
+def test_pack_indices_keeps_oversized_items_in_their_own_bin():
+    assert packing.pack_indices([150, 10], max_size=100) == [[0], [1]]
+
+
+@pytest.mark.asyncio
+async def test_chunk_preprocessed_code_never_drops_an_entry():
+    potential_chunks = [
+        [("(: add (-> Number Number Number))", "repo/a.metta"),
+         ("(= (add $x $y) (+ $x $y))", "repo/a.metta"),
+         ("!(assertEqual (add 1 2) 3)", "repo/a.metta")],
+        [("(= (one) 1)", "repo/a.metta")],
+        [(";; big\n(= (big $x) (+ (+ (+ $x 1) (+ $x 2)) (+ (+ $x 3) (+ $x 4))))", "repo/b.metta")],
+    ]
+    chunks = await chunker.ChunkPreprocessedCode(potential_chunks, max_size=60)
+
+    # every non-blank character of the input is in some chunk
+    kept = _code("".join(chunk["chunk"] for chunk in chunks))
+    assert len(kept) == sum(len(_code(code)) for codes in potential_chunks for code, _ in codes)
+    # the overflowing def used to be dropped; now the add symbol spans consecutive pieces
+    assert any("(= (add $x $y)" in chunk["chunk"] for chunk in chunks)
+    # chunks never mix files
+    assert all(len(chunk["file"]) == 1 for chunk in chunks)
+
+
+@pytest.mark.asyncio
+async def test_small_symbols_of_a_file_share_a_chunk():
+    potential_chunks = [[(f"(= (f{i}) {i})", "repo/a.metta")] for i in range(10)]
+    chunks = await chunker.ChunkPreprocessedCode(potential_chunks, max_size=1500)
+
+    assert len(chunks) == 1
+    assert chunks[0]["chunk"].splitlines() == [f"(= (f{i}) {i})" for i in range(10)]
+    assert packing.fill_ratio(chunks, 1500) == pytest.approx(len(chunks[0]["chunk"]) / 1500)
+
+
+def _reference_chunks(node, text, max_size):
+    # the straightforward recursive version (string concatenation), newline counted
+    st, en = node.src_range
+    if en - st <= max_size or not node.sub_nodes:
+        return [text[st:en]]
+    chunks = []
+    for sub_node in node.sub_nodes:
+        sub_chunks = _reference_chunks(sub_node, text, max_size)
+        cnt = 0
+        if chunks:
+            for sub_chunk in sub_chunks:
+                if len(chunks[-1]) + 1 + len(sub_chunk) > max_size:
+                    break
+                chunks[-1] += "\n" + sub_chunk
+                cnt += 1
+        chunks.extend(sub_chunks[cnt:])
+    return chunks
+
+
+@pytest.mark.parametrize("max_size", [8, 20, 45, 120])
+def test_chunk_code_recursively_matches_the_recursive_definition(max_size):
+    code = (
+        "(= (fib $n) (if (< $n 2) $n (+ (fib (- $n 1)) (fib (- $n 2)))))\n"
+        "!(assertEqual (let* (($a (foo 1 2 3)) ($b (bar \"a long string literal\" $a))) (baz $a $b)) (quux))\n"
+        "(: deep (-> (A (B (C (D (E F))))) G))\n"
+    )
+    for node in metta_ast_parser.parse(code):
+        assert chunker.ChunkCodeRecursively(node, code, max_size) == _reference_chunks(node, code, max_size)
+
+
+def test_chunk_code_recursively_handles_deep_nesting():
+    depth = 20_000
+    code = "!" + "(step $x " * depth + "done" + ")" * depth
+    chunks = chunker.ChunkCodeRecursively(metta_ast_parser.parse(code)[0], code, 1500)
+
+    assert all(len(chunk) <= 1500 for chunk in chunks)
+    # the brackets of split nodes are not part of any sub-node; every token is kept
+    strip = str.maketrans("", "", "()!")
+    assert _code("".join(chunks)).translate(strip) == _code(code).translate(strip)
+
+
+@pytest.mark.asyncio
+async def test_colocate_calls_puts_small_callees_next_to_their_caller():
+    potential_chunks = [
+        [("(= (main $x) (helper (other $x)))", "repo/main.metta")],
+        [("(= (unrelated) 0)", "repo/main.metta")],
+        [("(= (other $x) $x)", "repo/lib.metta")],
+        [("(= (helper $x) (+ $x 1))", "repo/util.metta")],
+    ]
+    symbols = ["main", "unrelated", "other", "helper"]
+    call_graph = {"main": ["helper", "other"]}
+
+    apart = await chunker.ChunkPreprocessedCode(potential_chunks, 120, symbols=symbols, call_graph=call_graph)
+    assert [chunk["symbols"] for chunk in apart] == [["other"], ["main", "unrelated"], ["helper"]]
+    assert apart[1]["calls"] == ["helper", "other"] and apart[0]["called_by"] == ["main"]
+
+    together = await chunker.ChunkPreprocessedCode(potential_chunks, 120, symbols=symbols, call_graph=call_graph,
+                                                   colocate_calls=True)
+    assert [chunk["symbols"] for chunk in together] == [["main", "helper", "other", "unrelated"]]
+    assert together[0]["chunk"].splitlines()[:3] == [
+        "(= (main $x) (helper (other $x)))", "(= (helper $x) (+ $x 1))", "(= (other $x) $x)",
+    ]
+    assert together[0]["calls"] == [] and together[0]["called_by"] == []
+    assert sorted(together[0]["file"]) == ["lib.metta", "main.metta", "util.metta"]
+
+
+def test_colocate_callees_respects_the_budget_and_places_a_callee_once():
+    owners = ["a", "b", "c", "d"]
+    sizes = [50, 20, 20, 20]
+    graph = {"a": ["b", "c"], "d": ["b"]}
+
+    # a+b fits, a+b+c does not; b is already placed when d is visited
+    assert chunker.colocate_callees(owners, sizes, graph, max_size=80) == [[0, 1], [2], [3]]
+
+
+class _FakeCursor:
+    def __init__(self, docs):
+        self._it = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class _FakeChunks:
+    """The chunks collection calls insert_chunks makes, over a dict by chunkId."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query, projection=None):
+        return _FakeCursor([dict(self.docs[cid]) for cid in query["chunkId"]["$in"] if cid in self.docs])
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.docs[doc["chunkId"]] = dict(doc)
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.docs[request._filter["chunkId"]].update(request._doc["$set"])
+
+
+class _FakeDB:
+    def __init__(self):
+        self.chunks = _FakeChunks()
+
+    def get_collection(self, name):
+        assert name == "chunks"
+        return self.chunks
+
+
+@pytest.mark.asyncio
+async def test_reingest_updates_the_links_of_unchanged_chunks():
+    db = _FakeDB()
+    repo_files = {"repo": [["repo/a.metta", "a.metta"], ["repo/b.metta", "b.metta"]]}
+    await chunker.ChunkCode(repo_files, 1500, db, sources={"repo/a.metta": b"(= (f $x) $x)", "repo/b.metta": b"(= (h) 1)"})
+    f_chunk = next(doc for doc in db.chunks.docs.values() if doc["symbols"] == ["f"])
+    assert f_chunk["called_by"] == []
+
+    # b.metta now calls f; a.metta's chunk keeps its text and chunkId
+    await chunker.ChunkCode(repo_files, 1500, db, sources={"repo/a.metta": b"(= (f $x) $x)", "repo/b.metta": b"(= (g) (f 1))"})
+    assert db.chunks.docs[f_chunk["chunkId"]]["called_by"] == ["g"]
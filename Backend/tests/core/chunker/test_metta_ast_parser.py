@@ -0,0 +1,221 @@
+import io
+import mmap
+import random
+import re
+import pytest
+
+from app.core.chunker import metta_ast_parser
+from app.core.chunker.metta_ast_parser import SyntaxNodeType
+
+
+PARITY_CORPUS = [
+    "",
+    "   \n\t  ",
+    "; a lone comment",
+    "; comment at EOF without newline\n(foo)",
+    "(= (add $x $y) (+ $x $y))",
+    "(: add (-> Number Number Number))",
+    "!(add 1 2)",
+    "!(assertEqual (add 1 2) 3)",
+    "! \n (foo)",
+    "(== a b)",
+    "(= = x)",
+    "(=> a b)",
+    "(:: a b)",
+    "(:foo bar)",
+    "( ; comment before head\n : a b)",
+    '(print "hello world")',
+    '"unterminated string at top level',
+    '(say a"b c)',
+    "$x $y-z",
+    "(foo $x)(bar $y)",
+    "(a (b (c (d (e)))))",
+    "(a !(b c) d)",
+    "(outer\n  ; nested comment\n  (inner $x) ; trailing\n)",
+    "word-at-top-level another",
+    "(été     x)",
+    "(foo)\n;;; header\n(= (bar) (foo))\n",
+]
+
+ERROR_CORPUS = [
+    ")",
+    "(foo",
+    "(foo (bar)",
+    "!foo",
+    "!",
+    "(a !b c)",
+    '(print "unterminated',
+]
+
+
+def _shape(node):
+    return (
+        node.node_type,
+        node.src_range,
+        node.parsed_text,
+        node.message,
+        node.is_complete,
+        [_shape(child) for child in node.sub_nodes],
+    )
+
+
+def _parse_both(code):
+    legacy = [_shape(n) for n in metta_ast_parser.parse(code, indexed=False)]
+    indexed = [_shape(n) for n in metta_ast_parser.parse(code)]
+    return legacy, indexed
+
+
+def _random_metta(rng: random.Random, size: int) -> str:
+    pieces = ["(", ")", " ", "\n", "\t", "$x", "foo", "bar-baz", "=", "==", ":", "!",
+              ";c\n", '"s t"', '"', "42", "->", "(= (f $a)", "(: f", "!(g"]
+    return "".join(rng.choice(pieces) for _ in range(size))
+
+
+@pytest.mark.parametrize("code", PARITY_CORPUS)
+def test_indexed_parser_matches_char_reader(code):
+    legacy, indexed = _parse_both(code)
+    assert indexed == legacy
+
+
+@pytest.mark.parametrize("code", ERROR_CORPUS)
+def test_indexed_parser_raises_same_errors(code):
+    with pytest.raises(ValueError) as legacy_err:
+        metta_ast_parser.parse(code, indexed=False)
+    with pytest.raises(ValueError) as indexed_err:
+        metta_ast_parser.parse(code)
+    assert str(indexed_err.value) == str(legacy_err.value)
+
+
+def test_indexed_parser_matches_char_reader_on_random_input():
+    rng = random.Random(1234)
+    for _ in range(500):
+        code = _random_metta(rng, rng.randint(1, 40))
+        try:
+            legacy = [_shape(n) for n in metta_ast_parser.parse(code, indexed=False)]
+        except ValueError as e:
+            with pytest.raises(ValueError, match=re.escape(str(e))):
+                metta_ast_parser.parse(code)
+            continue
+        assert [_shape(n) for n in metta_ast_parser.parse(code)] == legacy, code
+
+
+def test_rule_and_type_groups_are_detected():
+    roots = metta_ast_parser.parse("(= (foo $x) $x)\n(: foo (-> A A))\n!(foo 1)")
+    assert [n.node_type for n in roots] == [
+        SyntaxNodeType.RuleGroup,
+        SyntaxNodeType.TypeCheckGroup,
+        SyntaxNodeType.CallGroup,
+    ]
+
+
+@pytest.mark.parametrize("depth", [1_000, 20_000])
+def test_indexed_parser_handles_deep_nesting(depth):
+    code = "!" + "(a " * depth + "b" + ")" * depth
+    (root,) = metta_ast_parser.parse(code)
+
+    assert root.node_type == SyntaxNodeType.CallGroup
+    assert root.src_range == (0, len(code))
+
+    node, levels = root.sub_nodes[1], 0
+    while node.sub_nodes[2].node_type == SyntaxNodeType.ExpressionGroup:
+        node, levels = node.sub_nodes[2], levels + 1
+    assert levels == depth - 1
+    assert node.sub_nodes[2].parsed_text == "b"
+
+
+def test_char_reader_parser_still_hits_the_recursion_limit():
+    code = "(" * 5_000 + ")" * 5_000
+    with pytest.raises(RecursionError):
+        metta_ast_parser.parse(code, indexed=False)
+
+
+def test_syntax_nodes_are_slotted_and_leaves_share_no_child_list():
+    (root,) = metta_ast_parser.parse("(= (foo $x) $x)")
+    leaf = root.sub_nodes[1]
+
+    assert not hasattr(root, "__dict__")
+    assert leaf.sub_nodes == ()
+    assert root.src_range == (root.start, root.end) == (0, 15)
+    assert leaf.node_type_str == "WordToken"
+
+
+STREAM_SOURCE = (
+    "; header comment\n"
+    "(: greet (-> String String))\n"
+    '(= (greet $name) (concat "héllo " $name))\n'
+    "!(assertEqual (greet \"wörld\") \"héllo wörld\")\n"
+    "trailing-word"
+)
+
+
+def _forms(pairs):
+    return [(node.node_type, text[node.start:node.end]) for node, text in pairs]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 16, 1 << 16])
+def test_iter_parse_streams_text_files(chunk_size):
+    expected = _forms(metta_ast_parser.iter_parse(STREAM_SOURCE))
+    assert expected == [(n.node_type, STREAM_SOURCE[n.start:n.end]) for n in metta_ast_parser.parse(STREAM_SOURCE)]
+
+    streamed = _forms(metta_ast_parser.iter_parse(io.StringIO(STREAM_SOURCE), chunk_size=chunk_size))
+    assert streamed == expected
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 7])
+def test_iter_parse_decodes_binary_and_mmap_sources(tmp_path, chunk_size):
+    expected = _forms(metta_ast_parser.iter_parse(STREAM_SOURCE))
+    raw = STREAM_SOURCE.encode("utf-8")
+
+    assert _forms(metta_ast_parser.iter_parse(io.BytesIO(raw), chunk_size=chunk_size)) == expected
+
+    path = tmp_path / "sample.metta"
+    path.write_bytes(raw)
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        assert _forms(metta_ast_parser.iter_parse(mm, chunk_size=chunk_size)) == expected
+
+
+def test_iter_parse_is_lazy_and_reports_truncated_forms():
+    forms = metta_ast_parser.iter_parse(io.StringIO("(ok)\n(broken"), chunk_size=2)
+    node, text = next(forms)
+    assert text[node.start:node.end] == "(ok)"
+    with pytest.raises(ValueError, match="Unclosed expression"):
+        next(forms)
+
+
+RECOVERY_SOURCE = (
+    "(= (good-1) 1)\n"
+    ") stray\n"
+    "!oops\n"
+    "!(good-2)\n"
+    "(= (broken $x) (foo $x)\n"
+    "(: good-3 Number)\n"
+)
+
+
+def test_recover_mode_emits_error_groups_and_keeps_valid_forms():
+    roots = metta_ast_parser.parse(RECOVERY_SOURCE, recover=True)
+    errors = [n for n in roots if n.node_type == SyntaxNodeType.ErrorGroup]
+    valid = [RECOVERY_SOURCE[n.start:n.end] for n in roots if n.node_type != SyntaxNodeType.ErrorGroup]
+
+    assert [e.message for e in errors] == [
+        "Unexpected ')' at top level",
+        "Expected an expression after '!'",
+        "Unclosed expression",
+    ]
+    assert all(not e.is_complete for e in errors)
+    assert RECOVERY_SOURCE[errors[2].start:errors[2].end] == "(= (broken $x) (foo $x)\n"
+    assert valid == ["(= (good-1) 1)", "stray", "!(good-2)", "(: good-3 Number)"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 16])
+def test_recover_mode_matches_when_streaming(chunk_size):
+    expected = [(n.node_type, RECOVERY_SOURCE[n.start:n.end]) for n in metta_ast_parser.parse(RECOVERY_SOURCE, recover=True)]
+    streamed = metta_ast_parser.iter_parse(io.StringIO(RECOVERY_SOURCE), chunk_size=chunk_size, recover=True)
+    assert _forms(streamed) == expected
+
+
+def test_recover_mode_on_unclosed_last_form_runs_to_end_of_input():
+    code = "(ok)\n(never closed"
+    roots = metta_ast_parser.parse(code, recover=True)
+    assert [n.node_type for n in roots] == [SyntaxNodeType.ExpressionGroup, SyntaxNodeType.ErrorGroup]
+    assert roots[1].src_range == (5, len(code))
@@ -0,0 +1,158 @@
+import pickle
+import threading
+from collections import defaultdict
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+
+from app.core.chunker import preprocess
+from app.core.chunker.symbol_index import SymbolIndex
+
+
+MATH = (
+    ";; adds two numbers\n"
+    "(: add (-> Number Number Number))\n"
+    "(= (add $x $y) (+ $x $y))\n"
+    "!(assertEqual (add 1 2) 3)\n"
+    "(= (add $x $y) (+ $x $y))\n"
+    "; trailing note\n"
+)
+MAIN = (
+    "!(add 4 5)\n"
+    "(= (double $x) (add $x $x))\n"
+    "(= (broken $x\n"
+    "(: double (-> Number Number))\n"
+)
+
+
+@pytest.fixture
+def repo_files(tmp_path):
+    files = defaultdict(list)
+    for name, code in (("math.metta", MATH), ("main.metta", MAIN)):
+        path = tmp_path / name
+        path.write_text(code, encoding="utf-8")
+        files["repo"].append([f"repo/{name}", str(path)])
+    return files
+
+
+def test_symbol_index_dedupes_entries_and_keeps_insertion_order():
+    index = SymbolIndex()
+    index.add("add", "types", "(: add T)", "a.metta")
+    index.add("add", "defs", "(= (add) 1)", "a.metta")
+    index.add("add", "types", "(: add T)", "a.metta")
+    index.add("add", "defs", "(= (add) 1)", "b.metta")
+    index.add("sub", "defs", "(= (sub) 1)", "a.metta")
+
+    assert len(index) == 2 and "add" in index
+    assert index.potential_chunks() == [
+        [("(: add T)", "a.metta"), ("(= (add) 1)", "a.metta"), ("(= (add) 1)", "b.metta")],
+        [("(= (sub) 1)", "a.metta")],
+    ]
+    assert index.to_documents()[1] == {"name": "sub", "defs": [["(= (sub) 1)", "a.metta"]]}
+
+
+def test_parse_file_groups_forms_by_symbol_and_counts_errors():
+    index = SymbolIndex()
+    errors = preprocess.parse_file(MAIN, "repo/main.metta", index)
+
+    assert errors == 1
+    assert list(index) == ["add", "double"]
+    assert [entry[0] for entry in index.potential_chunks()[1]] == [
+        "(= (double $x) (add $x $x))",
+        "(: double (-> Number Number))",
+    ]
+
+
+@pytest.mark.asyncio
+async def test_preprocess_code_builds_chunks_without_touching_the_db(repo_files):
+    db = MagicMock()
+    potential_chunks = await preprocess.preprocess_code(repo_files, db)
+
+    db.get_collection.assert_not_called()
+    add_chunk, comment_chunk, double_chunk = potential_chunks
+    assert add_chunk == [
+        (";; adds two numbers\n(: add (-> Number Number Number))", "repo/math.metta"),
+        ("(= (add $x $y) (+ $x $y))", "repo/math.metta"),
+        ("!(assertEqual (add 1 2) 3)", "repo/math.metta"),
+        ("!(add 4 5)", "repo/main.metta"),
+    ]
+    assert comment_chunk == [("; trailing note", "repo/math.metta")]
+    assert [code for code, _ in double_chunk] == ["(= (double $x) (add $x $x))", "(: double (-> Number Number))"]
+
+
+@pytest.mark.asyncio
+async def test_preprocess_code_persists_symbols_in_one_bulk_write(repo_files):
+    collection = MagicMock()
+    collection.bulk_write = AsyncMock(return_value=MagicMock(inserted_count=3))
+    db = MagicMock()
+    db.get_collection.return_value = collection
+
+    await preprocess.preprocess_code(repo_files, db, persist_symbols=True)
+
+    collection.bulk_write.assert_awaited_once()
+    requests = collection.bulk_write.await_args.args[0]
+    assert len(requests) == 4  # DeleteMany + one InsertOne per symbol
+
+
+@pytest.mark.asyncio
+async def test_parallel_preprocess_matches_sequential(tmp_path, repo_files):
+    for i in range(6):
+        path = tmp_path / f"gen-{i}.metta"
+        path.write_text(f"(= (add $x) {i})\n(= (f{i} $x) (add $x))\n", encoding="utf-8")
+        repo_files["repo"].append([f"repo/gen-{i}.metta", str(path)])
+    repo_files["repo"].append(["repo/missing.metta", str(tmp_path / "missing.metta")])
+
+    sequential = await preprocess.preprocess_code(repo_files, MagicMock())
+    parallel = await preprocess.preprocess_code(repo_files, MagicMock(), workers=2)
+
+    assert parallel == sequential
+
+
+@pytest.mark.asyncio
+async def test_preprocess_code_parses_in_memory_sources_without_opening_files(tmp_path):
+    repo_files = defaultdict(list)
+    repo_files["repo"].append(["repo/math.metta", str(tmp_path / "missing.metta")])
+
+    potential_chunks = await preprocess.preprocess_code(
+        repo_files, MagicMock(), sources={"repo/math.metta": MATH.encode("utf-8")}
+    )
+
+    assert potential_chunks[0][0] == (";; adds two numbers\n(: add (-> Number Number Number))", "repo/math.metta")
+
+
+@pytest.mark.asyncio
+async def test_sequential_preprocess_parses_off_the_event_loop(repo_files, monkeypatch):
+    threads = []
+    index_file = preprocess.index_file
+
+    def recording_index_file(*args):
+        threads.append(threading.get_ident())
+        return index_file(*args)
+    monkeypatch.setattr(preprocess, "index_file", recording_index_file)
+
+    await preprocess.preprocess_code(repo_files, MagicMock())
+    assert threads and threading.get_ident() not in threads
+
+
+@pytest.mark.asyncio
+async def test_crlf_sources_parse_like_the_file_path(tmp_path):
+    path = tmp_path / "math.metta"
+    path.write_bytes(MATH.replace("\n", "\r\n").encode("utf-8"))
+    repo_files = defaultdict(list)
+    repo_files["repo"].append(["repo/math.metta", str(path)])
+
+    from_file = await preprocess.preprocess_code(repo_files, MagicMock())
+    from_memory = await preprocess.preprocess_code(repo_files, MagicMock(), sources={"repo/math.metta": path.read_bytes()})
+
+    assert from_memory == from_file
+    assert not any("\r" in code for chunk in from_memory for code, _ in chunk)
+
+
+def test_parse_file_records_the_call_graph_of_rules():
+    index = SymbolIndex()
+    preprocess.parse_file(MATH + MAIN, "repo/all.metta", index)
+
+    # `+` is a builtin, `add` a known symbol; self-calls are left out
+    assert index.call_graph() == {"double": ["add"]}
+    restored = pickle.loads(pickle.dumps(index))
+    assert restored.call_graph() == index.call_graph()
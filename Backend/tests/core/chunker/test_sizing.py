@@ -0,0 +1,68 @@
+import pytest
+from tokenizers import Tokenizer, models, pre_tokenizers
+from transformers import PreTrainedTokenizerFast
+
+from app.core.chunker import chunker
+from app.core.chunker.sizing import TokenSizer
+from app.core.doc_ingestion.chunker import chunk_documentation_from_pages
+
+
+@pytest.fixture
+def sizer():
+    # offline stand-in for the embedding model's WordPiece tokenizer
+    vocab = {"[UNK]": 0, "[CLS]": 1, "[SEP]": 2, "(": 3, ")": 4, "=": 5, "$": 6, "x": 7, "+": 8, "1": 9}
+    backend = Tokenizer(models.WordPiece(vocab, unk_token="[UNK]"))
+    backend.pre_tokenizer = pre_tokenizers.BertPreTokenizer()
+    tokenizer = PreTrainedTokenizerFast(tokenizer_object=backend, unk_token="[UNK]", cls_token="[CLS]", sep_token="[SEP]")
+    return TokenSizer(tokenizer, max_tokens=64)
+
+
+def test_token_sizer_ignores_the_models_truncation(sizer):
+    # SentenceTransformer.encode leaves truncation on in the tokenizer it shares
+    sizer.tokenizer.backend_tokenizer.enable_truncation(max_length=8)
+    rebuilt = TokenSizer(sizer.tokenizer, max_tokens=64)
+
+    assert rebuilt("(= (f $x) (+ $x 1))") == 14
+    assert sizer("(= (g $x) (+ $x 1))") == 14
+
+
+def test_token_sizer_counts_word_pieces_and_caches(sizer):
+    assert sizer("(= (f $x) (+ $x 1))") == 14
+    assert sizer("  \n") == 0
+    sizer("(= (f $x) (+ $x 1))")
+    assert sizer.cache_info().hits == 1
+
+
+@pytest.mark.asyncio
+async def test_code_chunks_respect_a_token_budget(sizer):
+    # 14 tokens each (20 characters): a 30-token budget fits two per chunk
+    potential_chunks = [[(f"(= (f{i} $x) (+ $x 1))", "repo/a.metta")] for i in range(5)]
+    chunks = await chunker.ChunkPreprocessedCode(potential_chunks, max_size=30, size=sizer)
+
+    assert [len(chunk["chunk"].splitlines()) for chunk in chunks] == [2, 2, 1]
+    assert all(sizer(chunk["chunk"]) <= 30 for chunk in chunks)
+
+
+def test_doc_chunker_accepts_a_token_length_function(sizer):
+    page = {"content": "\n\n".join(["(= $x 1) " * 4] * 6), "url": "https://metta-lang.dev/a",
+            "page_title": "A", "category": "docs"}
+    chunks = chunk_documentation_from_pages([page], chunk_size=40, chunk_overlap=0, size=sizer)
+
+    assert len(chunks) == 6
+    assert all(sizer(chunk["chunk"]) <= 40 for chunk in chunks)
+
+
+def test_nested_code_split_by_tokens_matches_whole_node_counts(sizer):
+    code = "(= (f $x) " * 60 + "(+ $x 1)" + ")" * 60
+    node = chunker.metta_ast_parser.parse(code)[0]
+    chunks = chunker.ChunkCodeRecursively(node, code, 20, sizer)
+
+    assert "".join(chunks).replace("\n", "").replace(" ", "") == code.replace(" ", "")
+    assert all(sizer(chunk) <= 20 for chunk in chunks)
+    # large ancestors are summed from their parts; the sum is the whole-node count
+    assert chunker._SummedSize(code, sizer, direct_limit=80)(node) == sizer(code)
+
+
+def test_token_sizer_does_not_memoise_long_texts(sizer):
+    sizer("$x " * 5000)
+    assert sizer.cache_info().currsize == 0
@@ -0,0 +1,74 @@
+import os
+import subprocess
+
+import pytest
+
+from app.core.repo_ingestion.clone import cache_path, clone_repo, remove_checkout, run_git
+
+
+def _git(cwd, *args):
+    subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True,
+    )
+
+
+def _checked_out(repo_path):
+    files = {
+        os.path.relpath(os.path.join(root, name), repo_path)
+        for root, _, names in os.walk(repo_path)
+        for name in names
+    }
+    return files - {".git"}
+
+
+@pytest.fixture
+def source_repo(tmp_path):
+    repo = tmp_path / "metta-lib"
+    (repo / "lib").mkdir(parents=True)
+    (repo / "lib" / "a.metta").write_text("(= (f) 1)\n")
+    (repo / "README.md").write_text("docs\n")
+    _git(repo, "init", "--quiet")
+    _git(repo, "add", ".")
+    _git(repo, "commit", "--quiet", "-m", "init")
+    # let the file:// "server" honour --filter=blob:none
+    _git(repo, "config", "uploadpack.allowFilter", "true")
+    return repo
+
+
+@pytest.mark.asyncio
+async def test_clone_checks_out_only_metta_files_and_reuses_cache(tmp_path, source_repo):
+    url = source_repo.as_uri()
+    temp_dir, cache_dir = str(tmp_path / "temp"), str(tmp_path / "cache")
+    progress = []
+
+    repo_path = await clone_repo(url, temp_dir, cache_dir, on_progress=lambda phase, pct: progress.append(phase))
+    assert os.path.basename(repo_path) == "metta-lib"
+    files = _checked_out(repo_path)
+    assert files == {os.path.join("lib", "a.metta")}
+    assert progress
+    await remove_checkout(repo_path)
+    assert not os.path.exists(os.path.dirname(repo_path))
+
+    (source_repo / "b.metta").write_text("(= (g) 2)\n")
+    _git(source_repo, "add", ".")
+    _git(source_repo, "commit", "--quiet", "-m", "more")
+
+    repo_path = await clone_repo(url, temp_dir, cache_dir)
+    try:
+        files = _checked_out(repo_path)
+        assert files == {os.path.join("lib", "a.metta"), "b.metta"}
+        # fetched into the same cache, which stays shallow
+        git_dir = cache_path(url, cache_dir)
+        assert os.listdir(cache_dir) == [os.path.basename(git_dir)]
+        assert (await run_git("--git-dir", git_dir, "rev-parse", "--is-shallow-repository")).strip() == "true"
+    finally:
+        await remove_checkout(repo_path)
+
+
+@pytest.mark.asyncio
+async def test_clone_failure_raises_and_cleans_up(tmp_path):
+    temp_dir = tmp_path / "temp"
+    with pytest.raises(subprocess.CalledProcessError):
+        await clone_repo((tmp_path / "missing").as_uri(), str(temp_dir), str(tmp_path / "cache"))
+    assert not temp_dir.exists()
@@ -0,0 +1,64 @@
+import errno
+import hashlib
+import os
+
+import pytest
+
+from app.core.repo_ingestion import file_store
+from app.core.repo_ingestion.file_store import ContentStore
+from app.core.repo_ingestion.filters import iter_metta_files, store_metta_files
+
+
+CODE = b"(= (f $x) (+ $x 1))\n"
+
+
+def test_put_links_once_and_skips_known_content(tmp_path):
+    store = ContentStore(str(tmp_path / "store"))
+    first, second = tmp_path / "a.metta", tmp_path / "b.metta"
+    first.write_bytes(CODE)
+    second.write_bytes(CODE)
+
+    file_hash, data, outcome = store.put(str(first))
+    assert (file_hash, data, outcome) == (hashlib.sha256(CODE).hexdigest(), CODE, "linked")
+    assert os.path.samefile(store.path(file_hash), first)
+
+    assert store.put(str(second))[2] == "present"
+    assert file_hash in store and os.listdir(store.root) == [f"{file_hash}.metta"]
+
+
+def test_put_writes_a_copy_when_linking_fails(tmp_path, monkeypatch):
+    def cross_device(src, dst):
+        raise OSError(errno.EXDEV, "Invalid cross-device link")
+
+    monkeypatch.setattr(file_store.os, "link", cross_device)
+    store = ContentStore(str(tmp_path / "store"))
+    src = tmp_path / "a.metta"
+    src.write_bytes(CODE)
+
+    file_hash, _, outcome = store.put(str(src))
+    assert outcome == "written"
+    assert not os.path.samefile(store.path(file_hash), src)
+    assert os.listdir(store.root) == [f"{file_hash}.metta"]
+
+
+@pytest.mark.asyncio
+async def test_store_metta_files_streams_and_orders_by_rel_path(tmp_path):
+    repo = tmp_path / "repo"
+    for i in range(40):
+        sub = repo / f"pkg{i % 4}" / ("deep" if i % 3 else "")
+        sub.mkdir(parents=True, exist_ok=True)
+        (sub / f"m{i}.metta").write_bytes(f"(= (f{i}) {i})\n".encode())
+        (sub / f"notes{i}.md").write_text("skip me")
+    (repo / ".git").mkdir()
+    (repo / ".git" / "hidden.metta").write_text("(= (no) 0)")
+
+    store = ContentStore(str(tmp_path / "data" / "store"))
+    streamed = [item async for item in iter_metta_files(str(repo), store, threads=3)]
+    assert len(streamed) == 40
+    assert all(hashlib.sha256(data).hexdigest() == file_hash for file_hash, _, data in streamed)
+
+    sources = {}
+    index = await store_metta_files(str(repo), store.root, sources=sources)
+    assert list(index.values()) == sorted(rel_path for _, rel_path, _ in streamed)
+    assert all(rel_path.startswith("repo/pkg") for rel_path in index.values())
+    assert sources.keys() == index.keys()
@@ -0,0 +1,221 @@
+import hashlib
+
+import numpy as np
+import pytest
+from qdrant_client.models import PointStruct
+
+from app.core.chunker import chunker
+from app.core.chunker.utils import _build_chunk_doc, chunk_rel_paths
+from app.core.chunker.sizing import char_size
+from app.core.repo_ingestion.incremental import (
+    chunk_settings,
+    diff_manifest,
+    incremental_ingest,
+    manifest_entries,
+    mentioned_atoms,
+    plan_rechunk,
+    related_files,
+)
+from app.db.db import LINK_FIELDS
+from app.rag.embedding.pipeline import PAYLOAD_KEYS, chunk_point_id
+from app.rag.retriever.vector_store import NumpyVectorStore
+
+
+MANIFEST = {
+    "repo/a.metta": {"hash": "ha", "chunkIds": ["c1"]},
+    "repo/lib/b.metta": {"hash": "hb", "chunkIds": ["c2", "c3"]},
+    "repo/c.metta": {"hash": "hc", "chunkIds": ["c3", "c4"]},
+    "repo/d.metta": {"hash": "hd", "chunkIds": ["c5"]},
+    "repo/e.metta": {"hash": "he", "chunkIds": ["c6"]},
+}
+
+
+def test_diff_manifest_classifies_files():
+    current = {"repo/a.metta": "ha", "repo/lib/b.metta": "hb2", "repo/c.metta": "hc",
+               "repo/e.metta": "he", "repo/new.metta": "hn"}
+    diff = diff_manifest(current, MANIFEST)
+
+    assert diff.added == ["repo/new.metta"]
+    assert diff.changed == ["repo/lib/b.metta"]
+    assert diff.removed == ["repo/d.metta"]
+    assert diff.unchanged == ["repo/a.metta", "repo/c.metta", "repo/e.metta"]
+
+
+def test_plan_rechunk_pulls_in_files_sharing_a_stale_chunk():
+    current = {"repo/a.metta": "ha", "repo/lib/b.metta": "hb2", "repo/c.metta": "hc",
+               "repo/e.metta": "he", "repo/new.metta": "hn"}
+    rechunk, stale = plan_rechunk(diff_manifest(current, MANIFEST), MANIFEST)
+
+    # c.metta is unchanged but shares chunk c3 with the changed b.metta
+    assert rechunk == {"repo/new.metta", "repo/lib/b.metta", "repo/c.metta"}
+    assert stale == {"c2", "c3", "c4", "c5"}
+
+
+def test_chunk_rel_paths_round_trips_build_chunk_doc():
+    rel_paths = ["repo/a.metta", "repo/lib/deep/b.metta"]
+    doc = _build_chunk_doc("(= (f) 1)", rel_paths)
+
+    assert chunk_rel_paths(doc) == rel_paths
+    entries = manifest_entries([doc], {path: "h" for path in rel_paths}, chunk_settings(1500, char_size, False))
+    assert {path: entry["chunkIds"] for path, entry in entries.items()} == {path: [doc["chunkId"]] for path in rel_paths}
+    assert entries[rel_paths[0]]["settings"] == {"max_size": 1500, "chunk_unit": "chars", "colocate_calls": False}
+
+
+def test_related_files_follow_shared_symbols_and_calls():
+    manifest = {
+        "repo/a.metta": {"hash": "ha", "chunkIds": ["c1"], "symbols": ["f"], "calls": ["g"]},
+        "repo/b.metta": {"hash": "hb", "chunkIds": ["c2"], "symbols": ["g"], "calls": []},
+        "repo/c.metta": {"hash": "hc", "chunkIds": ["c3"], "symbols": ["h"], "calls": ["f"]},
+        "repo/d.metta": {"hash": "hd", "chunkIds": ["c4"], "symbols": ["k"], "calls": []},
+        "repo/e.metta": {"hash": "he", "chunkIds": ["c5"], "symbols": ["old"], "calls": []},
+    }
+    # the changed a.metta now also adds an entry for k; it used to call `old`
+    manifest["repo/a.metta"]["calls"].append("old")
+    chunks = [_build_chunk_doc("(= (f) (g))", ["repo/a.metta"], symbols=["f", "k"], calls=["g"], called_by=[])]
+    candidates = ["repo/b.metta", "repo/c.metta", "repo/d.metta", "repo/e.metta"]
+
+    # b defines the callee g, c calls f, d also defines k, e defined the dropped callee
+    assert related_files(chunks, manifest, {"repo/a.metta"}, candidates) == set(candidates)
+    assert related_files([], manifest, set(), candidates) == set()
+
+
+def test_mentioned_atoms_find_calls_outside_the_rechunked_files():
+    manifest = {"repo/b.metta": {"hash": "hb", "chunkIds": ["c2"], "symbols": ["g"], "calls": []}}
+    # chunked alone, z's chunk lists no calls: g is not defined in the subset
+    chunks = [_build_chunk_doc("(= (z) (g 1))", ["repo/d.metta"], symbols=["z"], calls=[], called_by=[])]
+    mentioned = mentioned_atoms([b"(= (z) (g 1))"])
+
+    assert mentioned == {"=", "z", "g", "1"}
+    assert related_files(chunks, manifest, {"repo/d.metta"}, ["repo/b.metta"], mentioned) == {"repo/b.metta"}
+
+
+def test_plan_rechunk_treats_pulled_in_files_as_changed():
+    current = {"repo/a.metta": "ha", "repo/lib/b.metta": "hb", "repo/c.metta": "hc",
+               "repo/d.metta": "hd", "repo/e.metta": "he"}
+    rechunk, stale = plan_rechunk(diff_manifest(current, MANIFEST), MANIFEST, pulled_in={"repo/c.metta"})
+
+    # c.metta pulls in b.metta through the shared chunk c3
+    assert rechunk == {"repo/lib/b.metta", "repo/c.metta"}
+    assert stale == {"c2", "c3", "c4"}
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self._it = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeChunks:
+    """The chunks collection calls of insert_chunks and delete_chunks, over a dict by chunkId."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(self.docs[cid]) for cid in query["chunkId"]["$in"] if cid in self.docs])
+
+    async def insert_many(self, docs, ordered=True):
+        for doc in docs:
+            self.docs[doc["chunkId"]] = dict(doc)
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            self.docs[request._filter["chunkId"]].update(request._doc["$set"])
+
+    async def delete_many(self, query):
+        ids = [cid for cid in query["chunkId"]["$in"] if cid in self.docs]
+        for cid in ids:
+            del self.docs[cid]
+        return type("DeleteResult", (), {"deleted_count": len(ids)})()
+
+
+class FakeManifests:
+    """The file_manifests collection calls of get_file_manifest and write_file_manifest."""
+
+    def __init__(self):
+        self.docs = {}
+
+    def find(self, query, projection=None):
+        return FakeCursor([dict(doc) for doc in self.docs.values() if doc["repo"] == query["repo"]])
+
+    async def bulk_write(self, requests, ordered=True):
+        for request in requests:
+            kind, query = type(request).__name__, request._filter
+            if kind == "DeleteMany":
+                self.docs = {k: d for k, d in self.docs.items() if d["repo"] != query["repo"]}
+            elif kind == "DeleteOne":
+                self.docs.pop((query["repo"], query["path"]), None)
+            else:
+                doc = self.docs.setdefault((query["repo"], query["path"]), dict(query))
+                doc.update(request._doc["$set"])
+
+
+class FakeDB:
+    def __init__(self):
+        self.collections = {"chunks": FakeChunks(), "file_manifests": FakeManifests()}
+
+    def get_collection(self, name):
+        return self.collections[name]
+
+
+def _index(files):
+    hashes = {rel_path: hashlib.sha256(text.encode()).hexdigest()[:16] for rel_path, text in files.items()}
+    return ({h: rel_path for rel_path, h in hashes.items()},
+            {h: files[rel_path].encode() for rel_path, h in hashes.items()})
+
+
+def _links(chunks):
+    return sorted((c["chunk"], *(tuple(c.get(field) or ()) for field in LINK_FIELDS)) for c in chunks)
+
+
+async def _embed_pending(db, store):
+    for doc in db.collections["chunks"].docs.values():
+        if not doc["isEmbedded"]:
+            payload = {k: doc.get(k) for k in PAYLOAD_KEYS}
+            await store.upsert("chunks", [PointStruct(id=chunk_point_id(doc["chunkId"]), vector=[1.0, 0.0], payload=payload)])
+            doc["isEmbedded"] = True
+
+
+@pytest.mark.asyncio
+async def test_incremental_ingest_stores_what_a_full_ingest_builds():
+    files = {
+        "repo/a.metta": "(= (f $x) (g $x))\n(= (h) 2)",
+        "repo/b.metta": "(= (g $x) (+ $x 1))",
+        "repo/c.metta": "(= (k) 3)",
+        "repo/d.metta": "(= (z) 0)",
+        "repo/e.metta": "(= (w) 9)",
+    }
+    edits = [
+        ("repo/c.metta", "(= (k) 3)\n(: f (-> Number Number))"),  # a symbol entry in another file
+        ("repo/d.metta", "(= (z) (g 1))"),  # a new caller of an unchanged symbol
+        ("repo/a.metta", "(= (f $x) $x)\n(= (h) 2)"),  # a call removed
+        ("repo/b.metta", "(= (g $x) (k))"),
+    ]
+    db, store = FakeDB(), NumpyVectorStore(dim=2)
+    index, sources = _index(files)
+    await incremental_ingest(index, "repo", 1500, db, store, "chunks", sources=sources)
+    await _embed_pending(db, store)
+
+    for rel_path, text in edits:
+        files[rel_path] = text
+        index, sources = _index(files)
+        await incremental_ingest(index, "repo", 1500, db, store, "chunks", sources=sources)
+
+        full = await chunker.ast_based_chunker(index, None, 1500, store=False, sources=sources)
+        stored = db.collections["chunks"].docs.values()
+        assert _links(stored) == _links(full), rel_path
+        # embedded chunks whose links changed carry the new ones in their payload too
+        payloads = {p.id: p.payload for p in store.search_categories_sync([1.0, 0.0], [None], len(store))[None]}
+        for doc in stored:
+            if doc["isEmbedded"]:
+                payload = payloads[chunk_point_id(doc["chunkId"])]
+                assert [payload[field] for field in LINK_FIELDS] == [doc[field] for field in LINK_FIELDS]
+        await _embed_pending(db, store)
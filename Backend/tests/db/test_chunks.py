@@ -0,0 +1,82 @@
+import pytest
+from pymongo.errors import BulkWriteError
+
+from app.db.db import insert_chunks
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeChunksCollection:
+    """Just enough of an async collection to count round trips."""
+
+    def __init__(self, existing=(), racing=()):
+        self.ids = set(existing)
+        self.racing = set(racing)
+        self.finds = self.insert_manys = 0
+
+    def find(self, query, projection=None):
+        self.finds += 1
+        wanted = query["chunkId"]["$in"]
+        return FakeCursor([{"chunkId": cid} for cid in wanted if cid in self.ids])
+
+    async def insert_many(self, docs, ordered=True):
+        assert ordered is False
+        self.insert_manys += 1
+        errors = []
+        for i, doc in enumerate(docs):
+            if doc["chunkId"] in self.racing:
+                errors.append({"index": i, "code": 11000, "errmsg": "duplicate key"})
+            else:
+                self.ids.add(doc["chunkId"])
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+
+class FakeDB:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get_collection(self, name):
+        assert name == "chunks"
+        return self.collection
+
+
+def _chunk(i):
+    return {"chunkId": f"id-{i}", "source": "code", "chunk": f"(= (f{i}) {i})"}
+
+
+@pytest.mark.asyncio
+async def test_insert_chunks_batches_round_trips_and_counts_duplicates():
+    collection = FakeChunksCollection(existing={"id-3", "id-250"})
+    chunks = [_chunk(i) for i in range(1000)] + [_chunk(7), {"chunkId": "bad", "source": "nope"}]
+
+    result = await insert_chunks(chunks, FakeDB(collection), batch_size=400)
+
+    assert (collection.finds, collection.insert_manys) == (3, 3)
+    assert result["inserted"] == len(result["inserted_ids"]) == 998
+    assert result["duplicates"] == 3
+    assert result["invalid"] == 1
+    assert "id-3" not in result["inserted_ids"]
+
+
+@pytest.mark.asyncio
+async def test_insert_chunks_treats_unique_index_races_as_duplicates():
+    collection = FakeChunksCollection(racing={"id-1"})
+
+    result = await insert_chunks([_chunk(0), _chunk(1), _chunk(2)], FakeDB(collection))
+
+    assert result["inserted_ids"] == ["id-0", "id-2"]
+    assert result["duplicates"] == 1
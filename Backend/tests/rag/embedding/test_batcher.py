@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+
+from app.rag.embedding.batcher import EmbeddingBatcher, _size_bucket
+
+
+def make_model(delay=0.0):
+    model = MagicMock()
+
+    def encode(texts):
+        time.sleep(delay)
+        return np.array([[float(len(t))] for t in texts])
+
+    model.encode.side_effect = encode
+    return model
+
+
+@pytest.mark.asyncio
+async def test_concurrent_queries_share_one_encode():
+    model = make_model()
+    batcher = EmbeddingBatcher(model, max_batch=8, max_wait_ms=50)
+
+    results = await asyncio.gather(*(batcher.embed("q" * n) for n in (1, 2, 3, 2)))
+
+    assert results == [[1.0], [2.0], [3.0], [2.0]]
+    model.encode.assert_called_once_with(["q", "qq", "qqq"])
+    stats = batcher.stats()
+    assert stats["batches"] == 1 and stats["batch_sizes"] == {"3-4": 1}
+    assert stats["latency_ms"]["samples"] == 4
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_batches_are_capped_and_queue_during_an_encode():
+    model = make_model(delay=0.05)
+    batcher = EmbeddingBatcher(model, max_batch=4, max_wait_ms=1)
+
+    await asyncio.gather(*(batcher.embed(f"query {i}") for i in range(10)))
+
+    sizes = [len(call.args[0]) for call in model.encode.call_args_list]
+    assert sum(sizes) == 10 and max(sizes) == 4
+    await batcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_encode_error_reaches_every_caller():
+    model = MagicMock()
+    model.encode.side_effect = RuntimeError("boom")
+    batcher = EmbeddingBatcher(model, max_wait_ms=10)
+
+    results = await asyncio.gather(batcher.embed("a"), batcher.embed("b"), return_exceptions=True)
+
+    assert [str(r) for r in results] == ["boom", "boom"]
+    await batcher.stop()
+
+
+def test_size_buckets():
+    assert [_size_bucket(n) for n in (1, 2, 3, 4, 5, 8, 9, 32)] == ["1", "2", "3-4", "3-4", "5-8", "5-8", "9-16", "17-32"]
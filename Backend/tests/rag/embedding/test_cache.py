@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+from unittest.mock import MagicMock
+
+from app.rag.embedding.cache import CachedEmbeddingModel, EmbeddingCache, normalize_text
+from app.rag.retriever.retriever import EmbeddingRetriever
+
+
+def make_model():
+    model = MagicMock()
+    model.encode.side_effect = lambda texts: np.array([[len(t), t.count("x")] for t in texts], dtype=np.float32)
+    return model
+
+
+def test_only_texts_missing_from_the_cache_are_encoded(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    model = make_model()
+    cached = CachedEmbeddingModel(model, EmbeddingCache(path, "mini@2"))
+
+    first = cached.encode(["(= (f x) x)", "(g)", "(= (f x) x)"])
+    assert model.encode.call_args.args[0] == ["(= (f x) x)", "(g)"]
+    np.testing.assert_array_equal(first[0], first[2])
+
+    # same texts after a restart, one differing only in whitespace, one new
+    cached = CachedEmbeddingModel(model, EmbeddingCache(path, "mini@2"))
+    second = cached.encode(["(g)  \r\n", "(= (f x) x)", "(h x)"])
+    assert model.encode.call_args.args[0] == ["(h x)"]
+    np.testing.assert_array_equal(second[:2], first[[1, 0]])
+    assert cached.cache.hits == 2 and cached.cache.misses == 1
+    assert len(cached.cache) == 3
+
+
+def test_entries_are_kept_per_model(tmp_path):
+    path = str(tmp_path / "embeddings.sqlite3")
+    model = make_model()
+    CachedEmbeddingModel(model, EmbeddingCache(path, "mini@2")).encode(["(g)"])
+    CachedEmbeddingModel(model, EmbeddingCache(path, "other@2")).encode(["(g)"])
+    assert model.encode.call_count == 2
+
+
+def test_normalize_text_keeps_inner_structure():
+    assert normalize_text("  (a\r\n   (b))   \n\n") == "(a\n   (b))"
+
+
+@pytest.mark.asyncio
+async def test_query_embeddings_bypass_the_persistent_cache(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "embeddings.sqlite3"), "mini@2")
+    retriever = EmbeddingRetriever(CachedEmbeddingModel(make_model(), cache), qdrant=None, collection_name="chunks")
+    assert await retriever.embed_query("what is (f x)?") == [14.0, 1.0]
+    assert len(cache) == 0
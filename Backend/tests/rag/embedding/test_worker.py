@@ -0,0 +1,169 @@
+import asyncio
+
+import numpy as np
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+
+from app.rag.embedding import pipeline, worker as worker_module
+from app.rag.embedding.worker import AdaptiveBatchSize, EmbeddingWorker
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+        self.closed = False
+
+    async def to_list(self, length):
+        batch, self.docs = self.docs[:length], self.docs[length:]
+        return batch
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeChunks:
+    """In-memory stand-in for the chunks collection helpers the worker uses."""
+
+    def __init__(self, n):
+        self.docs = {
+            f"c{i}": {"_id": i, "chunkId": f"c{i}", "chunk": f"text {i}", "isEmbedded": False}
+            for i in range(n)
+        }
+        self.checkpoints = {}
+        self.cursors = []
+
+    def pending(self):
+        return [d for d in self.docs.values() if not d["isEmbedded"] and "embeddingSkipped" not in d]
+
+    def unembedded_chunks_cursor(self, after=None, exclude_chunk_ids=(), batch_size=100, mongo_db=None):
+        self.cursors.append(after)
+        docs = sorted(self.pending(), key=lambda d: d["_id"])
+        docs = [dict(d) for d in docs if (after is None or d["_id"] > after) and d.get("chunkId") not in exclude_chunk_ids]
+        return FakeCursor(docs)
+
+    async def mark_embedding_skipped(self, ids, reason, mongo_db=None):
+        for doc in self.docs.values():
+            if doc["_id"] in ids:
+                doc["embeddingSkipped"] = reason
+        return len(ids)
+
+    async def count_chunks(self, filter_query=None, mongo_db=None):
+        return len(self.pending())
+
+    async def update_embedding_status(self, chunk_ids, status, mongo_db=None):
+        for chunk_id in chunk_ids:
+            self.docs[chunk_id]["isEmbedded"] = status
+        return len(chunk_ids)
+
+    async def get_embedding_checkpoint(self, name, mongo_db=None):
+        return self.checkpoints.get(name)
+
+    async def save_embedding_checkpoint(self, name, last_id, mongo_db=None):
+        self.checkpoints[name] = last_id
+
+
+@pytest.fixture
+def chunks(monkeypatch):
+    fake = FakeChunks(23)
+    for name in ("unembedded_chunks_cursor", "count_chunks", "get_embedding_checkpoint", "save_embedding_checkpoint"):
+        monkeypatch.setattr(worker_module, name, getattr(fake, name))
+    monkeypatch.setattr(pipeline, "update_embedding_status", fake.update_embedding_status)
+    monkeypatch.setattr(pipeline, "mark_embedding_skipped", fake.mark_embedding_skipped)
+    return fake
+
+
+def make_model():
+    model = MagicMock()
+    model.encode.side_effect = lambda texts: np.zeros((len(texts), 4))
+    return model
+
+
+async def wait_for(condition, timeout=2.0):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not condition():
+        assert loop.time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_worker_embeds_every_pending_chunk_once(chunks):
+    qdrant = AsyncMock()
+    worker = EmbeddingWorker("code_chunks", None, make_model(), qdrant, batch_size=5, poll_interval=0.05)
+    worker.start()
+    await wait_for(lambda: worker.embedded == 23)
+
+    status = await worker.status()
+    await worker.stop()
+
+    upserted = [p.payload["original_chunkId"] for call in qdrant.upsert.await_args_list for p in call.kwargs["points"]]
+    assert sorted(upserted) == sorted(chunks.docs)
+    assert status["pending"] == 0 and status["embedded"] == 23 and status["batches"] == 5
+    assert not worker.running
+
+
+@pytest.mark.asyncio
+async def test_worker_survives_a_failing_batch_and_retries_it(chunks):
+    qdrant = AsyncMock()
+    qdrant.upsert.side_effect = [RuntimeError("qdrant down"), None, None, None, None, None, None]
+    worker = EmbeddingWorker("code_chunks", None, make_model(), qdrant, batch_size=10, poll_interval=0.01)
+    worker.start()
+    await wait_for(lambda: worker.embedded == 23)
+    await worker.stop()
+
+    assert worker.failed_batches == 1
+    assert worker.last_error == "qdrant down"
+    assert all(d["isEmbedded"] for d in chunks.docs.values())
+
+
+@pytest.mark.asyncio
+async def test_notify_wakes_an_idle_worker(chunks):
+    for doc in chunks.docs.values():
+        doc["isEmbedded"] = True
+    worker = EmbeddingWorker("code_chunks", None, make_model(), AsyncMock(), poll_interval=60)
+    worker.start()
+    await asyncio.sleep(0.05)
+
+    chunks.docs["c0"]["isEmbedded"] = False
+    worker.notify()
+    await wait_for(lambda: worker.embedded == 1)
+    await asyncio.wait_for(worker.stop(), timeout=1)
+
+
+@pytest.mark.asyncio
+async def test_run_until_empty_returns_and_skips_failed_batches(chunks):
+    model = make_model()
+    model.encode.side_effect = [RuntimeError("oom")] + [np.zeros((n, 4)) for n in (10, 3)]
+    worker = EmbeddingWorker("code_chunks", None, model, AsyncMock(), batch_size=10, target_encode_seconds=None)
+
+    assert await worker.run_until_empty() == 13
+    assert worker.failed_batches == 1
+    assert sum(not d["isEmbedded"] for d in chunks.docs.values()) == 10
+    assert not worker.running
+
+
+def test_adaptive_batch_size_moves_towards_target_encode_time():
+    size = AdaptiveBatchSize(50, target_seconds=1.0, maximum=512)
+    # 50 chunks in 0.1s: 500 would take 1s, but a step at most doubles
+    assert size.observe(50, 0.1) == 75
+    for _ in range(20):
+        size.observe(size.size, size.size / 500)
+    assert 480 <= size.size <= 512
+    # a slow model shrinks it again, never below the minimum
+    for _ in range(20):
+        size.observe(size.size, size.size * 10.0)
+    assert size.size == 8
+
+
+@pytest.mark.asyncio
+async def test_reader_skips_invalid_chunks_and_resumes_from_checkpoint(chunks):
+    chunks.docs["bad"] = {"_id": 5.5, "isEmbedded": False}
+    chunks.checkpoints["code_chunks"] = 9
+    worker = EmbeddingWorker("code_chunks", None, make_model(), AsyncMock(), batch_size=10, target_encode_seconds=None)
+
+    assert await worker.run_until_empty() == 23
+    # resumed after _id 9, then one pass from the start for the chunks behind it
+    assert chunks.cursors[:2] == [9, None]
+    assert chunks.docs["bad"]["embeddingSkipped"] == "missing chunk or chunkId"
+    assert chunks.checkpoints["code_chunks"] == 9
+    assert await chunks.count_chunks() == 0
@@ -0,0 +1,135 @@
+import pytest
+from qdrant_client.models import PointStruct
+
+from app.rag.embedding.pipeline import chunk_point_id
+from app.rag.retriever import lexical as lexical_module
+from app.rag.retriever.lexical import BM25Index, LexicalIndex, reciprocal_rank_fusion, tokenize
+from app.rag.retriever.retriever import EmbeddingRetriever
+from app.rag.retriever.vector_store import NumpyVectorStore
+
+
+def test_tokenize_keeps_identifiers_and_their_parts():
+    assert tokenize("!(assertEqual (get-type x) Number)") == [
+        "assertequal", "assert", "equal", "get-type", "get", "type", "x", "number",
+    ]
+
+
+def test_bm25_prefers_the_chunk_defining_a_symbol():
+    index = BM25Index()
+    index.add("def", "(= (fib $n) (+ (fib (- $n 1)) (fib (- $n 2))))", symbols=["fib"], payload={"source": "code"})
+    index.add("use", "!(assertEqual (fib 5) 5)", payload={"source": "code"})
+    index.add("doc", "Recursion in MeTTa, e.g. the fib function.", payload={"source": "documentation"})
+    index.add("other", "(= (fact $n) (* $n (fact (- $n 1))))", payload={"source": "code"})
+
+    assert [d for d, _ in index.search("fib", 10)] == ["def", "use", "doc"]
+    assert [d for d, _ in index.search("fib", 10, source="documentation")] == ["doc"]
+    assert index.search("unknownSymbol", 10) == []
+
+
+def test_bm25_remove_restores_the_collection_statistics():
+    index = BM25Index()
+    index.add("a", "(foo bar)")
+    before = index.search("foo", 5)
+    index.add("b", "(foo baz qux)")
+    index.add("a", "(foo bar)")  # re-adding replaces
+    index.remove("b")
+    assert index.search("foo", 5) == before
+    assert len(index) == 1 and "baz" not in index._postings
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+    assert [d for d, _ in fused] == ["c", "a", "b", "d"]
+
+
+class FakeCursor:
+    def __init__(self, docs):
+        self.docs = docs
+
+    def __aiter__(self):
+        self._it = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._it)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+@pytest.mark.asyncio
+async def test_sync_adds_new_chunks_and_drops_deleted_ones(monkeypatch):
+    chunks = [{"_id": i, "chunkId": f"c{i}", "chunk": f"(sym{i} x)", "source": "code"} for i in range(3)]
+    monkeypatch.setattr(lexical_module, "iter_chunks_after",
+                        lambda after, fields, db: FakeCursor([c for c in chunks if after is None or c["_id"] > after]))
+
+    async def chunk_ids(db):
+        return [c["chunkId"] for c in chunks]
+    monkeypatch.setattr(lexical_module, "get_chunk_ids", chunk_ids)
+
+    index = LexicalIndex(reconcile_every=2)
+    assert await index.sync(None) == 3
+    chunks.append({"_id": 3, "chunkId": "c3", "chunk": "(sym3 x)", "source": "code"})
+    del chunks[0]
+    assert await index.sync(None) == 1
+
+    assert len(index) == 3
+    assert chunk_point_id("c0") not in {d for d, _ in index.search("sym0", ["code"], 5)["code"]}
+    assert index.search("sym3", ["code"], 5)["code"][0][0] == chunk_point_id("c3")
+
+
+@pytest.mark.asyncio
+async def test_retriever_fuses_exact_symbol_hits_with_dense_results():
+    chunks = [
+        {"chunkId": "c0", "chunk": "(= (sum-list $xs) (foldl + 0 $xs))", "source": "code", "symbols": ["sum-list"]},
+        {"chunkId": "c1", "chunk": "(= (average $xs) (/ (sum $xs) (len $xs)))", "source": "code"},
+    ]
+    store = NumpyVectorStore(dim=2)
+    # only c1 is in the dense index; c0 holds the symbol asked for
+    await store.upsert("chunks", [
+        PointStruct(id=chunk_point_id("c1"), vector=[1.0, 0.0], payload={**chunks[1], "original_chunkId": "c1"}),
+    ])
+    lexical = LexicalIndex()
+    fillers = [{"chunkId": f"f{i}", "chunk": f"(= (other-{i}) {i})", "source": "code"} for i in range(3)]
+    for chunk in chunks + fillers:
+        lexical.add_chunk(chunk)
+
+    retriever = EmbeddingRetriever(model=None, qdrant=None, collection_name="chunks", store=store, lexical=lexical)
+
+    async def embed(query):
+        return [1.0, 0.0]
+    retriever.embed_query = embed
+
+    results = await retriever.retrieve("sum-list", top_k=2)
+    # c1 is first in the dense ranking and second in BM25 (it mentions `sum`); c0 only comes from BM25
+    assert [d.metadata["original_chunkId"] for d in results["code"]] == ["c1", "c0"]
+    c1, c0 = (d.metadata for d in results["code"])
+    assert c1["_dense_score"] == pytest.approx(1.0) and c1["_score"] > c0["_score"]
+    assert c0["_dense_score"] is None and c0["_lexical_score"] > c1["_lexical_score"]
+    assert results["code"][1].text == chunks[0]["chunk"]
+    assert results["documentation"] == []
+
+
+@pytest.mark.asyncio
+async def test_lexical_hits_below_min_score_in_the_dense_ranking_are_dropped():
+    chunks = [
+        {"chunkId": "c0", "chunk": "(= (sum-list $xs) (foldl + 0 $xs))", "source": "code", "symbols": ["sum-list"]},
+        {"chunkId": "c1", "chunk": "(= (average $xs) (/ (sum $xs) (len $xs)))", "source": "code"},
+    ]
+    store = NumpyVectorStore(dim=2)
+    await store.upsert("chunks", [
+        PointStruct(id=chunk_point_id("c0"), vector=[0.0, 1.0], payload={**chunks[0], "original_chunkId": "c0"}),
+        PointStruct(id=chunk_point_id("c1"), vector=[1.0, 0.0], payload={**chunks[1], "original_chunkId": "c1"}),
+    ])
+    lexical = LexicalIndex()
+    for chunk in chunks + [{"chunkId": f"f{i}", "chunk": f"(= (other-{i}) {i})", "source": "code"} for i in range(3)]:
+        lexical.add_chunk(chunk)
+    retriever = EmbeddingRetriever(model=None, qdrant=None, collection_name="chunks", store=store, lexical=lexical)
+
+    async def embed(query):
+        return [1.0, 0.0]
+    retriever.embed_query = embed
+
+    # c0 is the best BM25 hit but its dense similarity (0.0) is below min_score
+    results = await retriever.retrieve("sum-list", top_k=2, min_score=0.5)
+    assert [d.metadata["original_chunkId"] for d in results["code"]] == ["c1"]
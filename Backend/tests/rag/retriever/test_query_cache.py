@@ -0,0 +1,37 @@
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.rag.retriever.query_cache import QueryEmbeddingCache
+from app.rag.retriever.retriever import EmbeddingRetriever
+
+
+def test_lru_evicts_least_recently_used():
+    cache = QueryEmbeddingCache(max_size=2)
+    cache.put("a", [1.0])
+    cache.put("b", [2.0])
+    assert cache.get("a") == [1.0]
+    cache.put("c", [3.0])
+
+    assert cache.get("b") is None
+    assert cache.get("  a ") == [1.0]
+    assert cache.stats()["hits"] == 2 and cache.stats()["misses"] == 1
+
+
+def test_entries_expire_after_ttl():
+    cache = QueryEmbeddingCache(ttl=10)
+    with patch("app.rag.retriever.query_cache.time.monotonic", side_effect=[100.0, 105.0, 111.0]):
+        cache.put("q", [1.0])
+        assert cache.get("q") == [1.0]
+        assert cache.get("q") is None
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_skips_the_encoder():
+    cache = QueryEmbeddingCache()
+    embed = AsyncMock(return_value=[0.1, 0.2])
+    with patch("app.rag.retriever.retriever.embedding_user_input", embed):
+        for query in ("what is a space?", "what is  a space?\n"):
+            retriever = EmbeddingRetriever(model=object(), qdrant=AsyncMock(), collection_name="c", query_cache=cache)
+            assert await retriever.embed_query(query) == [0.1, 0.2]
+    embed.assert_awaited_once()
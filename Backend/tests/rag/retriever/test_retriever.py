@@ -0,0 +1,51 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+from qdrant_client.models import ScoredPoint
+
+from app.rag.retriever.retriever import EmbeddingRetriever
+
+
+def point(i, source, score):
+    return ScoredPoint(id=i, version=0, score=score, payload={"source": source, "chunk": f"text {i}"})
+
+
+def make_retriever(qdrant, **kwargs):
+    retriever = EmbeddingRetriever(model=None, qdrant=qdrant, collection_name="chunks", **kwargs)
+    retriever.embed_query = AsyncMock(return_value=[0.1, 0.2])
+    return retriever
+
+
+@pytest.mark.asyncio
+async def test_all_categories_are_fetched_in_one_request():
+    qdrant = AsyncMock()
+    qdrant.query_batch_points.return_value = [
+        SimpleNamespace(points=[point(1, "code", 0.9), point(2, "code", 0.1)]),
+        SimpleNamespace(points=[point(3, "documentation", 0.8)]),
+        SimpleNamespace(points=[]),
+    ]
+
+    results = await make_retriever(qdrant).retrieve("q", top_k=2, min_score=0.5)
+
+    qdrant.query_batch_points.assert_awaited_once()
+    qdrant.search.assert_not_called()
+    requests = qdrant.query_batch_points.await_args.kwargs["requests"]
+    assert [r.filter.must[0].match.value for r in requests] == ["code", "documentation", "others"]
+    assert all(r.limit == 2 for r in requests)
+    assert {k: [d.text for d in v] for k, v in results.items()} == {
+        "code": ["text 1"], "documentation": ["text 3"], "others": [],
+    }
+    assert results["code"][0].metadata["_score"] == 0.9
+
+
+@pytest.mark.asyncio
+async def test_falls_back_to_one_search_per_category():
+    qdrant = AsyncMock()
+    qdrant.query_batch_points.side_effect = RuntimeError("no query API")
+    qdrant.search.side_effect = lambda **kw: [point(1, kw["query_filter"]["must"][0]["match"]["value"], 0.7)]
+
+    results = await make_retriever(qdrant).retrieve("q")
+
+    assert qdrant.search.await_count == 3
+    assert [docs[0].metadata["source"] for docs in results.values()] == ["code", "documentation", "others"]
@@ -0,0 +1,140 @@
+import numpy as np
+import pytest
+from qdrant_client.models import PointIdsList, PointStruct
+
+from app.rag.retriever import vector_store
+from app.rag.retriever.retriever import EmbeddingRetriever
+from app.rag.retriever.vector_store import NumpyVectorStore
+
+SOURCES = ["code", "documentation", "others"]
+
+
+def random_points(n, dim=16, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    points = [
+        PointStruct(id=f"p{i}", vector=vectors[i].tolist(), payload={"source": SOURCES[i % 3], "chunk": f"text {i}"})
+        for i in range(n)
+    ]
+    return points, vectors
+
+
+def brute_force(vectors, query, rows, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = normed[rows] @ (query / np.linalg.norm(query))
+    return [f"p{rows[i]}" for i in np.argsort(-scores)[:k]]
+
+
+@pytest.mark.asyncio
+async def test_top_k_per_category_matches_brute_force():
+    points, vectors = random_points(200)
+    store = NumpyVectorStore(dim=16)
+    await store.upsert("chunks", points)
+    query = np.random.default_rng(1).normal(size=16)
+
+    results = await store.search_categories(query.tolist(), SOURCES, top_k=5)
+
+    for c, source in enumerate(SOURCES):
+        rows = np.arange(c, 200, 3)
+        assert [p.id for p in results[source]] == brute_force(vectors, query, rows, 5)
+        assert all(p.payload["source"] == source for p in results[source])
+    scores = [p.score for p in results["code"]]
+    assert scores == sorted(scores, reverse=True) and -1 <= scores[-1] <= scores[0] <= 1
+
+
+@pytest.mark.asyncio
+async def test_upsert_replaces_and_delete_removes():
+    points, _ = random_points(10)
+    store = NumpyVectorStore(dim=16)
+    await store.upsert("chunks", points)
+    await store.upsert("chunks", [PointStruct(id="p0", vector=[1.0] + [0.0] * 15, payload={"source": "others"})])
+    await store.delete("chunks", points_selector=PointIdsList(points=["p3", "missing"]))
+
+    assert len(store) == 9
+    hits = await store.search(query_vector=[1.0] + [0.0] * 15, limit=1, query_filter={"must": [{"key": "source", "match": {"value": "others"}}]})
+    assert hits[0].id == "p0" and hits[0].score == pytest.approx(1.0)
+    everything = store.search_categories_sync([1.0] * 16, [None], 20)[None]
+    assert sorted(p.id for p in everything) == sorted(f"p{i}" for i in range(10) if i != 3)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("quantize", [False, True])
+async def test_index_is_saved_and_reopened(tmp_path, quantize):
+    points, _ = random_points(50)
+    store = NumpyVectorStore(str(tmp_path), dim=16, quantize=quantize)
+    await store.upsert("chunks", points)
+    query = np.ones(16).tolist()
+    before = store.search_categories_sync(query, SOURCES, 4)
+    await store.close()
+
+    reopened = NumpyVectorStore(str(tmp_path), dim=16, quantize=quantize)
+    after = reopened.search_categories_sync(query, SOURCES, 4)
+    assert {s: [p.id for p in r] for s, r in after.items()} == {s: [p.id for p in r] for s, r in before.items()}
+
+    # reopened read-only from disk, still writable in memory
+    await reopened.delete("chunks", points_selector=["p0"])
+    assert len(reopened) == 49
+
+
+@pytest.mark.asyncio
+async def test_quantized_scores_stay_close_to_float():
+    points, _ = random_points(100)
+    exact, quantized = NumpyVectorStore(dim=16), NumpyVectorStore(dim=16, quantize=True)
+    await exact.upsert("chunks", points)
+    await quantized.upsert("chunks", points)
+    query = np.random.default_rng(2).normal(size=16).tolist()
+
+    a = {p.id: p.score for p in exact.search_categories_sync(query, [None], 100)[None]}
+    b = {p.id: p.score for p in quantized.search_categories_sync(query, [None], 100)[None]}
+    assert max(abs(a[i] - b[i]) for i in a) < 0.02
+
+
+@pytest.mark.asyncio
+async def test_retriever_uses_a_given_store():
+    points, vectors = random_points(30)
+    store = NumpyVectorStore(dim=16)
+    await store.upsert("chunks", points)
+    retriever = EmbeddingRetriever(model=None, qdrant=None, collection_name="chunks", store=store)
+
+    async def embed(query):
+        return vectors[4].tolist()
+    retriever.embed_query = embed
+
+    results = await retriever.retrieve("q", top_k=1)
+    assert results["documentation"][0].text == "text 4"
+    assert results["documentation"][0].metadata["_score"] == pytest.approx(1.0)
+
+
+@pytest.mark.asyncio
+async def test_interrupted_save_keeps_the_previous_version(tmp_path, monkeypatch):
+    points, _ = random_points(10)
+    store = NumpyVectorStore(str(tmp_path), dim=16)
+    await store.upsert("chunks", points)
+    await store.close()
+
+    # p0's hole is filled with the last row, then the save dies before points.json
+    await store.delete("chunks", points_selector=["p0"])
+    def disk_full(*args, **kwargs):
+        raise OSError("disk full")
+    monkeypatch.setattr(vector_store.json, "dumps", disk_full)
+    with pytest.raises(OSError):
+        await store.save_async()
+    monkeypatch.undo()
+
+    reopened = NumpyVectorStore(str(tmp_path), dim=16)
+    assert len(reopened) == 10
+    for point in points:
+        assert reopened.search_categories_sync(point.vector, [None], 1)[None][0].id == point.id
+
+
+@pytest.mark.asyncio
+async def test_load_rejects_files_with_different_row_counts(tmp_path):
+    points, _ = random_points(10)
+    store = NumpyVectorStore(str(tmp_path), dim=16)
+    await store.upsert("chunks", points)
+    await store.close()
+
+    version = tmp_path / (tmp_path / "CURRENT").read_text()
+    np.save(version / "vectors.npy", np.zeros((9, 16), dtype=np.float32))
+    with pytest.raises(ValueError, match="inconsistent"):
+        NumpyVectorStore(str(tmp_path), dim=16)